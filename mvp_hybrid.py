@@ -4,8 +4,31 @@ import json
 import csv
 import io
 import time
+import html
+import re
 from datetime import datetime
 
+def mark_matches(text, spans, open_mark, close_mark, escape=lambda piece: piece):
+    """Wrap each (start, end) match span of text in open_mark/close_mark"""
+    marked, cursor = "", 0
+    for start, end in sorted(spans or []):
+        if start < cursor:
+            continue
+        marked += escape(text[cursor:start]) + open_mark + escape(text[start:end]) + close_mark
+        cursor = end
+    return marked + escape(text[cursor:])
+
+def escape_markdown_html(piece):
+    """Quote text for st.markdown(unsafe_allow_html=True): HTML-escaped, and markdown /
+    Streamlit markup (* _ # ` [ ] $ : ...) backslash-escaped so it shows literally"""
+    return re.sub(r'([\\`*_{}\[\]()#+\-.!|~$:])', r'\\\1', html.escape(piece))
+
+def result_quote(r, open_mark="**", close_mark="**", escape=lambda piece: piece):
+    """Full quote when the server sent one (full_quote), else the snippet - matches marked"""
+    if r.get('exact_quote') is not None:
+        return mark_matches(r['exact_quote'], r.get('match_spans'), open_mark, close_mark, escape)
+    return mark_matches(r.get('snippet', ''), r.get('highlights'), open_mark, close_mark, escape)
+
 # Helper function for email formatting - EXACT COPY FROM ORIGINAL
 def format_results_for_email(results, search_query, search_type):
     """Format search results for email - reusing your existing report format"""
@@ -28,7 +51,7 @@ def format_results_for_email(results, search_query, search_type):
         email_body += f"Source: {r.get('source_file', 'Unknown')}\n"
         if r.get('score'):
             email_body += f"Relevance: {r.get('score'):.1f}/10\n"
-        email_body += f"\nQuote:\n{r.get('exact_quote', '')}\n"
+        email_body += f"\nQuote:\n{result_quote(r)}\n"
         email_body += "-"*50 + "\n"
     
     return email_body
@@ -595,7 +618,7 @@ if colab_url:
     
     upload_col, search_col = st.columns([1, 2])
     
-    # UPLOAD SECTION - PRESERVED WITH 360 SECOND TIMEOUT
+    # UPLOAD SECTION - BACKEND QUEUES THE FILE, WE POLL THE JOB
     with upload_col:
         st.markdown('<div class="panel">', unsafe_allow_html=True)
         st.subheader("Upload Transcript")
@@ -607,34 +630,68 @@ if colab_url:
         
         if st.button("PROCESS TRANSCRIPT", use_container_width=True, disabled=not uploaded_file):
             if uploaded_file:
-                with st.spinner(f"Processing {uploaded_file.name}... (This may take several minutes)"):
-                    try:
-                        files = {'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+                try:
+                    files = {'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+                    
+                    response = requests.post(
+                        f"{colab_url}/upload-transcript",
+                        files=files,
+                        headers={"X-API-Key": "tie_smartco1_demo123"},
+                        timeout=60  # Only the upload itself - processing runs in the background
+                    )
+                    
+                    if response.status_code == 202:
+                        job_id = response.json()['job_id']
+                        progress_text = st.empty()
+                        progress_bar = st.progress(0)
+                        job = {}
                         
-                        response = requests.post(
-                            f"{colab_url}/upload-transcript",
-                            files=files,
-                            headers={"X-API-Key": "tie_smartco1_demo123"},
-                            timeout=360  # 360 SECONDS = 6 MINUTES - PRESERVED
-                        )
+                        # Poll job status until the backend finishes (max 30 minutes)
+                        for _ in range(900):
+                            job = requests.get(
+                                f"{colab_url}/ingest-jobs/{job_id}",
+                                headers={"X-API-Key": "tie_smartco1_demo123"},
+                                timeout=10
+                            ).json()
+                            
+                            stages = job.get('stages', {})
+                            parsed = stages.get('parse', {}).get('statements', 0)
+                            stored = stages.get('store', {}).get('statements', 0)
+                            rate = stages.get('store', {}).get('statements_per_sec', 0)
+                            
+                            if job.get('status') == 'queued':
+                                progress_text.info(f"Queued {uploaded_file.name} (position {job.get('queue_position', 0)})")
+                            elif job.get('status') == 'running':
+                                progress_text.info(f"Processing {uploaded_file.name}: {stored}/{parsed} statements stored ({rate}/s)")
+                                if parsed:
+                                    progress_bar.progress(min(stored / parsed, 1.0))
+                            else:
+                                break
+                            time.sleep(2)
                         
-                        if response.status_code == 200:
-                            result = response.json()
-                            st.success(f"{result.get('message', 'Upload successful')}")
+                        if job.get('status') == 'completed':
+                            progress_bar.progress(1.0)
+                            progress_text.success(f"Transcript {uploaded_file.name} processed successfully")
                             st.info("Transcript is now searchable!")
                             st.rerun()
+                        elif job.get('status') == 'failed':
+                            progress_text.error(f"Processing failed: {job.get('error', 'Unknown error')}")
+                        elif job.get('status') == 'busy':
+                            progress_text.warning(f"Not ingested: {job.get('error', 'this file is already being processed')}")
                         else:
-                            st.error(f"Upload failed: {response.status_code}")
-                            try:
-                                error_data = response.json()
-                                st.error(f"Error: {error_data.get('error', 'Unknown error')}")
-                            except:
-                                st.error(f"Response: {response.text[:200]}")
-                                
-                    except requests.exceptions.Timeout:
-                        st.error("Upload timed out after 6 minutes - file may be too large or backend is busy")
-                    except Exception as e:
-                        st.error(f"Error: {str(e)}")
+                            progress_text.warning("Still processing - check back in a few minutes")
+                    else:
+                        st.error(f"Upload failed: {response.status_code}")
+                        try:
+                            error_data = response.json()
+                            st.error(f"Error: {error_data.get('error', 'Unknown error')}")
+                        except:
+                            st.error(f"Response: {response.text[:200]}")
+                            
+                except requests.exceptions.Timeout:
+                    st.error("Upload timed out - backend may be busy")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
         st.markdown('</div>', unsafe_allow_html=True)
     
     # SEARCH SECTION - PRESERVED FROM ORIGINAL
@@ -644,8 +701,19 @@ if colab_url:
         
         search_type = st.radio(
             "Search Method",
-            ["Keyword Search", "Semantic Search (AI)"],
-            help="Keyword: Exact matching | Semantic: AI understands meaning"
+            ["Keyword Search", "Semantic Search (AI)", "Hybrid Search"],
+            help="Keyword: Exact matching | Semantic: AI understands meaning | Hybrid: both, merged into one ranking"
+        )
+        full_quotes = st.checkbox(
+            "Include full quotes",
+            value=False,
+            help="Off: results show a snippet around the matches (faster). On: whole statements, also used in downloads and email"
+        )
+        query_syntax = st.checkbox(
+            "Query syntax",
+            value=False,
+            help="Keyword search: treat AND / OR / NOT, -word, truck* and ( ) as operators. "
+                 "\"Quoted phrases\", NEAR/5, speaker: and after:/before: always work"
         )
         
         # Get transcript list - PRESERVED FROM ORIGINAL
@@ -739,18 +807,24 @@ if colab_url:
         search_query = st.text_input(
             "Search Query",
             placeholder="Enter your search terms...",
-            help="Try: 'drug task force', 'Tammy', 'Oklahoma'"
+            help="Try: 'drug task force', 'Tammy', 'Oklahoma'. Keyword search also takes \"exact phrases\", "
+                 "gun NEAR/5 truck, speaker:jesse, after:00:10:00 before:01:00:00 - and with Query syntax on, "
+                 "AND / OR / NOT (or -word), truck*, ( )"
         )
         
         if st.button("SEARCH", use_container_width=True):
             if search_query:
                 with st.spinner("Searching..."):
-                    endpoint = "/api/v2/semantic-search" if search_type == "Semantic Search (AI)" else "/api/v2/keyword-search"
+                    endpoint = {
+                        "Semantic Search (AI)": "/api/v2/semantic-search",
+                        "Hybrid Search": "/api/v2/hybrid-search"
+                    }.get(search_type, "/api/v2/keyword-search")
                     
                     try:
                         response = requests.post(
                             f"{colab_url}{endpoint}",
-                            json={"query": search_query, "transcript_id": transcript_id},
+                            json={"query": search_query, "transcript_id": transcript_id, "full_quote": full_quotes,
+                                  "syntax": True if query_syntax else None},
                             headers={"X-API-Key": "tie_smartco1_demo123"},
                             timeout=30
                         )
@@ -771,16 +845,26 @@ if colab_url:
                                     
                                     if search_type == "Semantic Search (AI)" and score > 0:
                                         header = f"{i}. {speaker} [{time_code}] - Relevance: {score:.1f}/10"
+                                    elif search_type == "Hybrid Search":
+                                        matched_by = [name for name, rank in (("keyword", r.get('bm25_rank')), ("AI", r.get('vector_rank'))) if rank]
+                                        header = f"{i}. {speaker} [{time_code}] - {' + '.join(matched_by)}"
                                     else:
                                         header = f"{i}. {speaker} [{time_code}]"
                                     
                                     with st.expander(header):
-                                        st.write(f"**Quote:** {r.get('exact_quote', '')}")
+                                        st.markdown(
+                                            f"**Quote:** {result_quote(r, '<mark>', '</mark>', escape_markdown_html)}",
+                                            unsafe_allow_html=True
+                                        )
                                         st.write(f"**Time:** {time_code}")
                                         st.write(f"**Speaker:** {speaker}")
                                         st.write(f"**Source:** {source}")
                                         if score > 0:
                                             st.write(f"**Relevance Score:** {score:.1f}/10")
+                                        if search_type == "Hybrid Search":
+                                            bm25 = f"#{r['bm25_rank']} ({r['bm25_score']:.2f})" if r.get('bm25_rank') else "-"
+                                            vector = f"#{r['vector_rank']} ({r['similarity']:.2f})" if r.get('vector_rank') else "-"
+                                            st.caption(f"Fused: {r.get('rrf_score', 0):.4f} | Keyword (BM25): {bm25} | AI (vector): {vector}")
                                 
                                 # DOWNLOAD RESULTS - PRESERVED FROM ORIGINAL
                                 if results:
@@ -804,7 +888,7 @@ if colab_url:
                                                 i,
                                                 r.get('speaker', ''),
                                                 r.get('time_code', ''),
-                                                r.get('exact_quote', ''),
+                                                r.get('exact_quote') or r.get('snippet', ''),
                                                 r.get('source_file', ''),
                                                 f"{r.get('score', 0):.1f}" if r.get('score') else 'N/A'
                                             ])
@@ -838,7 +922,7 @@ if colab_url:
                                             report += f"Source: {r.get('source_file', 'Unknown')}\n"
                                             if r.get('score'):
                                                 report += f"Relevance: {r.get('score'):.1f}/10\n"
-                                            report += f"\nQuote:\n{r.get('exact_quote', '')}\n"
+                                            report += f"\nQuote:\n{result_quote(r)}\n"
                                             report += "-"*50 + "\n"
                                         
                                         st.download_button(
@@ -62,17 +62,9 @@ CACHE_THESE_TERMS = [
 def cache_search_embeddings():
     for term in CACHE_THESE_TERMS:
         print(f"Caching: {term}")
-        # Create embedding
-        embedding = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=term
-        ).data[0].embedding
-
-        # Store in Supabase
-        supabase.table('cached_embeddings').upsert({
-            'query': term,
-            'embedding': embedding
-        }).execute()
+        # Normalized like search queries, so semantic search reads these back
+        normalized = normalize_query(term)
+        _store_query_embedding(normalized, embedding_service.embed_one(normalized))
 
     print("✅ Cache ready!")
 
@@ -120,11 +112,10 @@ print("✅ SMTP credentials configured!")
 # ALL 7 AI FEATURES WITH MAXIMUM SOPHISTICATION
 # ========================================
 
-import os, io, requests, time, traceback, re, json
+import os, io, requests, time, traceback, re, json, itertools
 from openai import OpenAI
 from supabase import create_client
 from PyPDF2 import PdfReader
-from docx import Document
 from bs4 import BeautifulSoup
 from typing import List, Dict
 import spacy
@@ -163,32 +154,32 @@ nlp = initialize_nlp()
 # ========================================
 # TEXT EXTRACTION (FROM OLD - KEEP AS IS)
 # ========================================
-def extract_text(byts: bytes) -> str:
-    """Extract text from PDF, DOCX, or HTML"""
+def extract_text(byts: bytes, filename: str = None, tables: bool = True) -> str:
+    """Extract text from PDF, DOCX, TXT (when filename says so) or HTML
+
+    Transcript parsing passes tables=False: DOCX table cells would come back
+    as lines of their own and parse as fake statements.
+    """
     if byts.startswith(b"%PDF"):
         try:
-            pages = PdfReader(io.BytesIO(byts)).pages
-            return "\n".join(p.extract_text() or "" for p in pages)
+            return "\n".join(extract_pdf_pages(byts))
         except Exception as e:
             print(f"PDF extraction failed: {e}")
             return ""
 
     if byts.startswith(b"PK"):
         try:
-            doc = Document(io.BytesIO(byts))
-            text_parts = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text_parts.append(paragraph.text.strip())
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text_parts.append(cell.text.strip())
+            # Paragraphs (and table cells if asked) - streamed from the XML (see iter_docx_text)
+            text_parts = [text.strip() for text in iter_docx_text(io.BytesIO(byts), tables=tables) if text.strip()]
             return "\n".join(text_parts)
         except Exception as e:
             print(f"DOCX extraction failed: {e}")
 
+    # Plain text transcripts keep their line breaks (the HTML path would flatten them);
+    # CRLF / CR endings become \n like a text-mode file read, so no line keeps a '\r'
+    if filename and filename.lower().endswith('.txt'):
+        return byts.decode("utf-8", errors="replace").replace('\r\n', '\n').replace('\r', '\n')
+
     try:
         html = byts.decode("utf-8", errors="ignore")
         return BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
@@ -196,6 +187,371 @@ def extract_text(byts: bytes) -> str:
         print(f"HTML extraction failed: {e}")
         return ""
 
+# ========================================
+# PROCESS POOLS (FORKSERVER / SPAWN WORKERS)
+# Worker processes are never forked from this runtime - by the time work
+# arrives it is running Flask, ingest jobs and the embedding threads, and
+# a fork taken while one of them holds a lock can deadlock the child.
+# A fresh worker doesn't have the notebook's functions, so it starts by
+# running just the definitions its tasks need (see notebook_definitions) -
+# no cells that connect, query or start servers.
+# ========================================
+import ast
+import multiprocessing
+import symtable
+from concurrent.futures import ProcessPoolExecutor
+
+NOTEBOOK_SOURCE_PATH = os.getenv('NOTEBOOK_SOURCE_PATH', '')   # Exported .py, when not running in a notebook
+
+WORKER_ENTRY_POINTS = ('parse_transcript_for_ingest', '_extract_pdf_page_range')   # Functions submitted to pools
+
+# Runs in each worker: exec the definitions into __main__, reporting (not hiding) any that fail
+WORKER_BOOTSTRAP = """
+import os, sys
+namespace = __import__('__main__').__dict__
+for name, definition in DEFINITIONS:
+    try:
+        exec(compile(definition, '<notebook:' + name + '>', 'exec'), namespace)
+    except Exception as e:
+        print(f"⚠️ Worker {os.getpid()} could not load {name}: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+"""
+
+def _notebook_sources() -> List[str]:
+    """This notebook's code: the executed cells (IPython), else the exported .py"""
+    cells = globals().get('In')
+    if cells:
+        return [cell for cell in cells if cell]
+    for path in (NOTEBOOK_SOURCE_PATH, globals().get('__file__')):
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return [f.read()]
+    return []
+
+def _global_reads(source: str) -> set:
+    """Module-level names a top-level definition reads (symbol tables, so locals don't count)"""
+    names = set()
+    tables = [symtable.symtable(source, '<definition>', 'exec')]
+    while tables:
+        table = tables.pop()
+        top_level = table.get_type() == 'module'
+        names.update(symbol.get_name() for symbol in table.get_symbols()
+                     if symbol.is_referenced() and (top_level or symbol.is_global()))
+        tables.extend(table.get_children())
+    return names
+
+def notebook_definitions(state=()) -> List[tuple]:
+    """
+    (name, source) of the top-level definitions a pool worker needs: the
+    imports, functions, classes and assignments WORKER_ENTRY_POINTS (plus
+    `state`, lowercase globals to build too, e.g. ('nlp',)) read, directly
+    or indirectly. The last definition of a name wins, as in the notebook,
+    so re-run and scratch cells aren't shipped; nothing else - connections,
+    keys, servers - is run in a worker.
+    """
+    latest = {}   # name -> (import first, position, source, names it reads)
+    position = 0
+    for source in _notebook_sources():
+        try:
+            tree = ast.parse(re.sub(r'^(\s*)[!%]', r'\1# ', source, flags=re.M))
+        except SyntaxError:
+            continue
+        for node in tree.body:
+            position += 1
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                # One per name, so a package missing in the worker doesn't take the others with it
+                for alias in node.names:
+                    single = ast.Import(names=[alias]) if isinstance(node, ast.Import) else \
+                        ast.ImportFrom(module=node.module, names=[alias], level=node.level)
+                    bound = alias.asname or alias.name.split('.')[0]
+                    latest[bound] = (0, position, ast.unparse(single), set())   # Imports go first
+            elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                source_text = ast.unparse(node)
+                latest[node.name] = (1, position, source_text, _global_reads(source_text))
+            elif isinstance(node, ast.Assign) and all(isinstance(target, ast.Name) for target in node.targets):
+                source_text = ast.unparse(node)
+                for target in node.targets:
+                    latest[target.id] = (1, position, source_text, _global_reads(source_text) - {target.id})
+
+    needed, pending = set(), list(WORKER_ENTRY_POINTS) + list(state)
+    while pending:
+        name = pending.pop()
+        if name in latest and name not in needed:
+            needed.add(name)
+            pending.extend(latest[name][3])
+
+    chosen = {}
+    for name in needed:
+        chosen.setdefault(latest[name][:3], name)   # a = b = ... runs once
+    return [(name, source) for (_, _, source), name in sorted(chosen.items())]
+
+def worker_pool(max_workers: int, state=()):
+    """Process pool whose workers start from this notebook's definitions; None in a worker or if they can't be found"""
+    if max_workers < 2 or in_worker_process():
+        return None
+    definitions = notebook_definitions(state)
+    if not definitions:
+        return None
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method),
+                               initializer=exec, initargs=(WORKER_BOOTSTRAP, {'DEFINITIONS': definitions}))
+
+def in_worker_process() -> bool:
+    """True inside a pool worker - which must not start pools of its own"""
+    return multiprocessing.parent_process() is not None
+
+# ========================================
+# PDF EXTRACTION (PAGE-PARALLEL + PAGE CACHE)
+# Pages are extracted on one long-lived worker pool and streamed back in
+# order; every page is cached on disk under the PDF's content hash.
+# Least recently used documents are evicted past PDF_PAGE_CACHE_MAX_MB.
+# ========================================
+import hashlib
+import shutil
+import threading
+
+PDF_EXTRACT_PROCESSES = int(os.getenv('PDF_EXTRACT_PROCESSES', str(os.cpu_count() or 2)))
+PDF_PAGES_PER_TASK = 16          # Pages per worker task
+PDF_PARALLEL_MIN_PAGES = 32      # Smaller jobs are extracted in-process
+PDF_PAGE_CACHE_DIR = os.getenv('PDF_PAGE_CACHE_DIR', '/content/pdf_page_cache')
+PDF_PAGE_CACHE_MAX_BYTES = int(os.getenv('PDF_PAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+_pdf_worker_reader = None        # Worker side: (path, PdfReader) of the last document
+
+def _extract_pdf_page_range(pdf_path: str, page_numbers: List[int]) -> List[str]:
+    """Worker task: text of some pages, parsing the PDF once per document"""
+    global _pdf_worker_reader
+    if _pdf_worker_reader is None or _pdf_worker_reader[0] != pdf_path:
+        _pdf_worker_reader = (pdf_path, PdfReader(pdf_path))
+    reader = _pdf_worker_reader[1]
+    return [reader.pages[n].extract_text() or "" for n in page_numbers]
+
+def _write_cache_file(path: str, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    mode, kwargs = ('wb', {}) if isinstance(data, bytes) else ('w', {'encoding': 'utf-8'})
+    with open(tmp_path, mode, **kwargs) as f:
+        f.write(data)
+    os.replace(tmp_path, path)  # Atomic - a crash never leaves half a file in the cache
+
+_pdf_cache_lock = threading.Lock()
+_pdf_cache_in_use = Counter()    # Document dirs being read or written right now - never evicted
+
+def _trim_pdf_page_cache(cache_dir: str, max_bytes: int = PDF_PAGE_CACHE_MAX_BYTES):
+    """Delete least recently used documents until the cache fits in max_bytes"""
+    documents = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir():
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                documents.append((os.stat(os.path.join(entry.path, 'meta.json')).st_mtime, size, entry.path))
+            except OSError:
+                continue
+    total = sum(size for _, size, _ in documents)
+    with _pdf_cache_lock:
+        for _, size, path in sorted(documents):
+            if total <= max_bytes:
+                break
+            if not _pdf_cache_in_use[path]:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+def extract_pdf_pages(byts: bytes, processes: int = PDF_EXTRACT_PROCESSES, cache_dir: str = PDF_PAGE_CACHE_DIR):
+    """
+    Yield the text of every PDF page, in page order.
+    Cached pages are read from disk; missing pages are extracted on the
+    worker pool (or in-process for short documents, and inside workers)
+    and cached as they arrive.
+    """
+    doc_dir = os.path.join(cache_dir, hashlib.sha256(byts).hexdigest())
+    with _pdf_cache_lock:
+        _pdf_cache_in_use[doc_dir] += 1
+    try:
+        yield from _extract_pdf_pages_cached(byts, doc_dir, processes)
+    finally:
+        with _pdf_cache_lock:
+            _pdf_cache_in_use[doc_dir] -= 1
+            if not _pdf_cache_in_use[doc_dir]:
+                del _pdf_cache_in_use[doc_dir]
+
+def _extract_pdf_pages_cached(byts: bytes, doc_dir: str, processes: int):
+    os.makedirs(doc_dir, exist_ok=True)
+    meta_path = os.path.join(doc_dir, 'meta.json')
+
+    reader = None
+    try:
+        with open(meta_path, 'r') as f:
+            num_pages = json.load(f)['pages']
+        os.utime(meta_path)   # Recently used - evicted last
+    except (OSError, ValueError, KeyError):
+        reader = PdfReader(io.BytesIO(byts))
+        num_pages = len(reader.pages)
+        _write_cache_file(meta_path, json.dumps({'pages': num_pages}))
+
+    page_path = lambda n: os.path.join(doc_dir, f"{n:05d}.txt")
+    missing = [n for n in range(num_pages) if not os.path.exists(page_path(n))]
+
+    pending = {}   # page number -> future holding its range
+    pool = None
+    if len(missing) >= PDF_PARALLEL_MIN_PAGES and processes > 1:
+        pool = get_pdf_extract_pool()
+    if pool is not None:
+        # Workers open the PDF from the cache dir instead of receiving the bytes with every task
+        pdf_path = os.path.join(doc_dir, 'source.pdf')
+        if not os.path.exists(pdf_path):
+            _write_cache_file(pdf_path, byts)
+        for start in range(0, len(missing), PDF_PAGES_PER_TASK):
+            chunk = missing[start:start + PDF_PAGES_PER_TASK]
+            future = pool.submit(_extract_pdf_page_range, pdf_path, chunk)
+            for n in chunk:
+                pending[n] = (future, chunk)
+
+    try:
+        for n in range(num_pages):
+            path = page_path(n)
+            text = None
+            if n in pending:
+                future, chunk = pending.pop(n)
+                try:
+                    text = future.result()[chunk.index(n)]
+                except Exception as e:
+                    print(f"⚠️ PDF worker failed ({e}) - extracting page {n + 1} in-process")
+            if text is None and n in missing:
+                if reader is None:
+                    reader = PdfReader(io.BytesIO(byts))
+                text = reader.pages[n].extract_text() or ""
+            if n in missing:
+                _write_cache_file(path, text)
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            yield text
+    finally:
+        for future, _ in pending.values():
+            future.cancel()
+        if missing:
+            _trim_pdf_page_cache(os.path.dirname(doc_dir))
+
+# One pool for every PDF, started by the first PDF big enough to need it
+pdf_extract_pool = None
+_pdf_extract_pool_started = False
+_pdf_extract_pool_lock = threading.Lock()
+
+def get_pdf_extract_pool():
+    """The shared PDF extraction pool (created on first use); None inside a worker or if it can't start"""
+    global pdf_extract_pool, _pdf_extract_pool_started
+    if _pdf_extract_pool_started or in_worker_process():
+        return pdf_extract_pool
+    with _pdf_extract_pool_lock:
+        if not _pdf_extract_pool_started:
+            pdf_extract_pool = worker_pool(PDF_EXTRACT_PROCESSES)
+            _pdf_extract_pool_started = True
+    return pdf_extract_pool
+
+# ========================================
+# DOCX EXTRACTION (STREAMING XML READER)
+# Reads the main document part with an incremental parser - same text as
+# python-docx paragraph.text / cell.text without building a Document
+# ========================================
+import zipfile
+import xml.etree.ElementTree as ET
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def _docx_main_part(zf) -> str:
+    """Name of the main document part (word/document.xml unless the package says otherwise)"""
+    try:
+        for rel in ET.fromstring(zf.read('_rels/.rels')):
+            if rel.get('Type', '').endswith('/officeDocument'):
+                return rel.get('Target').lstrip('/')
+    except KeyError:
+        pass
+    return 'word/document.xml'
+
+def _docx_run_text(r) -> str:
+    """w:r -> text, translating tabs/breaks the way python-docx Run.text does"""
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == _W + 't':
+            parts.append(child.text or '')
+        elif tag == _W + 'tab' or tag == _W + 'ptab':
+            parts.append('\t')
+        elif tag == _W + 'br':
+            # Line breaks become newlines; page/column breaks add nothing
+            parts.append('\n' if child.get(_W + 'type', 'textWrapping') == 'textWrapping' else '')
+        elif tag == _W + 'cr':
+            parts.append('\n')
+        elif tag == _W + 'noBreakHyphen':
+            parts.append('-')
+    return ''.join(parts)
+
+def _docx_paragraph_text(p) -> str:
+    """w:p -> text of its runs and hyperlinked runs (python-docx Paragraph.text)"""
+    parts = []
+    for child in p:
+        if child.tag == _W + 'r':
+            parts.append(_docx_run_text(child))
+        elif child.tag == _W + 'hyperlink':
+            parts.extend(_docx_run_text(r) for r in child if r.tag == _W + 'r')
+    return ''.join(parts)
+
+def _docx_table_cell_texts(tbl) -> List[str]:
+    """
+    cell.text for each entry of row.cells, row by row: a horizontally spanned
+    cell repeats once per grid column, a vMerge continuation repeats the cell above
+    """
+    texts = []
+    row_above = {}   # grid offset -> (content tc, span) in the previous row
+    for tr in tbl.findall(_W + 'tr'):
+        row = {}
+        grid_before = tr.find(f'{_W}trPr/{_W}gridBefore')
+        offset = int(grid_before.get(_W + 'val')) if grid_before is not None else 0
+
+        for tc in tr.findall(_W + 'tc'):
+            grid_span = tc.find(f'{_W}tcPr/{_W}gridSpan')
+            span = int(grid_span.get(_W + 'val')) if grid_span is not None else 1
+            v_merge = tc.find(f'{_W}tcPr/{_W}vMerge')
+
+            content = (tc, span)
+            if v_merge is not None and v_merge.get(_W + 'val', 'continue') == 'continue' and offset in row_above:
+                content = row_above[offset]
+            row[offset] = content
+
+            content_tc, content_span = content
+            cell_text = '\n'.join(_docx_paragraph_text(p) for p in content_tc.findall(_W + 'p'))
+            texts.extend([cell_text] * content_span)
+            offset += span
+
+        row_above = row
+    return texts
+
+def iter_docx_text(source, tables: bool = False):
+    """
+    Stream the text of every body paragraph of a .docx (path or file object),
+    identical to [p.text for p in Document(source).paragraphs].
+    Only one top-level block is held in memory at a time. With tables=True the
+    cell texts of every body table follow, in the order extract_text reads them.
+    """
+    table_texts = []
+    with zipfile.ZipFile(source) as zf, zf.open(_docx_main_part(zf)) as xml_file:
+        body = None
+        body_depth = depth = 0
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if body is None and elem.tag == _W + 'body':
+                    body, body_depth = elem, depth
+                continue
+
+            if body is not None and depth == body_depth + 1:
+                if elem.tag == _W + 'p':
+                    yield _docx_paragraph_text(elem)
+                elif tables and elem.tag == _W + 'tbl':
+                    table_texts.extend(_docx_table_cell_texts(elem))
+                body.remove(elem)  # Done with this block - drop it from the tree
+            depth -= 1
+
+    yield from table_texts
+
 def drive_download(fid: str) -> bytes:
     """Download file from Google Drive or Supabase storage"""
     if "/" not in fid and len(fid) < 40:
@@ -210,8 +566,204 @@ def drive_download(fid: str) -> bytes:
 # ========================================
 # SPEAKER EXTRACTION (FROM OLD - KEEP)
 # ========================================
-def extract_speaker_statements(text: str, filename: str = "") -> List[Dict]:
-    """UNIVERSAL transcript parser - handles ALL formats including Notta, Otter, Rev, manual, etc."""
+# Speaker line patterns in priority order (first match wins)
+SPEAKER_LINE_PATTERNS = [
+    # NOTTA FORMAT: "Speaker Name HH:MM" or "Speaker Name MM:SS" (text on next line)
+    (r'^([A-Za-z][A-Za-z\s\.]+?)\s+(\d{1,2}:\d{2}(?::\d{2})?)$', 'NOTTA'),
+
+    # STANDARD FORMATS (text on same line)
+    (r'^\[(\d{2}:\d{2}:\d{2})\]\s+([A-Za-z][A-Za-z\s]+?):\s*(.+)$', 'TIMESTAMP_SPEAKER_TEXT'),
+    (r'^([A-Z][A-Z\s]+)\s*\[(\d{2}:\d{2}:\d{2})\]:\s*(.+)$', 'SPEAKER_TIMESTAMP_TEXT'),
+    (r'^([A-Z][A-Z\s]+):\s*(.+)$', 'SPEAKER_TEXT_CAPS'),
+    (r'^([A-Za-z][a-z]+(?:\s+[A-Za-z][a-z]+)*):\s*(.+)$', 'SPEAKER_TEXT_MIXED'),
+
+    # INTERVIEW FORMAT
+    (r'^([QA]):\s*(.+)$', 'QA_FORMAT'),
+]
+
+METADATA_LINE_PREFIXES = ('[', '(', '<', '#', '//')
+NOTTA_METADATA_PREFIXES = ('[', '(')
+
+TRANSCRIPT_FORMAT_SAMPLE_LINES = 500   # Lines inspected before locking onto a format
+TRANSCRIPT_FORMAT_MIN_HITS = 2         # A pattern seen once in the sample is treated as noise
+
+class SpeakerLineMatcher:
+    """One precompiled matcher for a transcript format - a single regex call per line"""
+
+    def __init__(self, pattern_types=None):
+        parts = []
+        self.group_slices = {}
+        group_index = 1
+
+        for pattern, pattern_type in SPEAKER_LINE_PATTERNS:
+            if pattern_types is not None and pattern_type not in pattern_types:
+                continue
+            n_groups = re.compile(pattern).groups
+            # Alternatives keep the priority order, so the first pattern that matches still wins
+            parts.append(f"(?P<{pattern_type}>{pattern[1:-1]})$")
+            self.group_slices[pattern_type] = (group_index, group_index + n_groups)
+            group_index += n_groups + 1
+
+        self.pattern_types = tuple(self.group_slices)
+        self.regex = re.compile('^(?:' + '|'.join(parts) + ')') if parts else None
+
+    def match(self, line: str):
+        """Return (groups, pattern_type) for a speaker line, else (None, None)"""
+        if self.regex is None:
+            return None, None
+        m = self.regex.match(line)
+        if m is None:
+            return None, None
+        pattern_type = m.lastgroup
+        start, end = self.group_slices[pattern_type]
+        return m.groups()[start:end], pattern_type
+
+    def __repr__(self):
+        return f"SpeakerLineMatcher({', '.join(self.pattern_types) or 'NONE'})"
+
+UNIVERSAL_SPEAKER_MATCHER = SpeakerLineMatcher()
+
+def detect_transcript_format(sample_lines, min_hits: int = TRANSCRIPT_FORMAT_MIN_HITS) -> SpeakerLineMatcher:
+    """Detect which speaker formats a transcript uses from a sample and lock onto them"""
+    hits = Counter()
+    for raw in sample_lines:
+        line = raw.strip()
+        if line:
+            _, pattern_type = UNIVERSAL_SPEAKER_MATCHER.match(line)
+            if pattern_type:
+                hits[pattern_type] += 1
+
+    locked = {t for t, n in hits.items() if n >= min_hits}
+    if not locked:
+        # Too little signal (tiny or unusual file) - keep every pattern
+        return UNIVERSAL_SPEAKER_MATCHER
+    return SpeakerLineMatcher(locked)
+
+def iter_speaker_statements(lines, filename: str = "", matcher: SpeakerLineMatcher = None):
+    """
+    Streaming speaker parser - yields extract_speaker_statements dicts while
+    holding only the current statement and a one-line lookahead in memory.
+    The transcript format is detected from the first lines unless a matcher is given;
+    a non-empty line the locked matcher misses is retried against every pattern, so
+    formats that only show up later (or once) still start a statement, as in the
+    legacy parser.
+    """
+    if matcher is None:
+        lines = iter(lines)
+        sample = list(itertools.islice(lines, TRANSCRIPT_FORMAT_SAMPLE_LINES))
+        matcher = detect_transcript_format(sample)
+        lines = itertools.chain(sample, lines)
+
+    if matcher is UNIVERSAL_SPEAKER_MATCHER:
+        match_line = matcher.match
+    else:
+        def match_line(line):
+            groups, pattern_type = matcher.match(line)
+            if pattern_type is None:
+                return UNIVERSAL_SPEAKER_MATCHER.match(line)
+            return groups, pattern_type
+
+    current_speaker = None
+    current_time = "00:00:00"
+    current_text = []
+    in_notta_block = False   # Notta text lines only skip '[' and '(' metadata
+
+    def build_statement(line_number, context_before, context_after):
+        full_quote = ' '.join(current_text).strip()
+        if len(full_quote) <= 5:
+            return None
+        return {
+            'speaker': current_speaker.upper().strip(),
+            'exact_quote': full_quote,
+            'time_code': current_time,
+            'time_seconds': time_to_seconds(current_time),
+            'line_number': line_number,
+            'context_before': context_before,
+            'context_after': context_after,
+            'source_file': filename
+        }
+
+    line_iter = iter(lines)
+    raw = next(line_iter, None)
+    prev_raw = ""
+    i = -1
+
+    while raw is not None:
+        i += 1
+        next_raw = next(line_iter, None)
+        line = raw.strip()
+
+        if line:
+            groups, pattern_type = match_line(line)
+
+            if pattern_type:
+                # Save previous statement if exists
+                if current_speaker and current_text:
+                    stmt = build_statement(i, prev_raw if i > 0 else "", next_raw if next_raw is not None else "")
+                    if stmt:
+                        yield stmt
+                    current_text = []
+
+                in_notta_block = pattern_type == 'NOTTA'
+
+                if pattern_type == 'NOTTA':
+                    current_speaker = groups[0].strip()
+                    time_str = groups[1]
+                    if time_str.count(':') == 1:  # MM:SS
+                        current_time = f"00:{time_str}"
+                    elif time_str.count(':') == 2:  # HH:MM:SS
+                        current_time = time_str
+                    else:
+                        current_time = "00:00:00"
+
+                elif pattern_type == 'TIMESTAMP_SPEAKER_TEXT':
+                    current_time = groups[0]
+                    current_speaker = groups[1].strip()
+                    current_text = [groups[2].strip()]
+
+                elif pattern_type == 'SPEAKER_TIMESTAMP_TEXT':
+                    current_speaker = groups[0].strip()
+                    current_time = groups[1]
+                    current_text = [groups[2].strip()]
+
+                elif pattern_type in ['SPEAKER_TEXT_CAPS', 'SPEAKER_TEXT_MIXED']:
+                    current_speaker = groups[0].strip()
+                    current_text = [groups[1].strip()]
+
+                elif pattern_type == 'QA_FORMAT':
+                    current_speaker = "INTERVIEWER" if groups[0] == "Q" else "RESPONDENT"
+                    current_text = [groups[1].strip()]
+
+            elif current_speaker:
+                # Continuation text - skip metadata lines
+                if in_notta_block:
+                    if not line.startswith(NOTTA_METADATA_PREFIXES):
+                        current_text.append(line)
+                elif not line.startswith(METADATA_LINE_PREFIXES):
+                    current_text.append(line)
+
+        prev_raw = raw
+        raw = next_raw
+
+    # Don't forget the last statement
+    if current_speaker and current_text:
+        stmt = build_statement(i, '', '')
+        if stmt:
+            yield stmt
+
+def extract_speaker_statements(text: str, filename: str = "", matcher: SpeakerLineMatcher = None) -> List[Dict]:
+    """UNIVERSAL transcript parser - handles ALL formats including Notta, Otter, Rev, manual, etc.
+
+    Detects the format from the first lines, then parses in a single pass with
+    one precompiled matcher (see iter_speaker_statements).
+    """
+    return list(iter_speaker_statements(text.split('\n'), filename, matcher))
+
+def extract_speaker_statements_legacy(text: str, filename: str = "") -> List[Dict]:
+    """UNIVERSAL transcript parser - handles ALL formats including Notta, Otter, Rev, manual, etc.
+
+    Original six-pattern parser, kept as the reference for benchmark_speaker_parser.
+    """
     statements = []
 
     # UNIVERSAL PATTERNS - Priority Order
@@ -374,6 +926,114 @@ def time_to_seconds(time_str: str) -> int:
     except:
         return 0
 
+# ========================================
+# SPEAKER PARSER THROUGHPUT BENCHMARK
+# ========================================
+def generate_synthetic_transcript(n_lines: int, transcript_format: str = 'NOTTA', seed: int = 7) -> str:
+    """Build a synthetic transcript of n_lines in one of the supported export formats"""
+    import random
+    rnd = random.Random(seed)
+    speakers = ['John Smith', 'Tiffany Adams', 'Detective Ray', 'Mary Jones']
+    words = ("the truck was parked outside when we heard the shot and then everybody "
+             "ran toward the back door because nobody knew what happened that night").split()
+
+    def sentence():
+        return ' '.join(rnd.choice(words) for _ in range(rnd.randint(6, 18))).capitalize() + '.'
+
+    lines = []
+    seconds = 0
+    while len(lines) < n_lines:
+        speaker = rnd.choice(speakers)
+        seconds += rnd.randint(2, 40)
+        hh, mm, ss = seconds // 3600, (seconds // 60) % 60, seconds % 60
+        if transcript_format == 'NOTTA':
+            lines.append(f"{speaker} {mm:02d}:{ss:02d}")
+            lines.extend(sentence() for _ in range(rnd.randint(1, 3)))
+            lines.append('')
+        elif transcript_format == 'TIMESTAMP_SPEAKER_TEXT':
+            lines.append(f"[{hh:02d}:{mm:02d}:{ss:02d}] {speaker}: {sentence()}")
+        elif transcript_format == 'QA_FORMAT':
+            lines.append(f"{rnd.choice('QA')}: {sentence()}")
+        else:
+            lines.append(f"{speaker.upper()}: {sentence()}")
+            if rnd.random() < 0.3:
+                lines.append(sentence())
+    return '\n'.join(lines[:n_lines])
+
+def benchmark_speaker_parser(line_counts=(10_000, 100_000, 1_000_000),
+                             formats=('NOTTA', 'SPEAKER_TEXT_CAPS', 'TIMESTAMP_SPEAKER_TEXT'),
+                             include_legacy=True):
+    """Compare lines/sec of the format-locked parser against the legacy six-pattern parser"""
+    print("⏱️ SPEAKER PARSER BENCHMARK")
+    print("=" * 70)
+    print(f"{'format':<24}{'lines':>10}{'legacy l/s':>14}{'locked l/s':>14}{'speedup':>9}")
+
+    results = []
+    for transcript_format in formats:
+        for n_lines in line_counts:
+            text = generate_synthetic_transcript(n_lines, transcript_format)
+
+            start = time.perf_counter()
+            statements = extract_speaker_statements(text, 'benchmark.txt')
+            locked_time = time.perf_counter() - start
+
+            legacy_time = None
+            if include_legacy:
+                start = time.perf_counter()
+                legacy_statements = extract_speaker_statements_legacy(text, 'benchmark.txt')
+                legacy_time = time.perf_counter() - start
+                assert legacy_statements == statements, f"Output mismatch for {transcript_format} @ {n_lines} lines"
+
+            row = {
+                'format': transcript_format,
+                'lines': n_lines,
+                'statements': len(statements),
+                'locked_lines_per_sec': n_lines / locked_time if locked_time else 0,
+                'legacy_lines_per_sec': n_lines / legacy_time if legacy_time else None,
+                'speedup': legacy_time / locked_time if legacy_time and locked_time else None
+            }
+            results.append(row)
+
+            legacy_col = f"{row['legacy_lines_per_sec']:>14,.0f}" if legacy_time else f"{'-':>14}"
+            speedup_col = f"{row['speedup']:>8.1f}x" if row['speedup'] else f"{'-':>9}"
+            print(f"{transcript_format:<24}{n_lines:>10,}{legacy_col}{row['locked_lines_per_sec']:>14,.0f}{speedup_col}")
+
+    return results
+
+def speaker_parser_cases(n_lines: int = 2_000,
+                         formats=('NOTTA', 'SPEAKER_TEXT_CAPS', 'TIMESTAMP_SPEAKER_TEXT')) -> Dict[str, str]:
+    """Transcripts the format-locked parser must read exactly like the legacy one"""
+    cases = {transcript_format: generate_synthetic_transcript(n_lines, transcript_format) for transcript_format in formats}
+    caps = generate_synthetic_transcript(600, 'SPEAKER_TEXT_CAPS').split('\n')
+
+    # Format changes after the detection sample
+    cases['format change after sample'] = '\n'.join(caps + [
+        "[00:01:02] Mary Jones: I never saw the truck leave that night.",
+        "[00:01:09] John Smith: Then who moved it before the police came?",
+        "[00:01:15] Mary Jones: I honestly have no idea who did that."])
+    # A speaker format seen only once
+    cases['single Q line'] = '\n'.join(caps[:20] + ["Q: Where were you when you heard the shot?"] + caps[20:40])
+    cases['one-off mixed case speaker'] = '\n'.join(caps[:20] + ["Mary Jones: I was at home the whole night."] + caps[20:40])
+    return cases
+
+def verify_speaker_parser(n_lines: int = 2_000,
+                          formats=('NOTTA', 'SPEAKER_TEXT_CAPS', 'TIMESTAMP_SPEAKER_TEXT')) -> List[str]:
+    """Compare the format-locked parser with the legacy parser - returns the cases that differ"""
+    mismatches = []
+    for name, text in speaker_parser_cases(n_lines, formats).items():
+        statements = extract_speaker_statements(text, 'verify.txt')
+        legacy_statements = extract_speaker_statements_legacy(text, 'verify.txt')
+        if statements == legacy_statements:
+            print(f"✅ {name}: {len(statements)} statements, same as legacy")
+        else:
+            print(f"❌ {name}: {len(statements)} statements, legacy has {len(legacy_statements)}")
+            mismatches.append(name)
+    return mismatches
+
+# Uncomment to run - quick equivalence check (~0.1s), then the benchmark (1M-line legacy runs take a while):
+# verify_speaker_parser()
+# benchmark_speaker_parser()
+
 # ========================================
 # ENTITY EXTRACTION (FROM OLD WITH CURRENT DATE IMPROVEMENTS)
 # ========================================
@@ -654,37 +1314,46 @@ def extract_entities_regex_enhanced(text):
 # ========================================
 # MAIN PROCESSING (FROM OLD)
 # ========================================
-def process_transcript_file(file_path: str, filename: str = None, company_id: str = None, debug=False):
-    """PRODUCTION-READY transcript processor"""
+def process_transcript_file(file_path: str, filename: str = None, company_id: str = None, debug=False, batched=False):
+    """PRODUCTION-READY transcript processor
+
+    batched=True embeds statements in multi-input requests and writes them with
+    chunked bulk inserts (see ingest_statements_batched) instead of one
+    embedding call + one insert per statement.
+
+    Re-uploading an identical file is a no-op, and a file whose earlier run
+    died part way resumes after the statements it already committed.
+    """
     if not company_id:
         raise ValueError("company_id is REQUIRED")
 
     if filename is None:
         filename = file_path.split('/')[-1]
 
+    source_file_id = None
     try:
         if debug: print(f"🚀 Processing: {filename}")
 
-        # Create source file record
-        source_file_result = supabase.table('source_files').insert({
-            'filename': filename,
-            'original_filename': filename,
-            'file_path': file_path,
-            'bucket_path': file_path,
-            'processing_status': 'processing',
-            'company_id': company_id
-        }).execute()
+        # Create source file record (or find the identical / interrupted one)
+        source_file_id, ingest_state, committed = begin_source_file(file_path, filename, company_id, debug)
 
-        source_file_id = source_file_result.data[0]['id']
+        if ingest_state == 'duplicate':
+            print(f"✅ SUCCESS! {filename} was already processed - skipped")
+            return True
+        if ingest_state == 'busy':
+            # Nothing was ingested by this call - not a success
+            print(f"⏳ {filename} is already being processed by another upload - skipped")
+            return False
 
         # Extract text
         if file_path.endswith('.docx'):
-           from docx import Document
-           doc = Document(file_path)
-           txt = '\n'.join([p.text for p in doc.paragraphs if p.text.strip()])
+           txt = '\n'.join(text for text in iter_docx_text(file_path) if text.strip())
         elif file_path.endswith('.txt'):
            with open(file_path, 'r', encoding='utf-8') as f:
                txt = f.read()
+        elif file_path.endswith('.pdf'):
+           with open(file_path, 'rb') as f:
+               txt = extract_text(f.read(), file_path, tables=False)
         else:
            raise ValueError(f"Unsupported file type: {file_path}")
 
@@ -697,178 +1366,3721 @@ def process_transcript_file(file_path: str, filename: str = None, company_id: st
         if not statements:
             raise ValueError("No statements found")
 
+        # Skip whatever an interrupted earlier run already committed
+        pending = [stmt for stmt in statements if statement_key(stmt) not in committed]
+        if debug and committed: print(f"⏯️ {len(pending)} of {len(statements)} statements left to process")
+
         # Process speakers and statements
         speakers_cache = {}
 
-        for stmt in statements:
-            speaker_name = stmt['speaker']
-            normalized_name = speaker_name.upper().strip()
+        if batched:
+            ingest_statements_batched(pending, source_file_id, company_id=company_id,
+                                      speakers_cache=speakers_cache,
+                                      embed_fn=reuse_stored_embeddings(
+                                          lambda texts: embed_texts_batched(texts, company_id=company_id), company_id),
+                                      debug=debug)
+        else:
+            for stmt in pending:
+                speaker_name = stmt['speaker']
+                normalized_name = speaker_name.upper().strip()
+
+                if speaker_name not in speakers_cache:
+                    speaker_result = supabase.table('speakers').select('*')\
+                        .eq('normalized_name', normalized_name)\
+                        .eq('source_file_id', source_file_id)\
+                        .eq('company_id', company_id)\
+                        .execute()
+
+                    if speaker_result.data:
+                        speakers_cache[speaker_name] = speaker_result.data[0]['id']
+                    else:
+                        new_speaker = supabase.table('speakers').insert({
+                            'name': speaker_name,
+                            'normalized_name': normalized_name,
+                            'source_file_id': source_file_id,
+                            'first_appearance_time': stmt['time_code'],
+                            'company_id': company_id
+                        }).execute()
+                        speakers_cache[speaker_name] = new_speaker.data[0]['id']
 
-            if speaker_name not in speakers_cache:
-                speaker_result = supabase.table('speakers').select('*')\
-                    .eq('normalized_name', normalized_name)\
-                    .eq('source_file_id', source_file_id)\
-                    .eq('company_id', company_id)\
-                    .execute()
+                # Generate embedding
+                emb = embedding_service_for(company_id).embed_one(stmt['exact_quote'])
 
-                if speaker_result.data:
-                    speakers_cache[speaker_name] = speaker_result.data[0]['id']
-                else:
-                    new_speaker = supabase.table('speakers').insert({
-                        'name': speaker_name,
-                        'normalized_name': normalized_name,
-                        'source_file_id': source_file_id,
-                        'first_appearance_time': stmt['time_code'],
-                        'company_id': company_id
-                    }).execute()
-                    speakers_cache[speaker_name] = new_speaker.data[0]['id']
-
-            # Generate embedding
-            emb = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=stmt['exact_quote']
-            ).data[0].embedding
-
-            # Insert statement
-            supabase.table('statements').insert({
-                'speaker_id': speakers_cache[speaker_name],
-                'exact_quote': stmt['exact_quote'],
-                'time_code': stmt['time_code'],
-                'time_seconds': stmt['time_seconds'],
-                'source_file_id': source_file_id,
-                'context_before': stmt.get('context_before', ''),
-                'context_after': stmt.get('context_after', ''),
-                'embedding': emb,
-                'chunk_index': stmt['line_number'],
-                'company_id': company_id
-            }).execute()
+                # Insert statement
+                supabase.table('statements').insert(
+                    build_statement_row(stmt, speakers_cache[speaker_name], source_file_id, emb, company_id)
+                ).execute()
 
         # Update status
         supabase.table('source_files').update({
             'processing_status': 'completed',
             'total_chunks': len(statements)
         }).eq('id', source_file_id).execute()
+        ann_refresh_source(company_id, source_file_id)
 
         print(f"✅ SUCCESS! Processed {len(statements)} statements")
         return True
 
     except Exception as e:
         print(f"❌ Error: {e}")
+        release_source_file(source_file_id)
         return False
 
 # ========================================
-# INVESTIGATION ENHANCEMENT (FIXED)
+# BATCHED INGEST (BULK EMBEDDINGS + BULK INSERTS)
 # ========================================
-def enhance_transcript_with_investigation_ai(transcript_id: str, company_id: str = None, debug=False):
-    """FIXED: Enhanced knowledge graph with proper entity management"""
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 100      # Inputs per embeddings.create call (API max is 2048)
+STATEMENT_INSERT_CHUNK = 200    # Rows per statements bulk insert
 
-    if debug:
-        print("🔍 ENHANCING TRANSCRIPT WITH INVESTIGATION AI")
-        print("=" * 60)
+def embed_texts_batched(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE, usage: Dict = None,
+                        company_id: str = None) -> List[List[float]]:
+    """Embed many texts with multi-input requests (tenant's backend) - returns embeddings in input order"""
+    return embedding_service_for(company_id).embed(texts, usage=usage, batch_size=batch_size)
 
-    # Get statements - source_file_id is enough, no need for company_id filter
-    statements = supabase.table('statements')\
-        .select('*, speakers(name)')\
-        .eq('source_file_id', transcript['id'])\
-        .order('time_seconds')\
-        .execute().data
 
-    if not statements:
-        print(f"❌ No statements found for transcript ID: {transcript_id}")
-        return 0
+def resolve_speakers_bulk(statements: List[Dict], source_file_id: str, company_id: str = None,
+                          speakers_cache: Dict = None) -> Dict[str, str]:
+    """Resolve every speaker in one pass: one lookup query + one bulk insert for new speakers"""
+    if speakers_cache is None:
+        speakers_cache = {}
 
-    if debug: print(f"📊 Found {len(statements)} statements to process")
+    # First appearance of each speaker (keeps first_appearance_time identical to the per-row path)
+    first_seen = {}
+    for stmt in statements:
+        speaker_name = stmt['speaker']
+        if speaker_name not in speakers_cache and speaker_name not in first_seen:
+            first_seen[speaker_name] = stmt['time_code']
+
+    if not first_seen:
+        return speakers_cache
+
+    normalized = {name: name.upper().strip() for name in first_seen}
+
+    lookup = supabase.table('speakers').select('id, normalized_name')\
+        .in_('normalized_name', list(set(normalized.values())))\
+        .eq('source_file_id', source_file_id)
+    if company_id:
+        lookup = lookup.eq('company_id', company_id)
+    existing = {row['normalized_name']: row['id'] for row in lookup.execute().data}
+
+    # One row per normalized name ("John" / "JOHN " are one speaker) - the first
+    # spelling and appearance win, as in the per-row path
+    new_rows = {}
+    for name, time_code in first_seen.items():
+        if normalized[name] in existing:
+            speakers_cache[name] = existing[normalized[name]]
+        elif normalized[name] not in new_rows:
+            row = {
+                'name': name,
+                'normalized_name': normalized[name],
+                'source_file_id': source_file_id,
+                'first_appearance_time': time_code
+            }
+            if company_id:
+                row['company_id'] = company_id
+            new_rows[normalized[name]] = row
+
+    if new_rows:
+        inserted = supabase.table('speakers').insert(list(new_rows.values())).execute()
+        inserted_ids = {row['normalized_name']: row['id'] for row in inserted.data}
+        for name in first_seen:
+            if name not in speakers_cache:
+                speakers_cache[name] = inserted_ids[normalized[name]]
+
+    return speakers_cache
+
+def build_statement_row(stmt: Dict, speaker_id: str, source_file_id: str, embedding, company_id: str = None) -> Dict:
+    """Build the statements row exactly as the per-statement processors insert it"""
+    row = {
+        'speaker_id': speaker_id,
+        'exact_quote': stmt['exact_quote'],
+        'time_code': stmt['time_code'],
+        'time_seconds': stmt['time_seconds'],
+        'source_file_id': source_file_id,
+        'context_before': stmt.get('context_before', ''),
+        'context_after': stmt.get('context_after', ''),
+        'embedding': embedding,
+        'chunk_index': stmt['line_number'],
+        **compact_embedding_columns(embedding)
+    }
+    if company_id:
+        row['company_id'] = company_id
+    if has_columns('statements', 'content_hash'):
+        row['content_hash'] = statement_hash(stmt)
+    return row
+
+def insert_statements_bulk(rows: List[Dict], chunk_size: int = STATEMENT_INSERT_CHUNK) -> int:
+    """Insert statement rows in chunks - returns number of rows written"""
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        supabase.table('statements').insert(chunk).execute()
+        written += len(chunk)
+    return written
+
+def upsert_statements_bulk(rows: List[Dict], chunk_size: int = STATEMENT_INSERT_CHUNK) -> int:
+    """Update existing statement rows (by id) in chunks - one round trip per chunk, not per row"""
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        supabase.table('statements').upsert(chunk, on_conflict='id').execute()
+        written += len(chunk)
+    return written
+
+def ingest_statements_batched(statements: List[Dict], source_file_id: str, company_id: str = None,
+                              speakers_cache: Dict = None, embed_fn=None, debug=False) -> int:
+    """Batched replacement for the per-statement speaker/embedding/insert loop"""
+    embed_fn = embed_fn or (lambda texts: embed_texts_batched(texts, company_id=company_id))
+    start_time = time.time()
+
+    speakers_cache = resolve_speakers_bulk(statements, source_file_id, company_id, speakers_cache)
+    if debug: print(f"👥 Resolved {len(speakers_cache)} speakers in one pass")
+
+    embeddings = embed_fn([stmt['exact_quote'] for stmt in statements])
+    if debug: print(f"🧮 Embedded {len(embeddings)} statements in batches of {EMBEDDING_BATCH_SIZE}")
+
+    rows = [
+        build_statement_row(stmt, speakers_cache[stmt['speaker']], source_file_id, emb, company_id)
+        for stmt, emb in zip(statements, embeddings)
+    ]
+    written = insert_statements_bulk(rows)
 
-    # NEW: Track entities with better deduplication
-    entity_registry = {}  # normalized_name -> entity_data
-    total_processed = 0
+    if debug:
+        elapsed = time.time() - start_time
+        print(f"💾 Bulk inserted {written} statements in {elapsed:.1f}s "
+              f"({written / elapsed if elapsed else 0:.0f} statements/sec)")
 
-    for stmt in statements:
-        try:
-            if debug: print(f"Processing statement {stmt['id'][:8]}...")
+    return written
 
-            crime_data = extract_crime_entities_and_topics(
-                stmt['exact_quote'],
-                stmt['id'],
-                stmt['speaker_id'],
-                transcript_id
-            )
+# ========================================
+# EMBEDDING SERVICE (BATCHED, COALESCING, RATE LIMITED)
+# Every embedding - ingest and search - goes through embedding_service
+# ========================================
+import sys
+import random
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4'))   # Provider requests in flight
+EMBEDDING_MAX_RETRIES = 5
+EMBEDDING_BACKOFF_BASE = 0.5     # Seconds, doubled per retry
+EMBEDDING_BACKOFF_MAX = 20.0
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '256')) * 1024 * 1024   # In-process tier budget
+EMBEDDING_CACHE_POLICY = os.getenv('EMBEDDING_CACHE_POLICY', 'lru')    # 'lru' or 'lfu'
+EMBEDDING_COLUMN_DIM = 1536     # statements.embedding is vector(1536) - smaller backends are zero-padded
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')            # Default for tenants without an override
+LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+OPENAI_REQUESTS_PER_MIN = int(os.getenv('OPENAI_REQUESTS_PER_MIN', '3000'))
+OPENAI_TOKENS_PER_MIN = int(os.getenv('OPENAI_TOKENS_PER_MIN', '1000000'))
+
+class RateLimiter:
+    """Thread-safe token bucket - acquire(n) blocks until n units are available"""
+
+    def __init__(self, rate_per_min: float, burst: float = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)  # A single oversized request must still go through
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+# Shared by every thread in this runtime, so parallel work stays under the account limits
+openai_request_limiter = RateLimiter(OPENAI_REQUESTS_PER_MIN)
+openai_token_limiter = RateLimiter(OPENAI_TOKENS_PER_MIN)
+
+def estimate_tokens(texts: List[str]) -> int:
+    """Rough token count (~4 chars per token) for rate limiting before the call"""
+    return sum(len(t) // 4 + 1 for t in texts)
+
+class BoundedEmbeddingCache:
+    """
+    Thread-safe in-process embedding cache with a memory budget.
+    Vectors are held as float32 arrays and evicted LRU or LFU once the
+    resident bytes exceed max_bytes. An optional backing store (e.g. the
+    persistent MmapEmbeddingStore) is read on a miss and written through.
+    """
 
-            # Process each entity with intelligence
-            for entity in crime_data['entities']:
-                try:
-                    # FILTER OUT LOW-QUALITY ENTITIES
-                    if len(entity['text']) < 3:
-                        continue
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, policy: str = EMBEDDING_CACHE_POLICY,
+                 backing=None, latency_samples: int = 2048):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.backing = backing
+        self.entries = OrderedDict()          # key -> array('f'), oldest first (LRU order)
+        self.freq = {}                        # LFU: key -> use count
+        self.buckets = defaultdict(OrderedDict)   # LFU: use count -> keys, oldest first
+        self.min_freq = 0
+        self.resident_bytes = 0
+        self.lock = threading.RLock()
+        self.counters = defaultdict(int)
+        self.miss_latencies = deque(maxlen=latency_samples)
+
+    @staticmethod
+    def _entry_bytes(key, vector) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(vector)
+
+    def _touch(self, key):
+        if self.policy == 'lru':
+            self.entries.move_to_end(key)
+            return
+        count = self.freq[key]
+        del self.buckets[count][key]
+        if not self.buckets[count]:
+            del self.buckets[count]
+            if self.min_freq == count:
+                self.min_freq = count + 1
+        self.freq[key] = count + 1
+        self.buckets[count + 1][key] = None
+
+    def _evict_one(self):
+        if self.policy == 'lru':
+            key, vector = self.entries.popitem(last=False)
+        else:
+            key, _ = self.buckets[self.min_freq].popitem(last=False)
+            if not self.buckets[self.min_freq]:
+                del self.buckets[self.min_freq]
+                self.min_freq = min(self.buckets) if self.buckets else 0
+            del self.freq[key]
+            vector = self.entries.pop(key)
+        self.resident_bytes -= self._entry_bytes(key, vector)
+        self.counters['evictions'] += 1
+
+    def _insert(self, key, vector):
+        size = self._entry_bytes(key, vector)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.resident_bytes += size - self._entry_bytes(key, self.entries[key])
+            self.entries[key] = vector
+            self._touch(key)
+            while self.resident_bytes > self.max_bytes and len(self.entries) > 1:
+                self._evict_one()
+            return
+
+        # Make room first - under LFU a new entry would otherwise be its own victim
+        while self.resident_bytes + size > self.max_bytes and self.entries:
+            self._evict_one()
+        self.entries[key] = vector
+        if self.policy == 'lfu':
+            self.freq[key] = 1
+            self.buckets[1][key] = None
+            self.min_freq = 1
+        self.resident_bytes += size
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self._touch(key)
+                self.counters['hits'] += 1
+                return vector.tolist()
+
+        backing = self.backing
+        if backing is not None and key in backing:
+            values = backing[key]
+            with self.lock:
+                self._insert(key, array('f', values))
+                self.counters['backing_hits'] += 1
+            return values
+
+        with self.lock:
+            self.counters['misses'] += 1
+        return default
+
+    def __getitem__(self, key: str) -> List[float]:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            if key in self.entries:
+                return True
+        return self.backing is not None and key in self.backing
+
+    def __setitem__(self, key: str, embedding: List[float]):
+        vector = array('f', embedding)
+        with self.lock:
+            self._insert(key, vector)
+        if self.backing is not None and key not in self.backing:
+            self.backing[key] = embedding
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.freq.clear()
+            self.buckets.clear()
+            self.min_freq = 0
+            self.resident_bytes = 0
+
+    def record_miss_latency(self, seconds: float):
+        """Time a caller waited for a missed embedding (called by EmbeddingService)"""
+        with self.lock:
+            self.miss_latencies.append(seconds)
+
+    def metrics(self) -> Dict:
+        """Live counters: hit rate, evictions, resident bytes, miss latency percentiles"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.miss_latencies)
+            entries = len(self.entries)
+            resident = self.resident_bytes
+
+        lookups = counters.get('hits', 0) + counters.get('backing_hits', 0) + counters.get('misses', 0)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1)
 
-                    # Skip generic/vague terms
-                    vague_terms = ['guy', 'man', 'woman', 'person', 'someone', 'thing',
-                                   'stuff', 'place', 'area', 'your family', 'his family']
-                    if any(vague in entity['text'].lower() for vague in vague_terms):
-                        continue
+        return {
+            'policy': self.policy,
+            'entries': entries,
+            'resident_bytes': resident,
+            'max_bytes': self.max_bytes,
+            'hits': counters.get('hits', 0),
+            'backing_hits': counters.get('backing_hits', 0),
+            'misses': counters.get('misses', 0),
+            'hit_rate': (lookups - counters.get('misses', 0)) / lookups if lookups else 0.0,
+            'evictions': counters.get('evictions', 0),
+            'miss_latency_ms': {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99)},
+        }
 
-                    # Skip if confidence too low
-                    if entity.get('confidence', 0) < 0.65:
-                        continue
+class EmbeddingBackend:
+    """
+    Where vectors come from. Subclasses implement _embed(texts) ->
+    (vectors, tokens); embed_batch() times every call so each backend
+    reports its own throughput next to its dimensionality.
+    """
+    name = 'base'
+    dim = 0
+    network = False    # Network backends get rate limiting + retries
 
-                    normalized_name = entity['text'].upper().strip()
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.texts = 0
+        self.seconds = 0.0
+
+    def _embed(self, texts: List[str]):
+        raise NotImplementedError
+
+    def embed_batch(self, texts: List[str]):
+        start = time.perf_counter()
+        vectors, tokens = self._embed(texts)
+        with self.lock:
+            self.texts += len(texts)
+            self.seconds += time.perf_counter() - start
+        return vectors, tokens
+
+    def info(self) -> Dict:
+        with self.lock:
+            texts, seconds = self.texts, self.seconds
+        return {
+            'name': self.name,
+            'dim': self.dim,
+            'network': self.network,
+            'texts': texts,
+            'texts_per_sec': round(texts / seconds, 1) if seconds else None
+        }
 
-                    # DEDUPLICATION: Check if entity exists
-                    if normalized_name in entity_registry:
-                        # Update existing entity
-                        existing = entity_registry[normalized_name]
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI embeddings API (the original text-embedding-3-small path)"""
+    network = True
+    DIMS = {'text-embedding-3-small': 1536, 'text-embedding-3-large': 3072, 'text-embedding-ada-002': 1536}
 
-                        # Increase confidence if seen multiple times
-                        existing['mention_count'] += 1
-                        existing['confidence'] = min(1.0, existing['confidence'] + 0.05)
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        super().__init__()
+        self.name = model
+        self.dim = self.DIMS.get(model, EMBEDDING_COLUMN_DIM)
 
-                        # Add context if new
-                        if entity.get('context') not in existing['all_contexts']:
-                            existing['all_contexts'].append(entity.get('context', ''))
+    def _embed(self, texts):
+        response = client.embeddings.create(model=self.name, input=texts)
+        # The API tags every item with its input index - don't rely on response order
+        ordered = sorted(response.data, key=lambda d: d.index)
+        tokens = response.usage.total_tokens if getattr(response, 'usage', None) else 0
+        return [d.embedding for d in ordered], tokens
 
-                        # Upgrade entity type if more specific
-                        type_priority = {
-                            'SUSPECT': 10, 'VICTIM': 9, 'WEAPON_USED': 8,
-                            'LAW_ENFORCEMENT': 7, 'CRIME_LOCATION': 6,
-                            'PERSON_OF_INTEREST': 5, 'LOCATION': 4,
-                            'WEAPON_MENTIONED': 3, 'TIMELINE_MARKER': 2
-                        }
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    CPU embeddings with no network hop. Uses sentence-transformers when it
+    is installed; otherwise a signed feature-hashing model over words and
+    word bigrams (lexical, not semantic - fine for air-gapped installs and
+    benchmarks).
+    """
 
-                        current_priority = type_priority.get(existing['entity_type'], 0)
-                        new_priority = type_priority.get(entity['type'], 0)
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, hashing_dim: int = EMBEDDING_COLUMN_DIM):
+        super().__init__()
+        self.model = None
+        try:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_name, device='cpu')
+            self.name = f"local:{model_name}"
+            self.dim = self.model.get_sentence_embedding_dimension()
+        except Exception as e:
+            print(f"⚠️ sentence-transformers unavailable ({e}) - using hashing embeddings")
+            self.name = f"local:hashing-{hashing_dim}"
+            self.dim = hashing_dim
+
+    def _hash_vector(self, text: str) -> List[float]:
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        features = [(w, 1.0) for w in words] + [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+
+        vector = [0.0] * self.dim
+        for feature, weight in features:
+            h = int.from_bytes(hashlib.md5(feature.encode()).digest()[:8], 'little')
+            vector[h % self.dim] += weight if h >> 63 else -weight
+
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector] if norm else vector
+
+    def _embed(self, texts):
+        if self.model is not None:
+            return self.model.encode(texts, normalize_embeddings=True).tolist(), 0
+        return [self._hash_vector(text) for text in texts], 0
+
+class DeterministicEmbeddingBackend(EmbeddingBackend):
+    """Stable pseudo-random unit vectors seeded by the text - a test stand-in"""
+
+    def __init__(self, dim: int = EMBEDDING_COLUMN_DIM):
+        super().__init__()
+        self.name = f"deterministic-{dim}"
+        self.dim = dim
+
+    def _embed(self, texts):
+        vectors = []
+        for text in texts:
+            rng = random.Random(hashlib.md5(text.encode()).hexdigest())
+            vector = [rng.gauss(0, 1) for _ in range(self.dim)]
+            norm = sum(v * v for v in vector) ** 0.5
+            vectors.append([v / norm for v in vector])
+        return vectors, 0
+
+EMBEDDING_BACKENDS = {
+    'openai': OpenAIEmbeddingBackend,
+    'local': LocalEmbeddingBackend,
+    'deterministic': DeterministicEmbeddingBackend,
+}
 
-                        if new_priority > current_priority:
-                            existing['entity_type'] = entity['type']
+class EmbeddingService:
+    """
+    Batch embedding API. Inputs are deduped, cache hits served locally,
+    concurrent callers asking for the same text share one in-flight request,
+    and misses go to the backend in multi-input requests on a bounded pool
+    under the shared rate limits, with retry + exponential backoff.
+    Vectors are zero-padded to EMBEDDING_COLUMN_DIM (cosine is unchanged).
+    """
 
-                    else:
-                        # NEW ENTITY: Add to registry
-                        entity_registry[normalized_name] = {
-                            'name': entity['text'],
-                            'entity_type': entity['type'],
-                            'normalized_name': normalized_name,
-                            'confidence': entity.get('confidence', 0.8),
-                            'mention_count': 1,
-                            'all_contexts': [entity.get('context', '')[:500]],
-                            'first_seen': stmt.get('time_code', '00:00:00'),
-                            'company_id': company_id
-                        }
+    def __init__(self, backend: EmbeddingBackend = None, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, max_retries: int = EMBEDDING_MAX_RETRIES,
+                 cache=None, request_limiter: RateLimiter = None, token_limiter: RateLimiter = None):
+        self.backend = backend or OpenAIEmbeddingBackend()
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.cache = cache            # Any dict-like keyed by cache_key(), e.g. BoundedEmbeddingCache
+        self.request_limiter = request_limiter
+        self.token_limiter = token_limiter
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='embedding')
+        self.inflight = {}            # cache key -> Future shared by every caller waiting on it
+        self.lock = threading.Lock()
+        self.stats = defaultdict(int)
+
+    def cache_key(self, text: str) -> str:
+        """MD5 of the text (same key as get_text_hash); other backends get their own keys"""
+        if self.backend.name != EMBEDDING_MODEL:
+            text = f"{self.backend.name}\x1f{text}"
+        return hashlib.md5(text.encode()).hexdigest()
+
+    def embed(self, texts: List[str], usage: Dict = None, batch_size: int = None) -> List[List[float]]:
+        """Embeddings for texts, in order"""
+        started = time.monotonic()
+        keys = [self.cache_key(text) for text in texts]
+        results = {}
+
+        unique = {}
+        for key, text in zip(keys, texts):
+            if key in unique or key in results:
+                continue   # Repeat within the batch - one lookup (and one hit) per key
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                results[key] = cached
+            else:
+                unique[key] = text
+
+        waiting = {}   # key -> future another caller is already fetching
+        mine = []      # (key, text, future) this call fetches
+        with self.lock:
+            self.stats['texts'] += len(texts)
+            self.stats['deduped'] += len(texts) - len(unique) - len(results)
+            self.stats['cache_hits'] += len(results)
+            for key, text in unique.items():
+                if key in self.inflight:
+                    waiting[key] = self.inflight[key]
+                else:
+                    future = Future()
+                    self.inflight[key] = future
+                    mine.append((key, text, future))
+            self.stats['coalesced'] += len(waiting)
+
+        batch_size = batch_size or self.batch_size
+        for start in range(0, len(mine), batch_size):
+            batch = mine[start:start + batch_size]
+            try:
+                self.pool.submit(self._fetch, batch, usage)
+            except BaseException as e:
+                self._fail(batch, e)
 
-                except Exception as entity_error:
-                    if debug: print(f"⚠️ Error processing entity: {str(entity_error)}")
-                    continue
+        for key, _, future in mine:
+            results[key] = future.result()
+        for key, future in waiting.items():
+            results[key] = future.result()
 
-            total_processed += 1
+        record = getattr(self.cache, 'record_miss_latency', None)
+        if record and (mine or waiting):
+            elapsed = time.monotonic() - started
+            for _ in range(len(mine) + len(waiting)):
+                record(elapsed)
 
-        except Exception as stmt_error:
-            if debug: print(f"❌ Error processing statement: {str(stmt_error)}")
-            continue
+        return [results[key] for key in keys]
 
-    # STORE ONLY HIGH-QUALITY DEDUPLICATED ENTITIES
-    total_stored = 0
-    for entity_data in entity_registry.values():
-        try:
-            # Only store if mentioned multiple times OR high confidence
-            if entity_data['mention_count'] >= 2 or entity_data['confidence'] >= 0.8:
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+    def _fetch(self, batch, usage):
+        """Pool worker: one provider request for a batch, results shared through the futures"""
+        try:
+            embeddings = self._request([text for _, text, _ in batch], usage)
+            for (key, _, future), embedding in zip(batch, embeddings):
+                # Round to float32 like the caches store it, so hits and misses return identical vectors
+                embedding = array('f', embedding).tolist()
+                if self.cache is not None:
+                    self.cache[key] = embedding
+                future.set_result(embedding)
+        except BaseException as e:
+            self._fail(batch, e)
+        finally:
+            with self.lock:
+                for key, _, _ in batch:
+                    self.inflight.pop(key, None)
+
+    def _fail(self, batch, error):
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _request(self, texts: List[str], usage: Dict = None) -> List[List[float]]:
+        """Backend call with rate limiting and retry + exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            if self.request_limiter:
+                self.request_limiter.acquire()
+            if self.token_limiter:
+                self.token_limiter.acquire(estimate_tokens(texts))
+            try:
+                vectors, tokens = self.backend.embed_batch(texts)
+                break
+            except Exception as e:
+                # Local failures and bad input / auth errors won't fix themselves
+                if (attempt == self.max_retries or not self.backend.network
+                        or getattr(e, 'status_code', None) in (400, 401, 403, 404)):
+                    with self.lock:
+                        self.stats['failures'] += 1
+                    raise
+                delay = min(EMBEDDING_BACKOFF_MAX, EMBEDDING_BACKOFF_BASE * 2 ** attempt)
+                with self.lock:
+                    self.stats['retries'] += 1
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+        if vectors and len(vectors[0]) != EMBEDDING_COLUMN_DIM:
+            if len(vectors[0]) > EMBEDDING_COLUMN_DIM:
+                raise ValueError(f"{self.backend.name} returns {len(vectors[0])} dims, column holds {EMBEDDING_COLUMN_DIM}")
+            padding = [0.0] * (EMBEDDING_COLUMN_DIM - len(vectors[0]))
+            vectors = [list(vector) + padding for vector in vectors]
+
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['embedded'] += len(texts)
+            self.stats['tokens'] += tokens
+            if usage is not None:
+                usage['tokens'] = usage.get('tokens', 0) + tokens
+                usage['requests'] = usage.get('requests', 0) + 1
+
+        return vectors
+
+embedding_service = EmbeddingService(cache=BoundedEmbeddingCache(),
+                                     request_limiter=openai_request_limiter, token_limiter=openai_token_limiter)
+
+# Per-tenant backend choice, e.g. {"legalfirm1": "local"} - tenants not listed use EMBEDDING_BACKEND.
+# Switching a tenant's backend means re-ingesting its transcripts: vectors from different
+# backends are not comparable.
+TENANT_EMBEDDING_BACKENDS = json.loads(os.getenv('TENANT_EMBEDDING_BACKENDS', '{}'))
+
+embedding_services = {'openai': embedding_service}
+_embedding_services_lock = threading.Lock()
+
+def embedding_service_for(company_id: str = None) -> EmbeddingService:
+    """The EmbeddingService configured for this tenant (created on first use)"""
+    backend_name = TENANT_EMBEDDING_BACKENDS.get(company_id, EMBEDDING_BACKEND)
+    service = embedding_services.get(backend_name)
+    if service is not None:
+        return service
+
+    with _embedding_services_lock:
+        if backend_name not in embedding_services:
+            if backend_name not in EMBEDDING_BACKENDS:
+                raise ValueError(f"Unknown embedding backend: {backend_name}")
+            # Local backends don't share the OpenAI rate limits
+            embedding_services[backend_name] = EmbeddingService(EMBEDDING_BACKENDS[backend_name](),
+                                                                cache=BoundedEmbeddingCache())
+        return embedding_services[backend_name]
+
+def benchmark_embedding_backends(texts: List[str], backends=('deterministic', 'local', 'openai'),
+                                 batch_size: int = EMBEDDING_BATCH_SIZE) -> List[Dict]:
+    """Embed the same texts with fresh instances of each backend (no cache) and compare throughput"""
+    report = []
+    for backend_name in backends:
+        backend = EMBEDDING_BACKENDS[backend_name]()
+        try:
+            for start in range(0, len(texts), batch_size):
+                backend.embed_batch(texts[start:start + batch_size])
+        except Exception as e:
+            print(f"❌ {backend_name}: {e}")
+            continue
+        info = backend.info()
+        report.append(info)
+        print(f"⚡ {info['name']:<28} {info['dim']:>5} dims   {info['texts_per_sec']} texts/sec   "
+              f"{'network' if info['network'] else 'local CPU'}")
+    return report
+
+# ========================================
+# QUERY EMBEDDINGS (TWO-TIER CACHE)
+# In-process cache -> shared cached_embeddings table -> provider
+# ========================================
+QUERY_EMBEDDING_TABLE = 'cached_embeddings'
+
+QUESTION_PATTERNS = [
+    'what is said about', 'what does', 'what did', 'who said',
+    'tell me about', 'find mentions of', 'find me all', 'search for'
+]
+
+def extract_query_topic(query: str, debug=False) -> str:
+    """Strip question phrasing ('what is said about X?') down to the topic X"""
+    original_query = query
+    query_lower = query.lower().replace("'", "").replace("'", "").replace("'", "")
+
+    if any(pattern in query_lower for pattern in QUESTION_PATTERNS):
+        match = re.search(r'(?:what is said about|tell me about|mentions of|find me all|search for)\s+(.+?)(?:\?|$)', query_lower)
+        if match:
+            query = match.group(1).strip()
+        else:
+            query = re.sub(r'\b(?:what|who|where|when|why|how|is|are|was|were|said|says|about|regarding|concerning|did|does|do|tell|me|find|search|looking|for|all|mentions|of)\b', '', query_lower, flags=re.IGNORECASE)
+            query = query.strip('?., ').strip()
+
+        if not query or len(query) < 2:
+            query = original_query
+
+        if debug:
+            print(f"📝 Extracted: '{query}' from: '{original_query}'")
+
+    return query
+
+def normalize_query(query: str) -> str:
+    """Cache key + embedding input: topic only, lowercased, single-spaced"""
+    topic = extract_query_topic(query).lower().replace("'", "").replace("’", "")
+    return re.sub(r'\s+', ' ', topic).strip(' ?.,')
+
+def _store_query_embedding(normalized: str, embedding: List[float]):
+    try:
+        supabase.table(QUERY_EMBEDDING_TABLE).upsert({
+            'query': normalized,
+            'embedding': embedding
+        }, on_conflict='query').execute()
+    except Exception as e:
+        print(f"⚠️ Could not share query embedding: {e}")
+
+def get_query_embedding(query: str, company_id: str = None, debug=False) -> List[float]:
+    """
+    Embedding for a search query. Repeat queries (after normalization)
+    never pay the provider round trip: the in-process cache answers first,
+    then the cached_embeddings table shared by every worker (default
+    backend only - the table holds OpenAI vectors).
+    """
+    normalized = normalize_query(query) or query
+    service = embedding_service_for(company_id)
+    key = service.cache_key(normalized)
+    cache = service.cache
+
+    embedding = cache.get(key) if cache is not None else None
+    if embedding is not None:
+        if debug: print(f"💰 Query embedding from memory: '{normalized}'")
+        return embedding
+
+    if service is not embedding_service:
+        return service.embed_one(normalized)
+
+    try:
+        rows = supabase.table(QUERY_EMBEDDING_TABLE).select('embedding')\
+            .eq('query', normalized)\
+            .limit(1)\
+            .execute().data
+    except Exception as e:
+        if debug: print(f"⚠️ {QUERY_EMBEDDING_TABLE} lookup failed: {e}")
+        rows = []
+
+    if rows and rows[0].get('embedding') is not None:
+        embedding = rows[0]['embedding']
+        embedding = json.loads(embedding) if isinstance(embedding, str) else embedding
+        if cache is not None:
+            cache[key] = embedding
+        if debug: print(f"💰 Query embedding from {QUERY_EMBEDDING_TABLE}: '{normalized}'")
+        return embedding
+
+    if debug: print(f"📡 Query embedding from provider: '{normalized}'")
+    embedding = embedding_service.embed_one(normalized)
+
+    # Share with other workers without holding up this search
+    threading.Thread(target=_store_query_embedding, args=(normalized, embedding), daemon=True).start()
+    return embedding
+
+# ========================================
+# CONTENT HASHING (DEDUP + RESUMABLE INGEST)
+# Needs extra columns - run once in the Supabase SQL editor:
+#   ALTER TABLE source_files ADD COLUMN IF NOT EXISTS content_hash text;
+#   ALTER TABLE source_files ADD COLUMN IF NOT EXISTS claimed_at timestamptz;
+#   ALTER TABLE statements ADD COLUMN IF NOT EXISTS content_hash text;
+#   DROP INDEX IF EXISTS source_files_company_hash_idx;
+#   CREATE UNIQUE INDEX IF NOT EXISTS source_files_company_hash_key ON source_files (company_id, content_hash);
+#   CREATE INDEX IF NOT EXISTS statements_company_hash_idx ON statements (company_id, content_hash);
+# Until it has run, ingest still works - just without dedup, resume or
+# embedding reuse.
+# ========================================
+from datetime import timedelta, timezone
+
+HASH_LOOKUP_PAGE = 1000   # Rows per page when reading back committed statements
+HASH_FILTER_PAGE = 200    # Hashes per .in_() filter (they travel in the URL)
+ID_LOOKUP_PAGE = 150      # Statement UUIDs per .in_('id') filter (36 chars each, also in the URL)
+SOURCE_CLAIM_TIMEOUT = int(os.getenv('SOURCE_CLAIM_TIMEOUT', '3600'))   # Seconds before an unfinished claim counts as abandoned
+
+_column_checks = {}   # (table, columns) -> bool
+
+def has_columns(table: str, columns: str) -> bool:
+    """Whether the table has these columns (checked once) - optional migrations degrade instead of failing ingest"""
+    key = (table, columns)
+    if key not in _column_checks:
+        try:
+            supabase.table(table).select(columns).limit(1).execute()
+            _column_checks[key] = True
+        except Exception as e:
+            if 'column' not in str(e).lower():
+                raise   # Not a schema problem - don't remember it
+            print(f"⚠️ {table} has no {columns} column(s) yet - run the CONTENT HASHING migration ({e})")
+            _column_checks[key] = False
+    return _column_checks[key]
+
+def is_unique_violation(e: Exception) -> bool:
+    return getattr(e, 'code', None) == '23505' or 'duplicate key' in str(e)
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of the raw upload, read in chunks"""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def statement_hash(stmt: Dict) -> str:
+    """Hash of the embedded text (same md5 key the embedding cache uses)"""
+    return hashlib.md5(stmt['exact_quote'].encode()).hexdigest()
+
+def statement_key(stmt: Dict) -> tuple:
+    """Position + content - identifies a statement within one source file"""
+    return (stmt['line_number'], statement_hash(stmt))
+
+def committed_statement_keys(source_file_id: str) -> set:
+    """Keys of every statement already written for a source file (paged)"""
+    keys = set()
+    offset = 0
+    while True:
+        page = supabase.table('statements').select('chunk_index, content_hash')\
+            .eq('source_file_id', source_file_id)\
+            .order('chunk_index')\
+            .range(offset, offset + HASH_LOOKUP_PAGE - 1)\
+            .execute().data
+        keys.update((row['chunk_index'], row['content_hash']) for row in page)
+        if len(page) < HASH_LOOKUP_PAGE:
+            return keys
+        offset += HASH_LOOKUP_PAGE
+
+def begin_source_file(file_path: str, filename: str, company_id: str, debug=False, file_hash: str = None):
+    """
+    Find or create - and claim - the source_files row for an upload.
+    Returns (source_file_id, state, committed_keys) where state is
+    'duplicate' (identical file already completed), 'busy' (another run
+    holds the claim on it), 'resume' (an earlier run stopped part way -
+    committed_keys holds what it wrote) or 'new'.
+
+    Claims are atomic: the unique (company_id, content_hash) index lets only
+    one insert win, and taking over an unfinished row is a conditional update
+    that only matches an unclaimed or abandoned (SOURCE_CLAIM_TIMEOUT) claim.
+    """
+    row = {
+        'filename': filename,
+        'original_filename': filename,
+        'file_path': file_path,
+        'bucket_path': file_path,
+        'processing_status': 'processing',
+        'company_id': company_id
+    }
+    if not has_columns('source_files', 'content_hash, claimed_at'):
+        return supabase.table('source_files').insert(row).execute().data[0]['id'], 'new', set()
+
+    file_hash = file_hash or hash_file(file_path)
+    now = datetime.now(timezone.utc)
+
+    for attempt in range(2):
+        existing = supabase.table('source_files').select('id, processing_status')\
+            .eq('company_id', company_id)\
+            .eq('content_hash', file_hash)\
+            .execute().data
+
+        for found in existing:
+            if found['processing_status'] == 'completed':
+                if debug: print(f"♻️ Identical upload already processed: {found['id']}")
+                return found['id'], 'duplicate', set()
+
+        for found in existing:
+            if not claim_source_file(found['id'], status='processing'):
+                if debug: print(f"⏳ {found['id']} is being processed by another run")
+                return found['id'], 'busy', set()
+            committed = committed_statement_keys(found['id'])
+            if debug: print(f"⏯️ Resuming {found['id']}: {len(committed)} statements already committed")
+            return found['id'], 'resume', committed
+
+        try:
+            source_file_result = supabase.table('source_files').insert({
+                **row,
+                'content_hash': file_hash,
+                'claimed_at': now.isoformat()
+            }).execute()
+            return source_file_result.data[0]['id'], 'new', set()
+        except Exception as e:
+            if attempt or not is_unique_violation(e):
+                raise
+            # An identical upload inserted first - look again and see whether it's done or claimed
+
+def claim_source_file(source_file_id: str, status: str = None) -> bool:
+    """Claim a source_files row (in this processing_status, if given) unless another run holds a live claim"""
+    now = datetime.now(timezone.utc)
+    stale = (now - timedelta(seconds=SOURCE_CLAIM_TIMEOUT)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    query = supabase.table('source_files').update({'claimed_at': now.isoformat()}).eq('id', source_file_id)
+    if status:
+        query = query.eq('processing_status', status)
+    return bool(query.or_(f"claimed_at.is.null,claimed_at.lt.{stale}").execute().data)
+
+def release_source_file(source_file_id: str):
+    """Drop this run's claim so the next upload of the file can resume it straight away"""
+    if source_file_id and has_columns('source_files', 'content_hash, claimed_at'):
+        try:
+            supabase.table('source_files').update({'claimed_at': None}).eq('id', source_file_id).execute()
+        except Exception as e:
+            print(f"⚠️ Could not release {source_file_id}: {e}")
+
+def stored_embeddings_by_hash(hashes: List[str], company_id: str) -> Dict[str, List[float]]:
+    """Embeddings already stored for any of these statement hashes"""
+    if not hashes or not has_columns('statements', 'content_hash'):
+        return {}
+
+    unique = list(set(hashes))
+    rows = []
+    for start in range(0, len(unique), HASH_FILTER_PAGE):
+        rows.extend(supabase.table('statements').select('content_hash, embedding')
+                    .eq('company_id', company_id)
+                    .in_('content_hash', unique[start:start + HASH_FILTER_PAGE])
+                    .execute().data)
+
+    found = {}
+    for row in rows:
+        emb = row.get('embedding')
+        if emb is not None and row['content_hash'] not in found:
+            # pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings
+            found[row['content_hash']] = json.loads(emb) if isinstance(emb, str) else emb
+    return found
+
+def reuse_stored_embeddings(embed_fn, company_id: str, usage: Dict = None):
+    """
+    Wrap an embed_fn so texts already embedded for this company (same
+    statement hash) reuse the stored vector - only new text hits the API.
+    """
+    def embed(texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.md5(t.encode()).hexdigest() for t in texts]
+        found = stored_embeddings_by_hash(hashes, company_id)
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = text
+        if missing:
+            found.update(zip(missing, embed_fn(list(missing.values()))))
+
+        if usage is not None:
+            usage['reused'] = usage.get('reused', 0) + len(texts) - len(missing)
+            usage['embedded'] = usage.get('embedded', 0) + len(missing)
+
+        return [found[h] for h in hashes]
+
+    return embed
+
+# ========================================
+# COMPACT EMBEDDINGS (INT8 + RANDOM PROJECTION)
+# Optional - needs two extra columns, run once in the Supabase SQL editor:
+#   ALTER TABLE statements ADD COLUMN IF NOT EXISTS embedding_compact bytea;
+#   ALTER TABLE statements ADD COLUMN IF NOT EXISTS embedding_scale real;
+# Changing COMPACT_EMBEDDING_DIM / COMPACT_QUANTIZE invalidates stored codes:
+# re-run backfill_compact_embeddings(company_id, overwrite=True)
+# ========================================
+import numpy as np
+
+COMPACT_EMBEDDINGS = os.getenv('COMPACT_EMBEDDINGS', '0') == '1'         # Write compact columns on ingest
+COMPACT_EMBEDDING_DIM = int(os.getenv('COMPACT_EMBEDDING_DIM', '256'))   # 0 = keep all dimensions
+COMPACT_QUANTIZE = os.getenv('COMPACT_QUANTIZE', '1') == '1'             # int8 codes + per-vector scale
+COMPACT_PROJECTION_SEED = 1536   # Same matrix in every process, so stored codes stay comparable
+COMPACT_RERANK_FACTOR = 10       # Full-precision re-rank over k * factor compact candidates
+COMPACT_SCORE_CHUNK = 65536      # Rows scored per matmul (bounds the float32 temp)
+
+class CompactEmbeddingCodec:
+    """
+    Unit-normalize, optionally project to projected_dim with a fixed
+    Gaussian matrix (Johnson-Lindenstrauss), optionally quantize to int8
+    with a per-vector scale. Dot products of codes approximate cosine.
+    """
+
+    def __init__(self, projected_dim: int = COMPACT_EMBEDDING_DIM, quantize: bool = COMPACT_QUANTIZE,
+                 dim: int = EMBEDDING_COLUMN_DIM, seed: int = COMPACT_PROJECTION_SEED):
+        self.dim = dim
+        self.quantize = quantize
+        self.projection = None
+        if projected_dim and projected_dim < dim:
+            rng = np.random.default_rng(seed)
+            self.projection = (rng.standard_normal((dim, projected_dim)) / np.sqrt(projected_dim)).astype(np.float32)
+        self.code_dim = self.projection.shape[1] if self.projection is not None else dim
+        self.dtype = np.int8 if quantize else np.float32
+        self.name = f"{'p' + str(self.code_dim) if self.projection is not None else 'full'}{'+int8' if quantize else ''}"
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.code_dim * np.dtype(self.dtype).itemsize + (4 if self.quantize else 0)
+
+    def transform(self, vectors) -> np.ndarray:
+        """Normalized (and projected) float32 rows"""
+        x = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        x = x / norms
+        return x @ self.projection if self.projection is not None else x
+
+    def encode(self, vectors):
+        """-> (codes, scales)"""
+        x = self.transform(vectors)
+        if not self.quantize:
+            return x, np.ones(len(x), dtype=np.float32)
+        scales = np.abs(x).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def scores(self, query_embedding, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """Approximate cosine of the query against every code row"""
+        q = self.transform(query_embedding)[0]
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), COMPACT_SCORE_CHUNK):
+            chunk = codes[start:start + COMPACT_SCORE_CHUNK]
+            out[start:start + len(chunk)] = (chunk.astype(np.float32) @ q) * scales[start:start + len(chunk)]
+        return out
+
+    def to_columns(self, embedding) -> Dict:
+        """statements columns for one embedding (bytea as PostgREST hex)"""
+        codes, scales = self.encode(embedding)
+        return {'embedding_compact': '\\x' + codes[0].tobytes().hex(), 'embedding_scale': float(scales[0])}
+
+    def from_column(self, value) -> np.ndarray:
+        raw = bytes.fromhex(value[2:]) if isinstance(value, str) else bytes(value)
+        return np.frombuffer(raw, dtype=self.dtype)
+
+compact_codec = CompactEmbeddingCodec()
+
+def compact_embedding_columns(embedding) -> Dict:
+    """Extra statements columns for an embedding - empty unless COMPACT_EMBEDDINGS is on"""
+    if not COMPACT_EMBEDDINGS or embedding is None:
+        return {}
+    return compact_codec.to_columns(embedding)
+
+def parse_embedding(value) -> List[float]:
+    """pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings"""
+    return json.loads(value) if isinstance(value, str) else value
+
+def fetch_statement_embeddings(statement_ids: List[str], company_id: str) -> Dict[str, List[float]]:
+    """Full-precision embeddings for a handful of statements (re-rank input)"""
+    found = {}
+    for start in range(0, len(statement_ids), ID_LOOKUP_PAGE):
+        rows = supabase.table('statements').select('id, embedding')\
+            .in_('id', statement_ids[start:start + ID_LOOKUP_PAGE])\
+            .eq('company_id', company_id)\
+            .execute().data
+        for row in rows:
+            if row.get('embedding') is not None:
+                found[row['id']] = parse_embedding(row['embedding'])
+    return found
+
+def iter_company_rows(company_id: str, columns: str, page_size: int = HASH_LOOKUP_PAGE, source_file_id: str = None):
+    """Page through a company's statements (or one transcript's) in id order"""
+    start = 0
+    while True:
+        query = supabase.table('statements').select(columns)\
+            .eq('company_id', company_id)
+        if source_file_id:
+            query = query.eq('source_file_id', source_file_id)
+        rows = query.order('id')\
+            .range(start, start + page_size - 1)\
+            .execute().data
+        yield from rows
+        if len(rows) < page_size:
+            break
+        start += page_size
+
+class CompactCorpus:
+    """A tenant's statements as compact codes - search scores codes, re-ranks with full vectors"""
+
+    def __init__(self, ids: List[str], codes: np.ndarray, scales: np.ndarray, codec: CompactEmbeddingCodec = None):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.codec = codec or compact_codec
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def candidates(self, query_embedding, count: int):
+        """Top `count` rows by approximate score -> (row indexes, scores), best first"""
+        approx = self.codec.scores(query_embedding, self.codes, self.scales)
+        count = min(count, len(approx))
+        if count <= 0:
+            return np.array([], dtype=np.int64), approx[:0]
+        top = np.argpartition(-approx, count - 1)[:count]
+        top = top[np.argsort(-approx[top])]
+        return top, approx[top]
+
+    def search(self, query_embedding, k: int = 10, rerank: int = None, fetch_full=None):
+        """
+        [(statement_id, score)] best first. fetch_full(ids) -> {id: vector}
+        re-ranks the compact candidates with exact cosine; without it the
+        approximate scores are returned.
+        """
+        top, approx = self.candidates(query_embedding, rerank or k * COMPACT_RERANK_FACTOR)
+        if fetch_full is None:
+            return [(self.ids[i], float(score)) for i, score in zip(top[:k], approx[:k])]
+
+        candidate_ids = [self.ids[i] for i in top]
+        full = fetch_full(candidate_ids)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        exact = []
+        for statement_id in candidate_ids:
+            vector = full.get(statement_id)
+            if vector is None:
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            exact.append((statement_id, float(vector @ query / (np.linalg.norm(vector) or 1.0))))
+        exact.sort(key=lambda item: item[1], reverse=True)
+        return exact[:k]
+
+def load_compact_corpus(company_id: str, codec: CompactEmbeddingCodec = None, debug=False) -> CompactCorpus:
+    """
+    Stored compact columns for every statement of a company. Rows without
+    them (ingested before COMPACT_EMBEDDINGS, or another codec) are encoded
+    from the full embedding in memory.
+    """
+    codec = codec or compact_codec
+    ids, codes, scales, missing = [], [], [], []
+    stored_usable = codec is compact_codec
+
+    for row in iter_company_rows(company_id, 'id, embedding_compact, embedding_scale'):
+        if stored_usable and row.get('embedding_compact') is not None:
+            code = codec.from_column(row['embedding_compact'])
+            if len(code) == codec.code_dim:
+                ids.append(row['id'])
+                codes.append(code)
+                scales.append(row.get('embedding_scale') or 1.0)
+                continue
+        missing.append(row['id'])
+
+    if missing:
+        full = fetch_statement_embeddings(missing, company_id)
+        if full:
+            missing_ids = list(full)
+            missing_codes, missing_scales = codec.encode([full[i] for i in missing_ids])
+            ids.extend(missing_ids)
+            codes.extend(missing_codes)
+            scales.extend(missing_scales)
+
+    corpus = CompactCorpus(
+        ids,
+        np.vstack(codes).astype(codec.dtype) if codes else np.zeros((0, codec.code_dim), dtype=codec.dtype),
+        np.asarray(scales, dtype=np.float32),
+        codec
+    )
+    if debug:
+        print(f"🗜️ {company_id}: {len(ids)} statements as {codec.name} "
+              f"({corpus.nbytes / 1e6:.1f} MB, {len(missing)} encoded from full vectors)")
+    return corpus
+
+def compact_vector_search(query_embedding, company_id: str, k: int = 10, corpus: CompactCorpus = None) -> List:
+    """Compact search over a tenant's corpus with full-precision re-rank of the candidates"""
+    corpus = corpus or load_compact_corpus(company_id)
+    return corpus.search(query_embedding, k, fetch_full=lambda ids: fetch_statement_embeddings(ids, company_id))
+
+def backfill_compact_embeddings(company_id: str, overwrite: bool = False, debug=False) -> int:
+    """Write compact columns for statements stored without them (or all, after a codec change)"""
+    written = 0
+    for row in iter_company_rows(company_id, 'id, embedding, embedding_compact'):
+        if row.get('embedding') is None or (row.get('embedding_compact') is not None and not overwrite):
+            continue
+        supabase.table('statements').update(compact_codec.to_columns(parse_embedding(row['embedding'])))\
+            .eq('id', row['id']).execute()
+        written += 1
+        if debug and written % 500 == 0:
+            print(f"   🗜️ {written} statements compacted...")
+    if debug: print(f"✅ Compacted {written} statements for {company_id}")
+    return written
+
+COMPACT_REPORT_CONFIGS = [
+    (0, True),      # int8 only
+    (256, False),   # projection only
+    (256, True),    # projection + int8
+    (128, True),
+]
+
+def compact_recall_report(company_id: str, queries: List[str] = None, k: int = 10, sample: int = 50,
+                          configs=COMPACT_REPORT_CONFIGS) -> List[Dict]:
+    """
+    recall@k and latency of compact search (with and without re-rank)
+    against exact full-precision search over a tenant's corpus. Queries
+    default to a sample of the corpus' own statements. Re-rank latency is
+    in-memory (no round trip for the full vectors).
+    """
+    ids, vectors = [], []
+    for row in iter_company_rows(company_id, 'id, embedding'):
+        if row.get('embedding') is not None:
+            ids.append(row['id'])
+            vectors.append(parse_embedding(row['embedding']))
+    if not vectors:
+        print(f"❌ No embeddings for {company_id}")
+        return []
+
+    full = np.asarray(vectors, dtype=np.float32)
+    full /= np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+    k = min(k, len(ids))
+
+    if queries:
+        query_vectors = np.asarray([get_query_embedding(q, company_id=company_id) for q in queries], dtype=np.float32)
+    else:
+        rng = np.random.default_rng(0)
+        query_vectors = full[rng.choice(len(full), size=min(sample, len(full)), replace=False)]
+
+    def top_k(scores, count):
+        top = np.argpartition(-scores, count - 1)[:count]
+        return top[np.argsort(-scores[top])]
+
+    exact_times, truth = [], []
+    for q in query_vectors:
+        start = time.perf_counter()
+        truth.append(set(top_k(full @ q, k)))
+        exact_times.append(time.perf_counter() - start)
+
+    report = [{'codec': 'exact float32', 'bytes_per_vector': full.shape[1] * 4, 'corpus_mb': round(full.nbytes / 1e6, 2),
+               'recall_compact': 1.0, 'recall_reranked': 1.0,
+               'p50_ms_compact': round(float(np.median(exact_times)) * 1000, 2), 'p50_ms_reranked': None}]
+
+    for projected_dim, quantize in configs:
+        codec = CompactEmbeddingCodec(projected_dim, quantize)
+        codes, scales = codec.encode(full)
+        corpus = CompactCorpus(list(range(len(ids))), codes, scales, codec)
+
+        compact_hits = reranked_hits = 0
+        compact_times, reranked_times = [], []
+        for q, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            top, _ = corpus.candidates(q, k)
+            compact_times.append(time.perf_counter() - start)
+            compact_hits += len(expected & set(top))
+
+            start = time.perf_counter()
+            top, _ = corpus.candidates(q, k * COMPACT_RERANK_FACTOR)
+            reranked = top[top_k(full[top] @ q, min(k, len(top)))]
+            reranked_times.append(time.perf_counter() - start)
+            reranked_hits += len(expected & set(reranked))
+
+        total = k * len(query_vectors)
+        report.append({
+            'codec': codec.name,
+            'bytes_per_vector': codec.bytes_per_vector,
+            'corpus_mb': round(corpus.nbytes / 1e6, 2),
+            'recall_compact': round(compact_hits / total, 3),
+            'recall_reranked': round(reranked_hits / total, 3),
+            'p50_ms_compact': round(float(np.median(compact_times)) * 1000, 2),
+            'p50_ms_reranked': round(float(np.median(reranked_times)) * 1000, 2),
+        })
+
+    print(f"\n🗜️ COMPACT EMBEDDINGS - {company_id}: {len(ids)} statements, {len(query_vectors)} queries, k={k}")
+    print(f"{'codec':<14}{'bytes/vec':>10}{'MB':>8}{'recall':>9}{'+rerank':>9}{'p50 ms':>9}{'+rerank':>9}")
+    for row in report:
+        print(f"{row['codec']:<14}{row['bytes_per_vector']:>10}{row['corpus_mb']:>8}{row['recall_compact']:>9}"
+              f"{row['recall_reranked']:>9}{row['p50_ms_compact']:>9}{str(row['p50_ms_reranked'] or '-'):>9}")
+    return report
+
+# ========================================
+# ANN INDEX (PER-COMPANY IVF, IN PROCESS)
+# Coarse lists over the compact codes, exact re-rank over float16 vectors.
+# Loaded lazily (disk, else built from the statements table), kept current
+# by the ingest/delete hooks, persisted under ANN_INDEX_DIR.
+# ========================================
+ANN_INDEX_ENABLED = os.getenv('ANN_INDEX', '1') == '1'
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', '/content/ann_index')
+ANN_MIN_TRAIN = 2048          # Smaller corpora are scanned in full (still only the codes)
+ANN_NPROBE = 16               # Lists searched per query
+ANN_RERANK_CANDIDATES = 500   # Exact float16 re-rank pool (p256+int8 codes alone rank coarsely)
+ANN_KMEANS_ITERATIONS = 12
+ANN_KMEANS_SAMPLE = 20000
+ANN_RETRAIN_GROWTH = 4.0      # Retrain lists once the index has grown 4x since training
+ANN_COMPACT_DELETED = 0.25    # Drop deleted rows once they are a quarter of the index
+
+def company_index_path(root: str, company_id) -> str:
+    """Directory under root for a company's index files - the id reduced to a safe single path component"""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(company_id))
+    if not name.strip('.'):
+        name = name.replace('.', '_') or '_'   # '', '.' and '..' would point at root or its parent
+    return os.path.join(root, name)
+
+class IVFIndex:
+    """Inverted-file ANN index for one company's statement embeddings"""
+
+    def __init__(self, company_id: str, path: str = None, codec: CompactEmbeddingCodec = None):
+        self.company_id = company_id
+        self.path = path or company_index_path(ANN_INDEX_DIR, company_id)
+        self.codec = codec or compact_codec
+        self.lock = threading.RLock()
+        self.ids = []                 # Row -> statement id
+        self.row_of = {}              # Live statement id -> row
+        self.source_names = []        # source_file_id per source code
+        self.source_code = {}
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.vectors = np.zeros((0, self.codec.dim), dtype=np.float16)   # Normalized, for the exact re-rank
+        self.codes = np.zeros((0, self.codec.code_dim), dtype=self.codec.dtype)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def _dequantized(self, rows=slice(None)) -> np.ndarray:
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def _nearest_list(self, projected: np.ndarray) -> np.ndarray:
+        out = np.empty(len(projected), dtype=np.int32)
+        for start in range(0, len(projected), COMPACT_SCORE_CHUNK):
+            out[start:start + COMPACT_SCORE_CHUNK] = np.argmax(projected[start:start + COMPACT_SCORE_CHUNK] @ self.centroids.T, axis=1)
+        return out
+
+    def train(self):
+        """Spherical k-means over the live codes; small indexes stay a flat scan"""
+        with self.lock:
+            live = np.nonzero(self.alive)[0]
+            self.trained_size = len(live)
+            self._lists = None
+            if len(live) < ANN_MIN_TRAIN:
+                self.centroids = None
+                return
+
+            rng = np.random.default_rng(0)
+            nlist = int(min(4096, max(16, 4 * np.sqrt(len(live)))))
+            sample = self._dequantized(rng.choice(live, size=min(ANN_KMEANS_SAMPLE, len(live)), replace=False))
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(ANN_KMEANS_ITERATIONS):
+                nearest = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sample)
+                empty = ~np.bincount(nearest, minlength=nlist).astype(bool)
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]   # Re-seed empty lists
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+            self.centroids = centroids.astype(np.float32)
+            self.assign = self._nearest_list(self._dequantized())
+
+    def lists(self) -> Dict[int, np.ndarray]:
+        """List id -> rows (rebuilt after mutations)"""
+        if self._lists is None:
+            order = np.argsort(self.assign, kind='stable')
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = {i: order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))}
+        return self._lists
+
+    def add(self, statement_ids: List[str], embeddings, source_ids: List[str]):
+        """Append (or replace) statements"""
+        if not statement_ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(statement_ids), -1)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        codes, scales = self.codec.encode(vectors)
+
+        with self.lock:
+            self._remove_rows([self.row_of[i] for i in statement_ids if i in self.row_of])
+            for source_id in source_ids:
+                if source_id not in self.source_code:
+                    self.source_code[source_id] = len(self.source_names)
+                    self.source_names.append(source_id)
+
+            first = len(self.ids)
+            self.ids.extend(statement_ids)
+            self.row_of.update((statement_id, first + i) for i, statement_id in enumerate(statement_ids))
+            self.sources = np.concatenate([self.sources, np.asarray([self.source_code[s] for s in source_ids], dtype=np.int32)])
+            self.vectors = np.concatenate([self.vectors, vectors.astype(np.float16)])
+            self.codes = np.concatenate([self.codes, codes])
+            self.scales = np.concatenate([self.scales, scales])
+            self.alive = np.concatenate([self.alive, np.ones(len(statement_ids), dtype=bool)])
+            if self.centroids is not None:
+                self.assign = np.concatenate([self.assign, self._nearest_list(self._dequantized(slice(first, None)))])
+            self._lists = None
+
+            if len(self) >= ANN_MIN_TRAIN and len(self) > self.trained_size * ANN_RETRAIN_GROWTH:
+                self.train()
+
+    def _remove_rows(self, rows):
+        for row in rows:
+            if self.alive[row]:
+                self.alive[row] = False
+                self.row_of.pop(self.ids[row], None)
+
+    def remove(self, statement_ids: List[str] = None, source_id: str = None):
+        with self.lock:
+            if statement_ids:
+                self._remove_rows([self.row_of[i] for i in statement_ids if i in self.row_of])
+            if source_id is not None and source_id in self.source_code:
+                self._remove_rows(np.nonzero(self.alive & (self.sources == self.source_code[source_id]))[0])
+            if len(self.ids) and 1 - len(self) / len(self.ids) > ANN_COMPACT_DELETED:
+                self._compact()
+
+    def _compact(self):
+        keep = np.nonzero(self.alive)[0]
+        self.ids = [self.ids[row] for row in keep]
+        self.row_of = {statement_id: row for row, statement_id in enumerate(self.ids)}
+        self.sources, self.vectors = self.sources[keep], self.vectors[keep]
+        self.codes, self.scales = self.codes[keep], self.scales[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        if self.centroids is not None:
+            self.assign = self.assign[keep]
+        self._lists = None
+
+    def search(self, query_embedding, k: int = 10, source_id: str = None, nprobe: int = ANN_NPROBE,
+               rerank: int = None) -> List:
+        """[(statement_id, cosine)] best first"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self.lock:
+            if source_id is not None:
+                # One transcript is small - exact over its rows
+                if source_id not in self.source_code:
+                    return []
+                rows = np.nonzero(self.alive & (self.sources == self.source_code[source_id]))[0]
+                scores = self.vectors[rows].astype(np.float32) @ query
+                top = np.argsort(-scores)[:k]
+                return [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+            projected = self.codec.transform(query)[0]
+            if self.centroids is None:
+                rows = np.nonzero(self.alive)[0]
+            else:
+                probe = np.argsort(-(self.centroids @ projected))[:nprobe]
+                lists = self.lists()
+                rows = np.concatenate([lists[i] for i in probe])
+                rows = rows[self.alive[rows]]
+            if not len(rows):
+                return []
+
+            approx = (self.codes[rows].astype(np.float32) @ projected) * self.scales[rows]
+            count = min(len(rows), rerank or max(ANN_RERANK_CANDIDATES, k * COMPACT_RERANK_FACTOR))
+            candidates = rows[np.argpartition(-approx, count - 1)[:count]]
+            exact = self.vectors[candidates].astype(np.float32) @ query
+            top = np.argsort(-exact)[:k]
+            return [(self.ids[candidates[i]], float(exact[i])) for i in top]
+
+    def save(self):
+        """Atomic write of the whole index"""
+        with self.lock:
+            if len(self.ids) != len(self):
+                self._compact()
+            os.makedirs(self.path, exist_ok=True)
+            tmp = os.path.join(self.path, 'index.tmp.npz')
+            np.savez(tmp, sources=self.sources, vectors=self.vectors, codes=self.codes, scales=self.scales,
+                     assign=self.assign, centroids=self.centroids if self.centroids is not None else np.zeros((0, 0), np.float32))
+            meta = {'company_id': self.company_id, 'codec': self.codec.name, 'ids': self.ids,
+                    'source_names': self.source_names, 'trained_size': self.trained_size}
+            with open(os.path.join(self.path, 'meta.tmp.json'), 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self.path, 'index.npz'))
+            os.replace(os.path.join(self.path, 'meta.tmp.json'), os.path.join(self.path, 'meta.json'))
+
+    @classmethod
+    def load(cls, company_id: str, path: str = None):
+        """Index from disk, or None if missing / written with another codec"""
+        index = cls(company_id, path)
+        try:
+            with open(os.path.join(index.path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+            arrays = np.load(os.path.join(index.path, 'index.npz'))
+        except (OSError, ValueError):
+            return None
+        if meta['codec'] != index.codec.name or len(meta['ids']) != len(arrays['codes']):
+            return None
+
+        index.ids = meta['ids']
+        index.row_of = {statement_id: row for row, statement_id in enumerate(index.ids)}
+        index.source_names = meta['source_names']
+        index.source_code = {source_id: code for code, source_id in enumerate(index.source_names)}
+        index.trained_size = meta['trained_size']
+        index.sources, index.vectors = arrays['sources'], arrays['vectors']
+        index.codes, index.scales, index.assign = arrays['codes'], arrays['scales'], arrays['assign']
+        index.centroids = arrays['centroids'] if arrays['centroids'].size else None
+        index.alive = np.ones(len(index.ids), dtype=bool)
+        return index
+
+    @classmethod
+    def build(cls, company_id: str, path: str = None, debug=False):
+        """Full build from the statements table"""
+        start_time = time.time()
+        index = cls(company_id, path)
+        batch = []
+
+        def flush():
+            index.add([r['id'] for r in batch], [parse_embedding(r['embedding']) for r in batch],
+                      [r.get('source_file_id') for r in batch])
+            batch.clear()
+
+        for row in iter_company_rows(company_id, 'id, source_file_id, embedding'):
+            if row.get('embedding') is not None:
+                batch.append(row)
+                if len(batch) >= HASH_LOOKUP_PAGE:
+                    flush()
+        if batch:
+            flush()
+
+        index.train()
+        index.save()
+        if debug:
+            print(f"🧭 Built ANN index for {company_id}: {len(index)} statements, "
+                  f"{len(index.centroids) if index.centroids is not None else 0} lists in {time.time() - start_time:.1f}s")
+        return index
+
+ann_indexes = {}
+_ann_build_locks = defaultdict(threading.Lock)
+
+def ann_index_for(company_id: str, build: bool = True, debug=False):
+    """The company's index - from memory, else disk, else built from the database (build=True)"""
+    index = ann_indexes.get(company_id)
+    if index is not None:
+        return index
+    with _ann_build_locks[company_id]:
+        index = ann_indexes.get(company_id)
+        if index is None:
+            index = IVFIndex.load(company_id)
+            if index is None and build:
+                index = IVFIndex.build(company_id, debug=debug)
+            if index is not None:
+                ann_indexes[company_id] = index
+        return index
+
+def ann_refresh_source(company_id: str, source_file_id: str):
+    """Ingest hook: (re)index one transcript's statements if the company has an index"""
+    statement_metadata_cache.invalidate_source(company_id, source_file_id)
+    keyword_index_refresh_source(company_id, source_file_id)
+    if not ANN_INDEX_ENABLED or not company_id:
+        return
+    try:
+        index = ann_index_for(company_id, build=False)
+        if index is None:
+            return   # Built from the database (including this transcript) on first search
+        rows = [r for r in iter_company_rows(company_id, 'id, embedding', source_file_id=source_file_id)
+                if r.get('embedding') is not None]
+        with index.lock:
+            index.remove(source_id=source_file_id)
+            index.add([r['id'] for r in rows], [parse_embedding(r['embedding']) for r in rows],
+                      [source_file_id] * len(rows))
+            index.save()
+    except Exception as e:
+        print(f"⚠️ ANN index update failed for {source_file_id}: {e}")
+
+def ann_remove_source(company_id: str, source_file_id: str):
+    """Delete hook: drop one transcript from the company's index"""
+    statement_metadata_cache.invalidate_source(company_id, source_file_id)
+    keyword_index_remove_source(company_id, source_file_id)
+    if not ANN_INDEX_ENABLED:
+        return
+    try:
+        index = ann_index_for(company_id, build=False)
+        if index is not None:
+            with index.lock:
+                index.remove(source_id=source_file_id)
+                index.save()
+    except Exception as e:
+        print(f"⚠️ ANN index delete failed for {source_file_id}: {e}")
+
+def ann_vector_matches(query_embedding, company_id: str, k: int = 100, transcript_id: str = None) -> List[Dict]:
+    """match_statements-shaped results ([{'id', 'similarity'}]) from the in-process index"""
+    index = ann_index_for(company_id)
+    return [{'id': statement_id, 'similarity': score}
+            for statement_id, score in index.search(query_embedding, k, source_id=transcript_id)]
+
+def fetch_ranked_statements(matches: List[Dict], company_id: str,
+                            columns: str = '*, speakers(name), source_files(filename)') -> List[Dict]:
+    """Statement rows for vector matches, in match order, with 'similarity' attached"""
+    ids = [m['id'] for m in matches]
+    by_id = {}
+    for start in range(0, len(ids), ID_LOOKUP_PAGE):
+        rows = supabase.table('statements').select(columns)\
+            .in_('id', ids[start:start + ID_LOOKUP_PAGE])\
+            .eq('company_id', company_id)\
+            .execute().data
+        by_id.update((row['id'], row) for row in rows)
+    return [{**by_id[m['id']], 'similarity': m['similarity']} for m in matches if m['id'] in by_id]
+
+# ========================================
+# STATEMENT METADATA (ONE-ROUND-TRIP SEMANTIC SEARCH)
+# Vector matches come back with the fields the API shows. With the ANN
+# index, metadata comes from an in-process cache keyed by statement id;
+# otherwise one projected RPC does match + joins - run once in Supabase:
+#   CREATE OR REPLACE FUNCTION match_statements_projected(
+#     query_embedding vector(1536), match_threshold float, match_count int,
+#     company_id_filter text, transcript_id_filter uuid DEFAULT NULL)
+#   RETURNS TABLE (id uuid, similarity float, exact_quote text, time_code text, time_seconds float,
+#                  chunk_index int, context_before text, context_after text, source_file_id uuid,
+#                  speaker_id uuid, speaker_name text, speaker_normalized_name text, filename text)
+#   LANGUAGE sql STABLE AS $$
+#     SELECT s.id, 1 - (s.embedding <=> query_embedding), s.exact_quote, s.time_code, s.time_seconds,
+#            s.chunk_index, s.context_before, s.context_after, s.source_file_id,
+#            s.speaker_id, sp.name, sp.normalized_name, f.filename
+#     FROM statements s
+#     LEFT JOIN speakers sp ON sp.id = s.speaker_id
+#     LEFT JOIN source_files f ON f.id = s.source_file_id
+#     WHERE s.company_id = company_id_filter
+#       AND (transcript_id_filter IS NULL OR s.source_file_id = transcript_id_filter)
+#       AND 1 - (s.embedding <=> query_embedding) > match_threshold
+#     ORDER BY s.embedding <=> query_embedding
+#     LIMIT match_count;
+#   $$;
+# ========================================
+STATEMENT_METADATA_COLUMNS = ('id, exact_quote, time_code, time_seconds, chunk_index, context_before, context_after, '
+                              'source_file_id, speaker_id, speakers(id, name, normalized_name), source_files(id, filename)')
+STATEMENT_METADATA_CACHE_SIZE = int(os.getenv('STATEMENT_METADATA_CACHE_SIZE', '200000'))
+
+class StatementMetadataCache:
+    """LRU of statement display fields keyed by (company_id, statement id)"""
+
+    def __init__(self, max_entries: int = STATEMENT_METADATA_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.by_source = defaultdict(set)    # (company_id, source_file_id) -> statement ids
+        self.lock = threading.Lock()
+
+    def get_many(self, company_id: str, statement_ids: List[str]) -> Dict[str, Dict]:
+        found = {}
+        with self.lock:
+            for statement_id in statement_ids:
+                row = self.entries.get((company_id, statement_id))
+                if row is not None:
+                    self.entries.move_to_end((company_id, statement_id))
+                    found[statement_id] = row
+        return found
+
+    def put_many(self, company_id: str, rows: List[Dict]):
+        with self.lock:
+            for row in rows:
+                self.entries[(company_id, row['id'])] = row
+                self.entries.move_to_end((company_id, row['id']))
+                self.by_source[(company_id, row.get('source_file_id'))].add(row['id'])
+            while len(self.entries) > self.max_entries:
+                (evicted_company, evicted_id), evicted = self.entries.popitem(last=False)
+                self.by_source[(evicted_company, evicted.get('source_file_id'))].discard(evicted_id)
+
+    def invalidate_source(self, company_id: str, source_file_id: str):
+        with self.lock:
+            for statement_id in self.by_source.pop((company_id, source_file_id), ()):
+                self.entries.pop((company_id, statement_id), None)
+
+statement_metadata_cache = StatementMetadataCache()
+
+def fetch_statement_metadata(statement_ids: List[str], company_id: str) -> Dict[str, Dict]:
+    """Display fields for statements - cached, misses in one query"""
+    found = statement_metadata_cache.get_many(company_id, statement_ids)
+    missing = [statement_id for statement_id in statement_ids if statement_id not in found]
+    for start in range(0, len(missing), ID_LOOKUP_PAGE):
+        rows = supabase.table('statements').select(STATEMENT_METADATA_COLUMNS)\
+            .in_('id', missing[start:start + ID_LOOKUP_PAGE])\
+            .eq('company_id', company_id)\
+            .execute().data
+        statement_metadata_cache.put_many(company_id, rows)
+        found.update((row['id'], row) for row in rows)
+    return found
+
+def _projected_row(row: Dict) -> Dict:
+    """Flat match_statements_projected row -> the nested shape PostgREST joins return"""
+    statement = {key: row.get(key) for key in ('id', 'exact_quote', 'time_code', 'time_seconds', 'chunk_index',
+                                               'context_before', 'context_after', 'source_file_id', 'speaker_id')}
+    statement['speakers'] = {'id': row.get('speaker_id'), 'name': row.get('speaker_name'),
+                             'normalized_name': row.get('speaker_normalized_name')}
+    statement['source_files'] = {'id': row.get('source_file_id'), 'filename': row.get('filename')}
+    return statement
+
+def match_statements_with_metadata(query_embedding, company_id: str, transcript_id: str = None,
+                                   k: int = 100, threshold: float = 0.2, debug=False) -> List[Dict]:
+    """
+    Top-k statements with quote / time code / speaker / filename and
+    'similarity', best first. ANN index + metadata cache: no round trip
+    when warm. RPC path: one call to match_statements_projected (two via
+    the old match_statements if that function isn't installed).
+    """
+    start = time.perf_counter()
+
+    if ANN_INDEX_ENABLED:
+        try:
+            matches = [m for m in ann_vector_matches(query_embedding, company_id, k=k, transcript_id=transcript_id)
+                       if m['similarity'] > threshold]
+            metadata = fetch_statement_metadata([m['id'] for m in matches], company_id)
+            results = [{**metadata[m['id']], 'similarity': m['similarity']} for m in matches if m['id'] in metadata]
+            if debug:
+                print(f"🧭 ANN index + metadata cache: {len(results)} matches in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return results
+        except Exception as e:
+            print(f"⚠️ ANN index unavailable ({e}) - using match_statements RPC")
+
+    params = {
+        'query_embedding': query_embedding,
+        'match_threshold': threshold,
+        'match_count': k,
+        'company_id_filter': company_id,
+        'transcript_id_filter': transcript_id if transcript_id else None
+    }
+    try:
+        rows = supabase.rpc('match_statements_projected', params).execute().data
+        results = [{**_projected_row(row), 'similarity': row.get('similarity', 0)} for row in rows]
+        statement_metadata_cache.put_many(company_id, [_projected_row(row) for row in rows])
+        if debug:
+            print(f"📊 match_statements_projected: {len(results)} matches in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return results
+    except Exception as e:
+        if debug: print(f"⚠️ match_statements_projected unavailable ({e}) - two round trips")
+
+    matches = supabase.rpc('match_statements', params).execute().data
+    metadata = fetch_statement_metadata([m['id'] for m in matches], company_id)
+    if debug:
+        print(f"📊 match_statements + metadata: {len(matches)} matches in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return [{**metadata[m['id']], 'similarity': m.get('similarity', 0)} for m in matches if m['id'] in metadata]
+
+# ========================================
+# KEYWORD INDEX (PER-COMPANY POSITIONAL POSTINGS)
+# term -> statements with token positions and character spans. Resolves
+# what ilike('%...%') scans used to (phrase lookup, then the substring test
+# on just the candidates) and scores BM25 for hybrid search. Built on first
+# use or at ingest, kept current by the ingest/delete hooks, persisted
+# under KEYWORD_INDEX_DIR.
+# ========================================
+KEYWORD_INDEX_ENABLED = os.getenv('KEYWORD_INDEX', '1') == '1'
+KEYWORD_INDEX_DIR = os.getenv('KEYWORD_INDEX_DIR', '/content/keyword_index')
+KEYWORD_COMPACT_DELETED = 0.25   # Rebuild postings once a quarter of the rows are deleted
+KEYWORD_INDEX_VERSION = 2        # Saved indexes from other versions are rebuilt
+KEYWORD_INDEX_COLUMNS = 'id, exact_quote, source_file_id, time_seconds, speakers(name)'
+KEYWORD_FUZZY_PENALTY = 1.5      # Ranking cost per edit for typo-tolerant matches
+KEYWORD_VERIFY_PAGE = 50         # Candidates fetched + verified per round trip when results are limited
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+KEYWORD_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9'’]+")
+
+def tokenize_with_offsets(text: str) -> List[tuple]:
+    """[(term, start, end)] - lowercase alphanumeric terms, apostrophes dropped ("Jesse's" -> "jesses", like normalize_query)"""
+    terms = []
+    for match in KEYWORD_TOKEN_PATTERN.finditer(text or ''):
+        term = match.group().lower().replace("'", "").replace("’", "")
+        if term:
+            terms.append((term, match.start(), match.end()))
+    return terms
+
+def bm25_tokenize(text: str) -> List[str]:
+    return [term for term, _, _ in tokenize_with_offsets(text)]
+
+def term_trigrams(term: str) -> set:
+    """Distinct character trigrams of a term padded with '$' (so 'ab' still has grams)"""
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def fuzzy_max_distance(term: str) -> int:
+    """Edits tolerated for a query term: none under 4 characters, 1 up to 7, then 2"""
+    return 0 if len(term) < 4 else (1 if len(term) < 8 else 2)
+
+def bounded_edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance, or max_distance + 1 as soon as it's known to be larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+def _new_posting():
+    # rows, term frequency per row, then per occurrence: token position, char start, char end
+    return (array('i'), array('i'), array('i'), array('i'), array('i'))
+
+class KeywordIndex:
+    """Positional inverted index over one company's quotes; deleted rows are masked until compaction"""
+
+    def __init__(self, company_id: str, path: str = None):
+        self.company_id = company_id
+        self.path = path or company_index_path(KEYWORD_INDEX_DIR, company_id)
+        self.ids = []
+        self.row_of = {}
+        self.source_names = []
+        self.source_code = {}
+        self.sources = array('i')        # Per row: index into source_names
+        self.speaker_names = []
+        self.speaker_code = {}
+        self.speakers = array('i')       # Per row: index into speaker_names
+        self.times = array('d')          # Per row: time_seconds (nan if unknown)
+        self.doc_lengths = array('i')
+        self.alive = bytearray()
+        self.postings = defaultdict(_new_posting)
+        self.term_grams = defaultdict(set)   # Trigram -> vocabulary terms containing it
+        self.alive_count = 0
+        self.alive_length = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return self.alive_count
+
+    def _index_grams(self, terms):
+        for term in terms:
+            for gram in term_trigrams(term):
+                self.term_grams[gram].add(term)
+
+    def add(self, statement_ids: List[str], texts: List[str], source_ids: List[str],
+            speakers: List[str] = None, times: List[float] = None):
+        speakers = speakers or [None] * len(statement_ids)
+        times = times or [None] * len(statement_ids)
+        with self.lock:
+            self.remove(statement_ids)
+            for statement_id, text, source_id, speaker, time_seconds in zip(statement_ids, texts, source_ids,
+                                                                             speakers, times):
+                row = len(self.ids)
+                occurrences = defaultdict(list)
+                tokens = tokenize_with_offsets(text)
+                for position, (term, start, end) in enumerate(tokens):
+                    occurrences[term].append((position, start, end))
+                self._index_grams([term for term in occurrences if term not in self.postings])
+                for term, spans in occurrences.items():
+                    rows, tfs, positions, starts, ends = self.postings[term]
+                    rows.append(row)
+                    tfs.append(len(spans))
+                    for position, start, end in spans:
+                        positions.append(position)
+                        starts.append(start)
+                        ends.append(end)
+                if source_id not in self.source_code:
+                    self.source_code[source_id] = len(self.source_names)
+                    self.source_names.append(source_id)
+                self.ids.append(statement_id)
+                self.row_of[statement_id] = row
+                if speaker not in self.speaker_code:
+                    self.speaker_code[speaker] = len(self.speaker_names)
+                    self.speaker_names.append(speaker)
+                self.sources.append(self.source_code[source_id])
+                self.speakers.append(self.speaker_code[speaker])
+                self.times.append(float('nan') if time_seconds is None else float(time_seconds))
+                self.doc_lengths.append(len(tokens))
+                self.alive.append(1)
+                self.alive_count += 1
+                self.alive_length += len(tokens)
+
+    def remove(self, statement_ids: List[str] = None, source_id: str = None):
+        with self.lock:
+            if source_id is not None:
+                rows = np.flatnonzero(self._searchable(source_id)).tolist()
+            else:
+                rows = [self.row_of[i] for i in statement_ids or [] if i in self.row_of]
+            for row in rows:
+                self.alive[row] = 0
+                self.alive_count -= 1
+                self.alive_length -= self.doc_lengths[row]
+                del self.row_of[self.ids[row]]
+            if self.ids and (len(self.ids) - self.alive_count) / len(self.ids) > KEYWORD_COMPACT_DELETED:
+                self._compact()
+
+    def _compact(self):
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        new_row = np.cumsum(alive) - 1
+        postings = defaultdict(_new_posting)
+        for term, (rows, tfs, positions, starts, ends) in self.postings.items():
+            rows_np, tfs_np = np.frombuffer(rows, dtype=np.int32), np.frombuffer(tfs, dtype=np.int32)
+            keep_rows = alive[rows_np]
+            if not keep_rows.any():
+                continue
+            keep_occurrences = np.repeat(keep_rows, tfs_np)
+            postings[term] = tuple(array('i', column.astype(np.int32).tobytes()) for column in (
+                new_row[rows_np[keep_rows]], tfs_np[keep_rows],
+                np.frombuffer(positions, dtype=np.int32)[keep_occurrences],
+                np.frombuffer(starts, dtype=np.int32)[keep_occurrences],
+                np.frombuffer(ends, dtype=np.int32)[keep_occurrences]))
+        alive_rows = np.flatnonzero(alive).tolist()
+        self.postings = postings
+        self.term_grams = defaultdict(set)
+        self._index_grams(postings)
+        self.ids = [self.ids[row] for row in alive_rows]
+        self.sources = array('i', np.frombuffer(self.sources, dtype=np.int32)[alive].tobytes())
+        self.speakers = array('i', np.frombuffer(self.speakers, dtype=np.int32)[alive].tobytes())
+        self.times = array('d', np.frombuffer(self.times, dtype=np.float64)[alive].tobytes())
+        self.doc_lengths = array('i', np.frombuffer(self.doc_lengths, dtype=np.int32)[alive].tobytes())
+        self.alive = bytearray([1]) * len(alive_rows)
+        self.row_of = {statement_id: row for row, statement_id in enumerate(self.ids)}
+
+    def _searchable(self, source_id: str = None) -> np.ndarray:
+        """Per row: alive (and from source_id, if given)"""
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        if source_id is not None:
+            code = self.source_code.get(source_id, -1)
+            alive &= np.frombuffer(self.sources, dtype=np.int32) == code
+        return alive
+
+    def bm25(self, query: str, k: int = 100, source_id: str = None) -> List[tuple]:
+        """[(statement_id, bm25 score)], best first"""
+        terms = set(bm25_tokenize(query))
+        with self.lock:
+            if not terms or not self.alive_count:
+                return []
+            scores = self.bm25_scores(terms, self._searchable(source_id))
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            hits = hits[np.argsort(-scores[hits], kind='stable')]
+            return [(self.ids[row], float(scores[row])) for row in hits.tolist()]
+
+    def bm25_scores(self, terms, searchable: np.ndarray) -> np.ndarray:
+        """Per row BM25 of the terms (0 outside `searchable`)"""
+        with self.lock:
+            scores = np.zeros(len(self.ids))
+            if not self.alive_count:
+                return scores
+            alive = self._searchable()
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+            average_length = max(self.alive_length / self.alive_count, 1e-9)
+
+            for term in terms:
+                if term not in self.postings:
+                    continue
+                rows, tfs = self.postings[term][:2]
+                rows = np.frombuffer(rows, dtype=np.int32)
+                df = int(np.count_nonzero(alive[rows]))   # Corpus statistics ignore the transcript filter
+                rows_mask = searchable[rows]
+                if not df or not rows_mask.any():
+                    continue
+                idf = np.log(1 + (self.alive_count - df + 0.5) / (df + 0.5))
+                tfs = np.frombuffer(tfs, dtype=np.int32)[rows_mask].astype(np.float64)
+                rows = rows[rows_mask]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[rows] / average_length)
+                scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+            return scores
+
+    def _occurrences(self, terms: List[str], costs: Dict[str, int] = None):
+        """(rows, positions, starts, ends, costs) of every occurrence of any of the terms"""
+        columns = [[], [], [], [], []]
+        for term in terms:
+            rows, tfs, positions, starts, ends = self.postings[term]
+            columns[0].append(np.repeat(np.frombuffer(rows, dtype=np.int32), np.frombuffer(tfs, dtype=np.int32)))
+            for column, values in zip(columns[1:4], (positions, starts, ends)):
+                column.append(np.frombuffer(values, dtype=np.int32))
+            columns[4].append(np.full(len(positions), (costs or {}).get(term, 0), dtype=np.int32))
+        if not terms:
+            return tuple(np.zeros(0, dtype=np.int32) for _ in columns)
+        return tuple(np.concatenate(column) for column in columns)
+
+    def term_spans(self, statement_ids: List[str], terms) -> Dict[str, List[tuple]]:
+        """{statement_id: [(start, end), ...]} - every occurrence of the terms in those statements, in order"""
+        with self.lock:
+            wanted = np.array(sorted(self.row_of[i] for i in statement_ids if i in self.row_of), dtype=np.int32)
+            rows, _, starts, ends, _ = self._occurrences([term for term in set(terms) if term in self.postings])
+            keep = np.isin(rows, wanted)
+            rows, starts, ends = rows[keep], starts[keep], ends[keep]
+            order = np.lexsort((starts, rows))
+            spans = defaultdict(list)
+            for row, start, end in zip(rows[order].tolist(), starts[order].tolist(), ends[order].tolist()):
+                spans[self.ids[row]].append((start, end))
+            return dict(spans)
+
+    def phrase_spans(self, slots: List[List[str]], source_id: str = None, slot_costs: List[Dict[str, int]] = None) -> tuple:
+        """
+        Occurrences of consecutive slots (slot i: any of its terms at
+        position p + i) as arrays (rows, first position, last position,
+        char start, char end, cost), ordered by row then position. cost is
+        the sum of the matched terms' slot_costs (0 without them).
+        """
+        slot_costs = slot_costs or [None] * len(slots)
+        with self.lock:
+            stride = int(np.frombuffer(self.doc_lengths, dtype=np.int32).max(initial=0)) + len(slots) + 1
+            slot_keys, slot_values = [], []
+            matched = None
+            for offset, (terms, costs) in enumerate(zip(slots, slot_costs)):
+                rows, positions, starts, ends, term_costs = self._occurrences(terms, costs)
+                keys = rows.astype(np.int64) * stride + positions - offset
+                order = np.argsort(keys)   # One term per (row, position), so keys are unique
+                slot_keys.append(keys[order])
+                slot_values.append((starts[order], ends[order], term_costs[order]))
+                matched = slot_keys[-1] if matched is None else np.intersect1d(matched, slot_keys[-1], assume_unique=True)
+
+            matched_rows = matched // stride
+            keep = self._searchable(source_id)[matched_rows]
+            matched, matched_rows = matched[keep], matched_rows[keep]
+            at = [np.searchsorted(keys, matched) for keys in slot_keys]
+            starts = slot_values[0][0][at[0]]
+            ends = slot_values[-1][1][at[-1]]
+            cost = sum(values[2][where].astype(np.int64) for values, where in zip(slot_values, at))
+            first = matched - matched_rows * stride
+            return matched_rows, first, first + len(slots) - 1, starts, ends, cost
+
+    def fuzzy_terms(self, term: str, max_distance: int) -> Dict[str, int]:
+        """{vocabulary term: edit distance} within max_distance of `term` - trigram count filter, then bounded Levenshtein"""
+        with self.lock:
+            if max_distance <= 0:
+                return {term: 0} if term in self.postings else {}
+            grams = term_trigrams(term)
+            needed = len(grams) - 3 * max_distance   # Each edit destroys at most 3 trigrams
+            if needed <= 0:
+                candidates = [t for t in self.postings if abs(len(t) - len(term)) <= max_distance]
+            else:
+                shared = Counter()
+                for gram in grams:
+                    shared.update(self.term_grams.get(gram, ()))
+                candidates = [t for t, count in shared.items()
+                              if count >= needed and abs(len(t) - len(term)) <= max_distance]
+            found = {}
+            for candidate in candidates:
+                distance = bounded_edit_distance(term, candidate, max_distance)
+                if distance <= max_distance:
+                    found[candidate] = distance
+            return found
+
+    def phrase_matches(self, text: str, source_id: str = None):
+        """
+        {statement_id: [(start, end), ...]} for rows that may contain `text`
+        as a case-insensitive substring - a superset of what
+        ilike('%text%') returns: the first term may end a longer word, the
+        last may start one, a single term may sit anywhere inside a word.
+        None if `text` has nothing indexable.
+        """
+        query_terms = [term for term, _, _ in tokenize_with_offsets(text)]
+        if not query_terms:
+            return None
+        with self.lock:
+            vocabulary = list(self.postings)
+            if len(query_terms) == 1:
+                slots = [[term for term in vocabulary if query_terms[0] in term]]
+            else:
+                slots = [[term for term in vocabulary if term.endswith(query_terms[0])]]
+                slots += [[term] if term in self.postings else [] for term in query_terms[1:-1]]
+                slots.append([term for term in vocabulary if term.startswith(query_terms[-1])])
+            rows, _, _, starts, ends, _ = self.phrase_spans(slots, source_id)
+
+            spans = {}
+            for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+                spans.setdefault(self.ids[row], []).append((start, end))
+            return spans
+
+    def save(self):
+        """Atomic write of the whole index"""
+        with self.lock:
+            if len(self.ids) != len(self):
+                self._compact()
+            terms = list(self.postings)
+            columns = [[], [], [], [], []]
+            for term in terms:
+                for column, values in zip(columns, self.postings[term]):
+                    column.append(np.frombuffer(values, dtype=np.int32))
+            rows, tfs, positions, starts, ends = (np.concatenate(column) if column else np.zeros(0, np.int32)
+                                                  for column in columns)
+            os.makedirs(self.path, exist_ok=True)
+            tmp = os.path.join(self.path, 'index.tmp.npz')
+            np.savez(tmp, rows=rows, tfs=tfs, positions=positions, starts=starts, ends=ends,
+                     doc_counts=np.asarray([len(self.postings[t][0]) for t in terms], dtype=np.int64),
+                     doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.int32),
+                     sources=np.frombuffer(self.sources, dtype=np.int32),
+                     speakers=np.frombuffer(self.speakers, dtype=np.int32),
+                     times=np.frombuffer(self.times, dtype=np.float64))
+            meta = {'version': KEYWORD_INDEX_VERSION, 'company_id': self.company_id, 'ids': self.ids,
+                    'source_names': self.source_names, 'speaker_names': self.speaker_names, 'terms': terms}
+            with open(os.path.join(self.path, 'meta.tmp.json'), 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self.path, 'index.npz'))
+            os.replace(os.path.join(self.path, 'meta.tmp.json'), os.path.join(self.path, 'meta.json'))
+
+    @classmethod
+    def load(cls, company_id: str, path: str = None):
+        """Index from disk, or None if missing / unreadable"""
+        index = cls(company_id, path)
+        try:
+            with open(os.path.join(index.path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+            arrays = np.load(os.path.join(index.path, 'index.npz'))
+            if meta.get('version') != KEYWORD_INDEX_VERSION:
+                return None
+            doc_counts, tfs = arrays['doc_counts'], arrays['tfs']
+            if len(meta['ids']) != len(arrays['doc_lengths']) or len(doc_counts) != len(meta['terms']):
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        doc_bounds = np.concatenate([[0], np.cumsum(doc_counts)])
+        occurrence_bounds = np.concatenate([[0], np.cumsum(tfs)])[doc_bounds]
+        rows, positions, starts, ends = arrays['rows'], arrays['positions'], arrays['starts'], arrays['ends']
+        for i, term in enumerate(meta['terms']):
+            d0, d1, o0, o1 = doc_bounds[i], doc_bounds[i + 1], occurrence_bounds[i], occurrence_bounds[i + 1]
+            index.postings[term] = (array('i', rows[d0:d1].tobytes()), array('i', tfs[d0:d1].tobytes()),
+                                    array('i', positions[o0:o1].tobytes()), array('i', starts[o0:o1].tobytes()),
+                                    array('i', ends[o0:o1].tobytes()))
+        index.ids = meta['ids']
+        index.row_of = {statement_id: row for row, statement_id in enumerate(index.ids)}
+        index.source_names = meta['source_names']
+        index.source_code = {source_id: code for code, source_id in enumerate(index.source_names)}
+        index.sources = array('i', arrays['sources'].astype(np.int32).tobytes())
+        index.speaker_names = meta['speaker_names']
+        index.speaker_code = {speaker: code for code, speaker in enumerate(index.speaker_names)}
+        index.speakers = array('i', arrays['speakers'].astype(np.int32).tobytes())
+        index.times = array('d', arrays['times'].astype(np.float64).tobytes())
+        index.doc_lengths = array('i', arrays['doc_lengths'].astype(np.int32).tobytes())
+        index._index_grams(index.postings)
+        index.alive = bytearray([1]) * len(index.ids)
+        index.alive_count = len(index.ids)
+        index.alive_length = int(arrays['doc_lengths'].sum())
+        return index
+
+    @classmethod
+    def build(cls, company_id: str, path: str = None, debug=False):
+        """Full build from the statements table"""
+        start_time = time.time()
+        index = cls(company_id, path)
+        index.add(*_keyword_index_fields(list(iter_company_rows(company_id, KEYWORD_INDEX_COLUMNS))))
+        index.save()
+        if debug:
+            print(f"📚 Built keyword index for {company_id}: {len(index)} statements, "
+                  f"{len(index.postings)} terms in {time.time() - start_time:.1f}s")
+        return index
+
+def _keyword_index_fields(rows: List[Dict]) -> tuple:
+    """KEYWORD_INDEX_COLUMNS rows -> KeywordIndex.add arguments"""
+    return ([r['id'] for r in rows], [r.get('exact_quote') or '' for r in rows], [r.get('source_file_id') for r in rows],
+            [(r.get('speakers') or {}).get('name') for r in rows], [r.get('time_seconds') for r in rows])
+
+keyword_indexes = {}
+_keyword_build_locks = defaultdict(threading.Lock)
+
+def keyword_index_for(company_id: str, build: bool = True, debug=False):
+    """The company's keyword index - from memory, else disk, else built from the database (build=True)"""
+    index = keyword_indexes.get(company_id)
+    if index is not None:
+        return index
+    with _keyword_build_locks[company_id]:
+        index = keyword_indexes.get(company_id)
+        if index is None:
+            index = KeywordIndex.load(company_id)
+            if index is None and build:
+                index = KeywordIndex.build(company_id, debug=debug)
+            if index is not None:
+                keyword_indexes[company_id] = index
+        return index
+
+def keyword_index_refresh_source(company_id: str, source_file_id: str):
+    """Ingest hook: (re)index one transcript's quotes, building the company's index if it has none yet"""
+    if not KEYWORD_INDEX_ENABLED or not company_id:
+        return
+    try:
+        index = keyword_index_for(company_id, build=False)
+        if index is None:
+            keyword_index_for(company_id)   # Full build already includes this transcript
+            return
+        rows = list(iter_company_rows(company_id, KEYWORD_INDEX_COLUMNS, source_file_id=source_file_id))
+        with index.lock:
+            index.remove(source_id=source_file_id)
+            index.add(*_keyword_index_fields(rows))
+            index.save()
+    except Exception as e:
+        print(f"⚠️ Keyword index update failed for {source_file_id}: {e}")
+
+def keyword_index_remove_source(company_id: str, source_file_id: str):
+    """Delete hook: drop one transcript from the company's keyword index"""
+    if not KEYWORD_INDEX_ENABLED:
+        return
+    try:
+        index = keyword_index_for(company_id, build=False)
+        if index is not None:
+            with index.lock:
+                index.remove(source_id=source_file_id)
+                index.save()
+    except Exception as e:
+        print(f"⚠️ Keyword index delete failed for {source_file_id}: {e}")
+
+def keyword_index_search(variations: List[str], company_id: str, transcript_id: str = None,
+                         limit: int = None, debug=False):
+    """
+    Statement rows (STATEMENT_METADATA_COLUMNS) whose quote contains any of
+    the variations, case-insensitively - the rows ilike('%variation%')
+    returns, from postings instead of a table scan, ordered by time_seconds
+    (nulls last). With a limit, candidates are fetched and verified a page
+    at a time until limit rows are found. None when the index can't answer
+    (disabled, unavailable, nothing indexable) so callers can fall back to
+    ILIKE.
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    start = time.perf_counter()
+    needles = [variation.lower() for variation in variations]
+    rows, fetched = [], 0
+    try:
+        index = keyword_index_for(company_id, debug=debug)
+        candidates = {}
+        for variation in variations:
+            spans = index.phrase_matches(variation, source_id=transcript_id)
+            if spans is None:
+                return None
+            candidates.update(spans)
+
+        # Same order as .order('time_seconds') - from the index, before any row is fetched
+        with index.lock:
+            times = {statement_id: index.times[index.row_of[statement_id]] if statement_id in index.row_of else float('nan')
+                     for statement_id in candidates}
+        ordered = sorted(candidates, key=lambda statement_id: (bool(np.isnan(times[statement_id])),
+                                                               np.nan_to_num(times[statement_id])))
+
+        page_size = max(KEYWORD_VERIFY_PAGE, limit) if limit else max(len(ordered), 1)
+        for page_start in range(0, len(ordered), page_size):
+            page = ordered[page_start:page_start + page_size]
+            metadata = fetch_statement_metadata(page, company_id)
+            fetched += len(page)
+            rows.extend(metadata[statement_id] for statement_id in page
+                        if statement_id in metadata and any(n in (metadata[statement_id].get('exact_quote') or '').lower() for n in needles))
+            if limit and len(rows) >= limit:
+                rows = rows[:limit]
+                break
+    except Exception as e:
+        print(f"⚠️ Keyword index unavailable ({e}) - using ILIKE")
+        return None
+
+    if debug:
+        print(f"📚 Keyword index: {len(rows)} matches ({fetched} of {len(candidates)} candidates fetched) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return rows
+
+def fuzzy_keyword_matches(query: str, company_id: str, transcript_id: str = None, debug=False):
+    """
+    Typo-tolerant lookup in one pass over the postings: each query term
+    expands to its substring/prefix/suffix matches (cost 0, as ILIKE) plus
+    vocabulary terms within fuzzy_max_distance edits (trigram index).
+    {statement_id: {'edit_distance', 'match_spans', 'best_span'}} with
+    character offsets into exact_quote (best_span: the fewest edits).
+    None if the index can't answer.
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    start = time.perf_counter()
+    try:
+        index = keyword_index_for(company_id, debug=debug)
+        query_terms = bm25_tokenize(query)
+        if not query_terms:
+            return None
+        with index.lock:
+            vocabulary = list(index.postings)
+            slot_costs = []
+            for i, term in enumerate(query_terms):
+                costs = index.fuzzy_terms(term, fuzzy_max_distance(term))
+                if len(query_terms) == 1:
+                    exact = [t for t in vocabulary if term in t]
+                elif i == 0:
+                    exact = [t for t in vocabulary if t.endswith(term)]
+                elif i == len(query_terms) - 1:
+                    exact = [t for t in vocabulary if t.startswith(term)]
+                else:
+                    exact = [term] if term in index.postings else []
+                costs.update((t, 0) for t in exact)
+                slot_costs.append(costs)
+            rows, first, _, starts, ends, cost = index.phrase_spans([list(costs) for costs in slot_costs],
+                                                                    transcript_id, slot_costs)
+            ids = [index.ids[row] for row in rows.tolist()]
+    except Exception as e:
+        print(f"⚠️ Keyword index unavailable ({e}) - using ILIKE")
+        return None
+
+    matches = {}
+    for statement_id, span_start, span_end, span_cost in zip(ids, starts.tolist(), ends.tolist(), cost.tolist()):
+        match = matches.setdefault(statement_id, {'edit_distance': span_cost, 'match_spans': [], 'best_span': (span_start, span_end)})
+        match['match_spans'].append((span_start, span_end))
+        if span_cost < match['edit_distance']:
+            match['edit_distance'], match['best_span'] = span_cost, (span_start, span_end)
+    if debug:
+        expanded = {term: sorted(t for t, c in costs.items() if c) for term, costs in zip(query_terms, slot_costs)}
+        print(f"🔤 Fuzzy lookup {expanded}: {len(matches)} statements in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return matches
+
+# ========================================
+# KEYWORD QUERY LANGUAGE (EVALUATED ON POSTINGS)
+#   "left the truck"          phrase - terms adjacent, in order
+#   gun NEAR/5 truck          within 5 words of each other, either order
+#   gun AND truck / gun truck both (AND is implicit)
+#   gun OR knife, gun NOT truck, gun -truck, ( ... )
+#   truck*                    prefix
+#   speaker:jesse  speaker:"jc hallman"   speaker name contains
+#   after:00:10:00  before:1:05:00        statement time window
+# Matches are span arrays from the positional postings - no quote text is
+# scanned, so cost follows the posting list sizes. Ranked by BM25 of the
+# positive terms plus a proximity bonus for tight phrase/NEAR spans.
+# A query switches to the language on its own only if it has a quoted
+# phrase, NEAR/n or a field: filter - parentheses, AND/OR/NOT, -word and
+# word* also occur in plain text, so on their own they need syntax=True.
+# ========================================
+KEYWORD_PROXIMITY_WEIGHT = 2.0
+KEYWORD_QUERY_MAX_DEPTH = 32   # Nested ( / NOT levels - the parser recurses once per level
+
+class KeywordQueryError(ValueError):
+    """A keyword query the parser refuses (reported to the caller, not retried as plain text)"""
+
+_KEYWORD_QUERY_SYNTAX = re.compile(r'"[^"]*"|\bNEAR/\d+\b|\b(?i:speaker|after|before):\S')
+_KEYWORD_QUERY_TOKEN = re.compile(r"""
+    (?P<open>\() | (?P<close>\)) |
+    (?P<filter>(?i:speaker|after|before)):(?:"(?P<quoted_value>[^"]*)"?|(?P<value>[^\s()"]*)) |
+    "(?P<phrase>[^"]*)"? |
+    NEAR/(?P<near>\d+)(?=[\s()"]|$) |
+    (?P<op>AND|OR|NOT)(?=[\s()"]|$) |
+    (?P<minus>-)(?=[^\s-]) |
+    (?P<word>[^\s()"]+)
+""", re.X)
+
+def is_keyword_query(query: str, syntax: bool = None) -> bool:
+    """
+    True if the query should go to the query language (plain text keeps
+    substring matching). syntax=True / False forces it either way; None
+    only detects the unambiguous markers.
+    """
+    if syntax is not None:
+        return bool(syntax) and bool((query or '').strip())
+    return bool(_KEYWORD_QUERY_SYNTAX.search((query or '').replace('“', '"').replace('”', '"')))
+
+def _query_seconds(value: str):
+    value = value.strip()
+    if value.replace('.', '', 1).isdigit():
+        return float(value)
+    return float(time_to_seconds(value)) if ':' in value else None
+
+def parse_keyword_query(query: str) -> tuple:
+    """
+    (node, filters). Nodes are tuples: ('phrase', terms, prefix),
+    ('near', left, right, n), ('and', [nodes]), ('or', [nodes]),
+    ('not', node); None for nothing searchable. Lenient - unbalanced
+    quotes/parentheses and dangling operators are ignored - except nesting
+    deeper than KEYWORD_QUERY_MAX_DEPTH, which raises KeywordQueryError.
+    """
+    tokens = list(_KEYWORD_QUERY_TOKEN.finditer((query or '').replace('“', '"').replace('”', '"')))
+    filters = {'speaker': [], 'after': None, 'before': None}
+    position = 0
+    depth = 0
+
+    def nested(parse):
+        nonlocal depth
+        if depth >= KEYWORD_QUERY_MAX_DEPTH:
+            raise KeywordQueryError(f"Query nests parentheses/NOT more than {KEYWORD_QUERY_MAX_DEPTH} levels deep")
+        depth += 1
+        try:
+            return parse()
+        finally:
+            depth -= 1
+
+    def peek(kind, value=None):
+        if position >= len(tokens) or tokens[position].group(kind) is None:
+            return False
+        return value is None or tokens[position].group(kind) == value
+
+    def parse_or():
+        nonlocal position
+        nodes = [parse_and()]
+        while peek('op', 'OR'):
+            position += 1
+            nodes.append(parse_and())
+        nodes = [node for node in nodes if node is not None]
+        return nodes[0] if len(nodes) == 1 else (('or', nodes) if nodes else None)
+
+    def parse_and():
+        nonlocal position
+        nodes = []
+        while position < len(tokens) and not peek('op', 'OR') and not peek('close'):
+            if peek('op', 'AND'):
+                position += 1
+                continue
+            nodes.append(parse_unary())
+        nodes = [node for node in nodes if node is not None]
+        return nodes[0] if len(nodes) == 1 else (('and', nodes) if nodes else None)
+
+    def parse_unary():
+        nonlocal position
+        if peek('op', 'NOT') or peek('minus'):
+            position += 1
+            node = nested(parse_unary)
+            return ('not', node) if node is not None else None
+        return parse_near()
+
+    def parse_near():
+        nonlocal position
+        node = parse_primary()
+        while peek('near'):
+            distance = int(tokens[position].group('near'))
+            position += 1
+            right = parse_primary()
+            if node is None or right is None:
+                node = node if right is None else right
+            else:
+                node = ('near', node, right, distance)
+        return node
+
+    def parse_primary():
+        nonlocal position
+        if position >= len(tokens):
+            return None
+        token = tokens[position]
+        position += 1
+        if token.group('open'):
+            node = nested(parse_or)
+            if peek('close'):
+                position += 1
+            return node
+        if token.group('filter'):
+            field = token.group('filter').lower()
+            value = token.group('quoted_value') if token.group('quoted_value') is not None else token.group('value')
+            if field == 'speaker' and value.strip():
+                filters['speaker'].append(value.strip().lower())
+            elif field in ('after', 'before') and _query_seconds(value) is not None:
+                filters[field] = _query_seconds(value)
+            return None
+        text = token.group('phrase') if token.group('phrase') is not None else token.group('word')
+        if text is None:
+            return None   # Stray ')' / operator
+        terms = bm25_tokenize(text)
+        return ('phrase', terms, token.group('word') is not None and text.endswith('*')) if terms else None
+
+    node = parse_or()
+    while position < len(tokens):   # Text after a stray ')'
+        position += 1
+        rest = parse_or()
+        node = rest if node is None else (node if rest is None else ('and', [node, rest]))
+    return node, filters
+
+class KeywordMatches:
+    """Match spans as parallel arrays ordered by row, then position; first == -1 marks a row matched without a span"""
+
+    def __init__(self, rows, first, last, starts, ends, terms):
+        order = np.lexsort((first, rows))
+        self.rows, self.first, self.last = rows[order], first[order], last[order]
+        self.starts, self.ends, self.terms = starts[order], ends[order], terms[order]
+
+    @classmethod
+    def empty(cls):
+        nothing = np.zeros(0, dtype=np.int64)
+        return cls(nothing, nothing, nothing, nothing, nothing, nothing)
+
+    @classmethod
+    def whole_rows(cls, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        none = np.full(len(rows), -1, dtype=np.int64)
+        return cls(rows, none, none, none, none, np.zeros(len(rows), dtype=np.int64))
+
+    @classmethod
+    def concat(cls, parts):
+        parts = list(parts)
+        if not parts:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(part, field) for part in parts])
+                     for field in ('rows', 'first', 'last', 'starts', 'ends', 'terms')))
+
+    def unique_rows(self):
+        return np.unique(self.rows)
+
+    def keep_rows(self, mask):
+        return KeywordMatches(self.rows[mask], self.first[mask], self.last[mask],
+                              self.starts[mask], self.ends[mask], self.terms[mask])
+
+def _evaluate_keyword_node(index: KeywordIndex, node, source_id: str = None) -> KeywordMatches:
+    kind = node[0]
+
+    if kind == 'phrase':
+        _, terms, prefix = node
+        slots = [[term] if term in index.postings else [] for term in terms]
+        if prefix:
+            slots[-1] = [term for term in index.postings if term.startswith(terms[-1])]
+        rows, first, last, starts, ends, _ = index.phrase_spans(slots, source_id)
+        return KeywordMatches(rows.astype(np.int64), first.astype(np.int64), last.astype(np.int64),
+                              starts.astype(np.int64), ends.astype(np.int64), np.full(len(rows), len(terms), dtype=np.int64))
+
+    if kind == 'near':
+        _, left_node, right_node, distance = node
+        left = _evaluate_keyword_node(index, left_node, source_id)
+        right = _evaluate_keyword_node(index, right_node, source_id)
+        left = left.keep_rows(left.first >= 0)
+        right = right.keep_rows(right.first >= 0)
+        if not len(left.rows) or not len(right.rows):
+            return KeywordMatches.empty()
+        # Right spans whose start lies in [left.first - distance - 1 - widest, left.last + distance + 1], same row
+        stride = int(max(left.last.max(), right.last.max())) + distance + 2
+        widest = int((right.last - right.first).max())
+        right_keys = right.rows * stride + right.first
+        lo = np.searchsorted(right_keys, left.rows * stride + np.maximum(left.first - distance - 1 - widest, 0), 'left')
+        hi = np.searchsorted(right_keys, left.rows * stride + left.last + distance + 1, 'right')
+        counts = hi - lo
+        li = np.repeat(np.arange(len(left.rows)), counts)
+        ri = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+        gap = np.maximum(right.first[ri] - left.last[li], left.first[li] - right.last[ri]) - 1
+        ok = (right.rows[ri] == left.rows[li]) & (gap >= 0) & (gap <= distance)
+        li, ri = li[ok], ri[ok]
+        left_first = left.first[li] <= right.first[ri]
+        return KeywordMatches(left.rows[li],
+                              np.minimum(left.first[li], right.first[ri]), np.maximum(left.last[li], right.last[ri]),
+                              np.where(left_first, left.starts[li], right.starts[ri]),
+                              np.where(left.last[li] >= right.last[ri], left.ends[li], right.ends[ri]),
+                              left.terms[li] + right.terms[ri])
+
+    if kind == 'or':
+        return KeywordMatches.concat(_evaluate_keyword_node(index, child, source_id) for child in node[1])
+
+    if kind == 'not':
+        excluded = _evaluate_keyword_node(index, node[1], source_id).unique_rows()
+        universe = np.flatnonzero(index._searchable(source_id))
+        return KeywordMatches.whole_rows(np.setdiff1d(universe, excluded, assume_unique=True))
+
+    # 'and': intersect the positive children, then subtract the negated ones
+    positives = [child for child in node[1] if child[0] != 'not']
+    negatives = [child[1] for child in node[1] if child[0] == 'not']
+    if positives:
+        parts = [_evaluate_keyword_node(index, child, source_id) for child in positives]
+        common = parts[0].unique_rows()
+        for part in parts[1:]:
+            common = np.intersect1d(common, part.unique_rows(), assume_unique=True)
+        result = KeywordMatches.concat(part.keep_rows(np.isin(part.rows, common)) for part in parts)
+    else:
+        result = KeywordMatches.whole_rows(np.flatnonzero(index._searchable(source_id)))
+    for child in negatives:
+        excluded = _evaluate_keyword_node(index, child, source_id).unique_rows()
+        result = result.keep_rows(~np.isin(result.rows, excluded))
+    return result
+
+def _positive_terms(index: KeywordIndex, node) -> set:
+    """Index terms a match can contain (prefixes expanded; nothing under NOT)"""
+    if node is None or node[0] == 'not':
+        return set()
+    if node[0] == 'phrase':
+        _, terms, prefix = node
+        if prefix:
+            return set(terms[:-1]) | {term for term in index.postings if term.startswith(terms[-1])}
+        return set(terms)
+    if node[0] == 'near':
+        return _positive_terms(index, node[1]) | _positive_terms(index, node[2])
+    return set().union(*(_positive_terms(index, child) for child in node[1]))
+
+def evaluate_keyword_query(index: KeywordIndex, query: str, source_id: str = None, limit: int = 100) -> List[Dict]:
+    """[{'id', 'score', 'bm25', 'proximity', 'spans': [(start, end), ...]}], best first"""
+    node, filters = parse_keyword_query(query)
+    if node is None and not filters['speaker'] and filters['after'] is None and filters['before'] is None:
+        return []
+    with index.lock:
+        if node is None:
+            matches = KeywordMatches.whole_rows(np.flatnonzero(index._searchable(source_id)))
+        else:
+            matches = _evaluate_keyword_node(index, node, source_id)
+
+        # Speaker / time filters on the matched rows only
+        keep = np.ones(len(matches.rows), dtype=bool)
+        if filters['speaker']:
+            codes = [code for code, name in enumerate(index.speaker_names)
+                     if name and any(wanted in name.lower() for wanted in filters['speaker'])]
+            keep &= np.isin(np.frombuffer(index.speakers, dtype=np.int32)[matches.rows], codes)
+        times = np.frombuffer(index.times, dtype=np.float64)[matches.rows]
+        if filters['after'] is not None:
+            keep &= times >= filters['after']
+        if filters['before'] is not None:
+            keep &= times <= filters['before']
+        matches = matches.keep_rows(keep)
+
+        rows, first_span = np.unique(matches.rows, return_index=True)
+        if not len(rows):
+            return []
+        bm25 = index.bm25_scores(_positive_terms(index, node), index._searchable(source_id))[rows]
+
+        # Proximity: 1 for an exact phrase/adjacent NEAR, decaying with the words in between
+        spanned = (matches.first >= 0) & (matches.terms > 1)
+        slack = np.maximum(matches.last - matches.first + 1 - matches.terms, 0)
+        proximity = np.zeros(len(rows))
+        np.maximum.at(proximity, np.searchsorted(rows, matches.rows[spanned]), 1.0 / (1.0 + slack[spanned]))
+
+        scores = bm25 + KEYWORD_PROXIMITY_WEIGHT * proximity
+        order = np.argsort(-scores, kind='stable')[:limit]
+        span_bounds = np.append(first_span, len(matches.rows))
+        results = []
+        for i in order.tolist():
+            lo, hi = span_bounds[i], span_bounds[i + 1]
+            spans = sorted({(start, end) for first, start, end in zip(matches.first[lo:hi].tolist(),
+                                                                       matches.starts[lo:hi].tolist(),
+                                                                       matches.ends[lo:hi].tolist()) if first >= 0})
+            results.append({'id': index.ids[int(rows[i])], 'score': float(scores[i]), 'bm25': float(bm25[i]),
+                            'proximity': float(proximity[i]), 'spans': spans})
+        return results
+
+def keyword_query_search(query: str, company_id: str, transcript_id: str = None, limit: int = 100, debug=False):
+    """
+    Query-language keyword search (see above). Statement rows with
+    query_score (= combined_score), bm25_score, proximity_score and
+    match_spans (character offsets into exact_quote). None if the
+    keyword index is unavailable.
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    parse_keyword_query(query)   # KeywordQueryError goes to the caller - plain-text search would mangle the query
+    start = time.perf_counter()
+    try:
+        index = keyword_index_for(company_id, debug=debug)
+        ranked = evaluate_keyword_query(index, query, source_id=transcript_id, limit=limit)
+        metadata = fetch_statement_metadata([hit['id'] for hit in ranked], company_id)
+    except Exception as e:
+        print(f"⚠️ Keyword query failed ({e})")
+        return None
+
+    results = [{**metadata[hit['id']], 'query_score': hit['score'], 'combined_score': hit['score'],
+                'bm25_score': hit['bm25'], 'proximity_score': hit['proximity'], 'match_spans': hit['spans']}
+               for hit in ranked if hit['id'] in metadata]
+    if debug:
+        print(f"🔎 KEYWORD QUERY {parse_keyword_query(query)}: {len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return results
+
+# ========================================
+# HYBRID RETRIEVAL (BM25 + VECTOR, RANK FUSION)
+# The keyword index's BM25 ranking runs next to the vector search; the two
+# rankings are merged with reciprocal rank fusion. Both sides keep their
+# own scores on every result so the fusion can be tuned.
+# ========================================
+HYBRID_RRF_K = 60             # RRF constant: score = sum(weight / (HYBRID_RRF_K + rank))
+HYBRID_CANDIDATES = 100       # Depth of each ranking fed into the fusion
+HYBRID_WEIGHTS = {'bm25': 1.0, 'vector': 1.0}
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[str]], weights: Dict[str, float] = None,
+                           k: int = HYBRID_RRF_K) -> List[tuple]:
+    """{source: [ids best first]} -> [(id, fused score)] best first"""
+    weights = weights or {}
+    fused = defaultdict(float)
+    for source, ids in rankings.items():
+        weight = weights.get(source, 1.0)
+        for rank, statement_id in enumerate(ids, 1):
+            fused[statement_id] += weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+_hybrid_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hybrid')
+
+def hybrid_search(query: str, company_id: str = None, transcript_id: str = None, k: int = 20,
+                  candidates: int = HYBRID_CANDIDATES, weights: Dict[str, float] = None, debug=False) -> List[Dict]:
+    """
+    BM25 and vector retrieval run concurrently and are fused with RRF.
+    Each result carries rrf_score plus bm25_score / bm25_rank and
+    similarity / vector_rank (None where that side didn't return it).
+    """
+    if not company_id:
+        raise ValueError("company_id required for data isolation")
+    weights = {**HYBRID_WEIGHTS, **(weights or {})}
+    start = time.perf_counter()
+    timings = {}
+
+    def run_bm25():
+        t0 = time.perf_counter()
+        hits = keyword_index_for(company_id, debug=debug).bm25(query, candidates, source_id=transcript_id)
+        timings['bm25_ms'] = (time.perf_counter() - t0) * 1000
+        return hits
+
+    def run_vector():
+        t0 = time.perf_counter()
+        query_embedding = get_query_embedding(extract_query_topic(query), company_id=company_id)
+        rows = match_statements_with_metadata(query_embedding, company_id, transcript_id,
+                                              k=candidates, threshold=0.2)
+        timings['vector_ms'] = (time.perf_counter() - t0) * 1000
+        return rows
+
+    bm25_future = _hybrid_executor.submit(run_bm25)
+    vector_future = _hybrid_executor.submit(run_vector)
+
+    try:
+        bm25_hits = bm25_future.result()
+    except Exception as e:
+        print(f"⚠️ BM25 side failed: {e}")
+        bm25_hits = []
+    try:
+        vector_rows = vector_future.result()
+    except Exception as e:
+        print(f"⚠️ Vector side failed: {e}")
+        vector_rows = []
+
+    fused = reciprocal_rank_fusion({'bm25': [statement_id for statement_id, _ in bm25_hits],
+                                    'vector': [row['id'] for row in vector_rows]}, weights)[:k]
+
+    # Vector rows already carry metadata; BM25-only hits come from the metadata cache
+    rows_by_id = {row['id']: row for row in vector_rows}
+    missing = [statement_id for statement_id, _ in fused if statement_id not in rows_by_id]
+    if missing:
+        rows_by_id.update(fetch_statement_metadata(missing, company_id))
+
+    bm25_rank = {statement_id: (rank, score) for rank, (statement_id, score) in enumerate(bm25_hits, 1)}
+    vector_rank = {row['id']: (rank, row.get('similarity')) for rank, row in enumerate(vector_rows, 1)}
+
+    results = []
+    for statement_id, rrf_score in fused:
+        row = rows_by_id.get(statement_id)
+        if row is None:
+            continue
+        b_rank, b_score = bm25_rank.get(statement_id, (None, None))
+        v_rank, v_similarity = vector_rank.get(statement_id, (None, None))
+        results.append({
+            **row,
+            'rrf_score': rrf_score,
+            'bm25_score': b_score,
+            'bm25_rank': b_rank,
+            'similarity': v_similarity,
+            'vector_rank': v_rank
+        })
+
+    if debug:
+        timings['total_ms'] = (time.perf_counter() - start) * 1000
+        print(f"🔀 HYBRID SEARCH '{query}': {len(bm25_hits)} BM25 + {len(vector_rows)} vector -> {len(results)} fused "
+              f"({', '.join(f'{name} {ms:.0f}' for name, ms in timings.items())} ms)")
+    return results
+
+# ========================================
+# SNIPPETS & HIGHLIGHTS
+# Match offsets come from the keyword index postings (character start/end
+# of every token), so results are highlighted without re-scanning quotes.
+# Endpoints return a window around the densest run of matches; the full
+# quote is only shipped when the request asks for it (full_quote).
+# ========================================
+SNIPPET_CHARS = int(os.getenv('SNIPPET_CHARS', '240'))   # Snippet window (before ellipses)
+SNIPPET_COMMON_TERM_RATIO = 0.25   # Terms in more of the statements than this aren't highlighted ('the', 'and')
+SNIPPET_ELLIPSIS = '…'
+
+def highlight_terms(index: KeywordIndex, query: str) -> List[str]:
+    """Query topic terms worth highlighting, plus vocabulary terms they prefix (truck -> trucks)"""
+    terms = set(bm25_tokenize(extract_query_topic(query)))
+    with index.lock:
+        if index.alive_count:
+            common = index.alive_count * SNIPPET_COMMON_TERM_RATIO
+            rare = {t for t in terms if t in index.postings and len(index.postings[t][0]) <= common}
+            terms = rare or terms
+        prefixes = tuple(t for t in terms if len(t) >= 4)
+        if prefixes:
+            terms |= {t for t in index.postings if t.startswith(prefixes)}
+    return sorted(terms)
+
+def build_snippet(quote: str, spans: List[tuple], window: int = SNIPPET_CHARS) -> Dict:
+    """
+    Window of about `window` characters around the densest run of match
+    spans, cut at word boundaries, with ellipses where the quote was cut.
+    {'snippet', 'snippet_start', 'highlights'}: snippet_start is the offset
+    of the window in the quote; highlights are (start, end) in the snippet.
+    """
+    quote = quote or ''
+    spans = sorted((start, end) for start, end in spans or [] if 0 <= start < end <= len(quote))
+    if len(quote) <= window:
+        start, end = 0, len(quote)
+    else:
+        # Two pointers: the run of spans that fits in one window and holds the most matches
+        best, best_count, j = 0, 0, 0
+        for i, (first, _) in enumerate(spans):
+            j = max(j, i)
+            while j < len(spans) and spans[j][1] - first <= window:
+                j += 1
+            if j - i > best_count:
+                best, best_count = i, j - i
+        if spans:
+            first = spans[best][0]
+            last = min(max((e for _, e in spans[best:best + best_count]), default=first + 1), first + window)
+            start = max(0, first - (window - (last - first)) // 2)
+        else:
+            first = last = start = 0
+        end = min(len(quote), start + window)
+        start = max(0, end - window)
+        if start > 0:
+            cut = quote.find(' ', start, first if spans else end)
+            start = cut + 1 if cut != -1 else start
+        if end < len(quote):
+            cut = quote.rfind(' ', last if spans else start, end)
+            end = cut if cut > start else end
+
+    prefix = SNIPPET_ELLIPSIS if start > 0 else ''
+    suffix = SNIPPET_ELLIPSIS if end < len(quote) else ''
+    highlights = []
+    for span_start, span_end in spans:
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        if span_start >= span_end:
+            continue
+        span = (span_start - start + len(prefix), span_end - start + len(prefix))
+        if highlights and span[0] <= highlights[-1][1]:
+            highlights[-1] = (highlights[-1][0], max(highlights[-1][1], span[1]))
+        else:
+            highlights.append(span)
+    return {'snippet': prefix + quote[start:end] + suffix, 'snippet_start': start, 'highlights': highlights}
+
+def attach_snippets(results: List[Dict], query: str, company_id: str, window: int = SNIPPET_CHARS, debug=False) -> List[Dict]:
+    """
+    Copies of the result rows with match_spans, snippet, snippet_start and
+    highlights. Rows that already carry match_spans (keyword, fuzzy and
+    query-language searches) keep them; the rest (semantic, vector-only
+    hybrid hits) get the query terms' offsets from the keyword index in one
+    postings pass. Without the index those rows get a leading snippet.
+    """
+    start = time.perf_counter()
+    missing = [r['id'] for r in results if r.get('match_spans') is None and r.get('id')]
+    looked_up = {}
+    if missing and KEYWORD_INDEX_ENABLED:
+        try:
+            index = keyword_index_for(company_id, debug=debug)
+            looked_up = index.term_spans(missing, highlight_terms(index, query))
+        except Exception as e:
+            print(f"⚠️ Keyword index unavailable for highlights ({e})")
+
+    snippeted = []
+    for r in results:
+        spans = r.get('match_spans')
+        if spans is None:
+            spans = looked_up.get(r.get('id'), [])
+        spans = [tuple(span) for span in spans]
+        snippeted.append({**r, 'match_spans': spans, **build_snippet(r.get('exact_quote'), spans, window)})
+    if debug:
+        print(f"✂️ Snippets for {len(results)} results ({len(missing)} spans from the index) "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return snippeted
+
+def project_search_result(r: Dict, full_quote: bool = True, **fields) -> Dict:
+    """API shape of a search result; exact_quote only when full_quote (quote_length always)"""
+    quote = r.get('exact_quote') or ''
+    projected = {'id': r.get('id')}
+    if full_quote:
+        projected['exact_quote'] = r.get('exact_quote')
+    projected.update({
+        'speaker': r['speakers']['name'] if r.get('speakers') else 'Unknown',
+        'time_code': r.get('time_code', '00:00:00'),
+        'source_file': r['source_files']['filename'] if r.get('source_files') else 'Unknown',
+        'snippet': r.get('snippet', quote),
+        'snippet_start': r.get('snippet_start', 0),
+        'highlights': r.get('highlights', []),
+        'match_spans': r.get('match_spans', []),
+        'quote_length': len(quote)
+    })
+    projected.update(fields)
+    return projected
+
+def search_projection(data: Dict) -> tuple:
+    """(full_quote, snippet_chars) from a search request body"""
+    full_quote = data.get('full_quote', True)
+    if isinstance(full_quote, str):
+        full_quote = full_quote.lower() not in ('false', '0', 'no')
+    try:
+        snippet_chars = int(data.get('snippet_chars') or SNIPPET_CHARS)
+    except (TypeError, ValueError, OverflowError):
+        snippet_chars = SNIPPET_CHARS   # e.g. "abc", a list or Infinity - not worth a 500
+    return bool(full_quote), max(40, min(snippet_chars, 2000))
+
+def keyword_syntax_option(data: Dict):
+    """The request's 'syntax' flag: True/False forces the keyword query language on/off, absent = auto-detect"""
+    syntax = data.get('syntax')
+    if isinstance(syntax, str):
+        syntax = syntax.lower() in ('true', '1', 'yes')
+    return None if syntax is None else bool(syntax)
+
+# ========================================
+# STREAMING INGEST PIPELINE (BOUNDED MEMORY)
+# parse -> embed -> store, connected by bounded queues
+# ========================================
+import threading
+import queue
+
+STREAM_QUEUE_SIZE = 4   # Batches buffered between stages (backpressure limit)
+
+def iter_transcript_lines(file_path: str, chunk_size: int = 1 << 16):
+    """Yield transcript lines without loading the whole file (same lines as text.split('\\n'))"""
+    if file_path.endswith('.docx'):
+        for text in iter_docx_text(file_path):
+            if text.strip():
+                yield from text.split('\n')
+        return
+
+    if file_path.endswith('.pdf'):
+        with open(file_path, 'rb') as f:
+            yield from iter_document_lines(f.read(), file_path)
+        return
+
+    if not file_path.endswith('.txt'):
+        raise ValueError(f"Unsupported file type: {file_path}")
+
+    with open(file_path, 'r', encoding='utf-8') as f:   # Universal newlines: CRLF -> \n
+        pending = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parts = (pending + chunk).split('\n')
+            pending = parts.pop()
+            yield from parts
+        yield pending
+
+def iter_document_lines(data: bytes, filename: str = None):
+    """Lines of an in-memory upload - PDFs stream page by page, everything else goes through extract_text"""
+    if data.startswith(b"%PDF"):
+        for page in extract_pdf_pages(data):
+            yield from page.split('\n')
+    else:
+        yield from extract_text(data, filename, tables=False).split('\n')
+
+def iter_batches(items, batch_size: int):
+    """Group any iterable into lists of at most batch_size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_STAGE_DONE = object()
+
+def bounded_stage(items, maxsize: int = STREAM_QUEUE_SIZE, name: str = "stage", cancel=None):
+    """
+    Run an upstream generator in its own thread and hand its items over a
+    bounded queue. A full queue blocks the producer (backpressure); errors are
+    re-raised in the consumer; closing the consumer or setting the shared
+    cancel event stops the producer.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def stopped():
+        return stop.is_set() or (cancel is not None and cancel.is_set())
+
+    def put(item):
+        while not stopped():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as e:
+            put(e)
+
+    worker = threading.Thread(target=producer, name=f"ingest-{name}", daemon=True)
+    worker.start()
+
+    try:
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if cancel is not None and cancel.is_set():
+                    return
+                continue
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def count_batches(batches, stage: str, progress=None):
+    """Pass batches through unchanged, reporting how many items went by"""
+    for batch in batches:
+        if progress: progress(stage, len(batch))
+        yield batch
+
+def embed_statement_batches(batches, embed_fn=None, progress=None):
+    """Embedding stage: (statements, embeddings) for every parsed batch"""
+    embed_fn = embed_fn or embed_texts_batched
+    for batch in batches:
+        embeddings = embed_fn([stmt['exact_quote'] for stmt in batch])
+        if progress: progress('embed', len(batch))
+        yield batch, embeddings
+
+def process_transcript_file_streaming(file_path: str, filename: str = None, company_id: str = None, debug=False,
+                                      batch_size: int = EMBEDDING_BATCH_SIZE, queue_size: int = STREAM_QUEUE_SIZE,
+                                      embed_fn=None, on_progress=None, stats: Dict = None, data: bytes = None):
+    """
+    STREAMING transcript processor for very long transcripts.
+    Parsing, embedding and storage run concurrently; at most
+    ~2*queue_size+3 statement batches are in memory at any time.
+
+    on_progress(stage, count) is called as statements pass the parse/embed/store
+    stages; stats (if given) receives source_file_id, counts and any error.
+    data: the upload's raw bytes - read through extract_text instead of
+    opening file_path (which is then only recorded as the source path).
+    """
+    if not company_id:
+        raise ValueError("company_id is REQUIRED")
+
+    if filename is None:
+        filename = file_path.split('/')[-1]
+
+    counts = {'parse': 0, 'embed': 0, 'store': 0}
+    cancel = threading.Event()
+    if stats is not None:
+        stats['counts'] = counts
+
+    def progress(stage, n):
+        counts[stage] += n
+        if on_progress:
+            on_progress(stage, counts[stage])
+
+    source_file_id = None
+    try:
+        if debug: print(f"🚀 Streaming: {filename}")
+        start_time = time.time()
+
+        file_hash = hashlib.sha256(data).hexdigest() if data is not None else None
+        source_file_id, ingest_state, committed = begin_source_file(file_path, filename, company_id, debug,
+                                                                    file_hash=file_hash)
+        if stats is not None:
+            stats['source_file_id'] = source_file_id
+            stats['ingest_state'] = ingest_state
+
+        if ingest_state == 'duplicate':
+            print(f"✅ SUCCESS! {filename} was already processed - skipped")
+            return True
+        if ingest_state == 'busy':
+            # Nothing was ingested by this call - not a success
+            print(f"⏳ {filename} is already being processed by another upload - skipped")
+            return False
+
+        # Statements committed by an earlier, interrupted run are skipped
+        embed_fn = reuse_stored_embeddings(embed_fn or (lambda texts: embed_texts_batched(texts, company_id=company_id)),
+                                           company_id)
+
+        # parse -> [queue] -> embed -> [queue] -> store
+        if data is not None:
+            lines = iter_document_lines(data, filename)
+        else:
+            lines = iter_transcript_lines(file_path)
+        statements = iter_speaker_statements(lines, filename)
+        if committed:
+            statements = (stmt for stmt in statements if statement_key(stmt) not in committed)
+        parsed = bounded_stage(count_batches(iter_batches(statements, batch_size), 'parse', progress),
+                               queue_size, name="parse", cancel=cancel)
+        embedded = bounded_stage(embed_statement_batches(parsed, embed_fn, progress),
+                                 queue_size, name="embed", cancel=cancel)
+
+        speakers_cache = {}
+        for batch, embeddings in embedded:
+            resolve_speakers_bulk(batch, source_file_id, company_id, speakers_cache)
+            rows = [
+                build_statement_row(stmt, speakers_cache[stmt['speaker']], source_file_id, emb, company_id)
+                for stmt, emb in zip(batch, embeddings)
+            ]
+            progress('store', insert_statements_bulk(rows))
+
+        total = counts['store'] + len(committed)
+        if not total:
+            raise ValueError("No statements found")
+
+        supabase.table('source_files').update({
+            'processing_status': 'completed',
+            'total_chunks': total
+        }).eq('id', source_file_id).execute()
+        ann_refresh_source(company_id, source_file_id)
+
+        if debug:
+            elapsed = time.time() - start_time
+            print(f"💾 Streamed {counts['store']} statements in {elapsed:.1f}s "
+                  f"({counts['store'] / elapsed if elapsed else 0:.0f} statements/sec)")
+
+        print(f"✅ SUCCESS! Processed {counts['store']} statements")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        if stats is not None:
+            stats['error'] = str(e)
+        release_source_file(source_file_id)
+        return False
+
+    finally:
+        cancel.set()  # Stop any stage threads still running after an error
+
+# ========================================
+# INGEST JOB QUEUE (UPLOADS RUN IN THE BACKGROUND)
+# ========================================
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))                            # Jobs running at once
+INGEST_MAX_JOBS_PER_COMPANY = int(os.getenv('INGEST_MAX_JOBS_PER_COMPANY', '2'))  # Fair share per tenant
+INGEST_JOB_HISTORY = 500                                                          # Finished jobs kept for status lookups
+
+class IngestJobQueue:
+    """
+    Background worker pool for transcript ingest.
+    Jobs beyond a company's fair share wait in that company's backlog,
+    so one tenant uploading many files cannot starve the others.
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS, max_jobs_per_company: int = INGEST_MAX_JOBS_PER_COMPANY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest-job')
+        self.max_workers = max_workers
+        self.max_jobs_per_company = max_jobs_per_company
+        self.jobs = {}
+        self.running = defaultdict(int)
+        self.backlog = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def submit(self, company_id: str, filename: str, data: bytes, replaces: str = None) -> Dict:
+        """
+        Queue an uploaded transcript (raw bytes) for ingest and return its job record immediately.
+        replaces: source_file_id of an earlier version - only the differences are re-ingested.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'company_id': company_id,
+            'filename': filename,
+            'size_bytes': len(data),
+            'status': 'queued',
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'source_file_id': replaces,
+            'mode': 'reingest' if replaces else 'ingest',
+            'stages': {stage: 0 for stage in ('parse', 'embed', 'store')},
+            'error': None,
+            '_data': data,
+            '_started': None
+        }
+
+        with self.lock:
+            self.jobs[job_id] = job
+            self._prune()
+            if self.running[company_id] < self.max_jobs_per_company:
+                self._start(job)
+            else:
+                self.backlog[company_id].append(job_id)
+
+        return self.snapshot(job_id)
+
+    def _start(self, job):
+        """Hand a job to the pool - caller holds the lock"""
+        self.running[job['company_id']] += 1
+        self.executor.submit(self._run, job['job_id'])
+
+    def _run(self, job_id: str):
+        job = self.jobs[job_id]
+        with self.lock:
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            job['_started'] = time.time()
+
+        def on_progress(stage, count):
+            with self.lock:
+                job['stages'][stage] = count
+
+        stats = {}
+        try:
+            if job['mode'] == 'reingest':
+                summary = reingest_transcript_revision(job['source_file_id'], job['company_id'],
+                                                       data=job['_data'], filename=job['filename'])
+                with self.lock:
+                    if summary.get('ingest_state') == 'busy':
+                        job['status'] = 'busy'
+                        job['error'] = 'This transcript is still being processed - retry once it finishes'
+                        return
+                    job['diff'] = summary
+                    job['stages'] = {stage: summary['statements'] if stage == 'parse' else summary['embedded']
+                                     for stage in job['stages']}
+                    job['status'] = 'completed'
+                return
+
+            success = process_transcript_file_streaming(
+                job['filename'],
+                filename=job['filename'],
+                company_id=job['company_id'],
+                on_progress=on_progress,
+                stats=stats,
+                data=job['_data']
+            )
+            with self.lock:
+                job['source_file_id'] = stats.get('source_file_id')
+                if stats.get('ingest_state') == 'busy':
+                    # Another upload of the same file holds the claim - nothing ingested here
+                    job['status'] = 'busy'
+                    job['error'] = 'Another upload of this file is still being processed - retry once it finishes'
+                else:
+                    job['status'] = 'completed' if success else 'failed'
+                    job['error'] = None if success else stats.get('error', 'Processing failed')
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+        finally:
+            with self.lock:
+                job['_data'] = None  # Release the upload bytes
+                job['finished_at'] = datetime.now().isoformat()
+                job['_elapsed'] = time.time() - job['_started']
+                company_id = job['company_id']
+                self.running[company_id] -= 1
+                if self.backlog[company_id]:
+                    self._start(self.jobs[self.backlog[company_id].pop(0)])
+
+    def _prune(self):
+        """Forget the oldest finished jobs - caller holds the lock"""
+        finished = [j for j in self.jobs.values() if j['status'] in ('completed', 'failed', 'busy')]
+        for job in finished[:max(0, len(finished) - INGEST_JOB_HISTORY)]:
+            del self.jobs[job['job_id']]
+
+    def snapshot(self, job_id: str, company_id: str = None) -> Dict:
+        """Public view of a job with per-stage progress and throughput (None if unknown or not this tenant's)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or (company_id and job['company_id'] != company_id):
+                return None
+
+            elapsed = job.get('_elapsed') or (time.time() - job['_started'] if job['_started'] else 0)
+            view = {k: v for k, v in job.items() if not k.startswith('_')}
+            view['stages'] = {
+                stage: {
+                    'statements': count,
+                    'statements_per_sec': round(count / elapsed, 1) if elapsed else 0.0
+                }
+                for stage, count in job['stages'].items()
+            }
+            view['elapsed_seconds'] = round(elapsed, 1)
+            if job['status'] == 'queued':
+                view['queue_position'] = self.backlog[job['company_id']].index(job_id) + 1 \
+                    if job_id in self.backlog[job['company_id']] else 0
+            return view
+
+    def list_jobs(self, company_id: str) -> List[Dict]:
+        """All known jobs for a company, newest first"""
+        with self.lock:
+            job_ids = [j['job_id'] for j in self.jobs.values() if j['company_id'] == company_id]
+        jobs = [self.snapshot(job_id) for job_id in job_ids]
+        return sorted([j for j in jobs if j], key=lambda j: j['created_at'], reverse=True)
+
+ingest_jobs = IngestJobQueue()
+
+# ========================================
+# INCREMENTAL RE-INGEST (REVISED TRANSCRIPTS)
+# Aligns a corrected transcript against the stored statements and only
+# embeds / analyzes what actually changed
+# ========================================
+import difflib
+
+STORED_STATEMENT_COLUMNS = 'id, speaker_id, exact_quote, time_code, time_seconds, chunk_index, context_before, context_after, speakers(name)'
+STATEMENT_POSITION_FIELDS = ('time_code', 'time_seconds', 'chunk_index', 'context_before', 'context_after')
+
+def fetch_source_statements(source_file_id: str, columns: str = STORED_STATEMENT_COLUMNS) -> List[Dict]:
+    """Every stored statement of a source file in transcript order (paged)"""
+    rows = []
+    while True:
+        page = supabase.table('statements').select(columns)\
+            .eq('source_file_id', source_file_id)\
+            .order('chunk_index')\
+            .range(len(rows), len(rows) + HASH_LOOKUP_PAGE - 1)\
+            .execute().data
+        rows.extend(page)
+        if len(page) < HASH_LOOKUP_PAGE:
+            return rows
+
+def statement_alignment_key(speaker: str, quote: str) -> str:
+    return f"{speaker}\x1f{quote}"
+
+def remove_orphaned_topics(entity_registry: Dict, company_id: str, debug=False) -> int:
+    """Delete the registry's topics that no statement of the company mentions any more"""
+    removed = 0
+    for normalized_name, entity_data in entity_registry.items():
+        try:
+            pattern = re.sub(r'([%_\\])', r'\\\1', entity_data['name'])
+            mentions = supabase.table('statements').select('id')\
+                .eq('company_id', company_id)\
+                .ilike('exact_quote', f'%{pattern}%')\
+                .limit(1)\
+                .execute().data
+            if not mentions:
+                supabase.table('topics').delete()\
+                    .eq('normalized_name', normalized_name)\
+                    .eq('company_id', company_id)\
+                    .execute()
+                removed += 1
+                if debug: print(f"🗑️ Removed topic no longer mentioned: {entity_data['name']}")
+        except Exception as e:
+            if debug: print(f"⚠️ Could not check topic {normalized_name}: {e}")
+    return removed
+
+def reingest_transcript_revision(source_file_id: str, company_id: str, file_path: str = None, data: bytes = None,
+                                 filename: str = None, embed_fn=None, analyze: bool = True, debug=False) -> Dict:
+    """
+    Re-ingest a corrected version of an already ingested transcript.
+    Unchanged statements keep their rows and embeddings (only position/time/context
+    are refreshed); changed statements are updated in place, new ones inserted and
+    removed ones deleted. Only changed + inserted text is embedded and re-analyzed;
+    topics that only the replaced text mentioned are removed.
+
+    Holds the source_files claim while it runs, like an upload; if another run
+    holds it, nothing is changed and the summary's ingest_state is 'busy'.
+    """
+    if not company_id:
+        raise ValueError("company_id is REQUIRED")
+
+    source = supabase.table('source_files').select('id, filename')\
+        .eq('id', source_file_id)\
+        .eq('company_id', company_id)\
+        .execute().data
+    if not source:
+        raise ValueError(f"Transcript not found: {source_file_id}")
+
+    filename = filename or source[0]['filename']
+    claims = has_columns('source_files', 'content_hash, claimed_at')
+    if claims and not claim_source_file(source_file_id):
+        print(f"⏳ {filename} is being processed by another run - re-ingest skipped")
+        return {'source_file_id': source_file_id, 'ingest_state': 'busy'}
+
+    try:
+        return _apply_transcript_revision(source_file_id, company_id, file_path, data, filename,
+                                          embed_fn, analyze, debug)
+    finally:
+        if claims:
+            release_source_file(source_file_id)
+
+def _apply_transcript_revision(source_file_id: str, company_id: str, file_path: str, data: bytes,
+                               filename: str, embed_fn, analyze: bool, debug) -> Dict:
+    """The re-ingest itself - caller holds the source_files claim"""
+    start_time = time.time()
+
+    # New version
+    lines = iter_document_lines(data, filename) if data is not None else iter_transcript_lines(file_path)
+    new_statements = list(iter_speaker_statements(lines, filename))
+    if not new_statements:
+        raise ValueError("No statements found")
+
+    # Stored version
+    stored = fetch_source_statements(source_file_id)
+    stored_keys = [statement_alignment_key((row.get('speakers') or {}).get('name', ''), row['exact_quote']) for row in stored]
+    new_keys = [statement_alignment_key(stmt['speaker'], stmt['exact_quote']) for stmt in new_statements]
+
+    # autojunk off: repeated short answers ("Yes.") must still align
+    matcher = difflib.SequenceMatcher(None, stored_keys, new_keys, autojunk=False)
+
+    moved = []      # (row, new statement) - same text, position/context may differ
+    changed = []    # (row, new statement) - text or speaker differs, row is reused
+    inserted = []   # new statements without a row
+    deleted = []    # rows no longer in the transcript
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            moved.extend(zip(stored[i1:i2], new_statements[j1:j2]))
+            continue
+        old_rows, new_rows = stored[i1:i2], new_statements[j1:j2]
+        paired = min(len(old_rows), len(new_rows))
+        changed.extend(zip(old_rows[:paired], new_rows[:paired]))
+        inserted.extend(new_rows[paired:])
+        deleted.extend(old_rows[paired:])
+
+    # Position-only updates (no embedding, no NLP). One line inserted near the top moves every
+    # later row, so these go out in bulk. Upserts carry the NOT NULL columns; embeddings are untouched.
+    position_rows = []
+    for row, stmt in moved:
+        new_values = build_statement_row(stmt, row['speaker_id'], source_file_id, None)
+        if any(row.get(field) != new_values[field] for field in STATEMENT_POSITION_FIELDS):
+            position_rows.append({
+                'id': row['id'], 'company_id': company_id, 'source_file_id': source_file_id,
+                'speaker_id': row['speaker_id'], 'exact_quote': row['exact_quote'],
+                **{field: new_values[field] for field in STATEMENT_POSITION_FIELDS}
+            })
+    position_updates = upsert_statements_bulk(position_rows)
+
+    # Embed only what changed
+    to_embed = [stmt for _, stmt in changed] + inserted
+    speakers_cache = resolve_speakers_bulk(to_embed, source_file_id, company_id, {})
+    embed_fn = reuse_stored_embeddings(embed_fn or (lambda texts: embed_texts_batched(texts, company_id=company_id)),
+                                       company_id)
+    embeddings = embed_fn([stmt['exact_quote'] for stmt in to_embed]) if to_embed else []
+
+    upsert_statements_bulk([
+        {'id': row['id'], **build_statement_row(stmt, speakers_cache[stmt['speaker']], source_file_id, emb, company_id)}
+        for (row, stmt), emb in zip(changed, embeddings)
+    ])
+
+    insert_statements_bulk([
+        build_statement_row(stmt, speakers_cache[stmt['speaker']], source_file_id, emb, company_id)
+        for stmt, emb in zip(inserted, embeddings[len(changed):])
+    ])
+
+    deleted_ids = [row['id'] for row in deleted]
+    for start in range(0, len(deleted_ids), ID_LOOKUP_PAGE):
+        supabase.table('statements').delete()\
+            .in_('id', deleted_ids[start:start + ID_LOOKUP_PAGE])\
+            .eq('company_id', company_id)\
+            .execute()
+
+    update = {'processing_status': 'completed', 'total_chunks': len(new_statements)}
+    if has_columns('source_files', 'content_hash'):
+        if data is not None:
+            update['content_hash'] = hashlib.sha256(data).hexdigest()
+        elif file_path:
+            update['content_hash'] = hash_file(file_path)
+    try:
+        supabase.table('source_files').update(update).eq('id', source_file_id).execute()
+    except Exception as e:
+        if not is_unique_violation(e):
+            raise
+        # The revision is byte-identical to another upload - keep this row's old hash
+        update.pop('content_hash')
+        supabase.table('source_files').update(update).eq('id', source_file_id).execute()
+    ann_refresh_source(company_id, source_file_id)
+
+    # Topics found in the replaced text that no statement mentions any more
+    entities_removed = 0
+    if analyze and (changed or deleted):
+        removed_text = [{'exact_quote': row['exact_quote'], 'time_code': row.get('time_code')}
+                        for row in [row for row, _ in changed] + deleted]
+        entities_removed = remove_orphaned_topics(build_entity_registry(removed_text)[0], company_id, debug)
+
+    # Re-analyze only the new text
+    entities_stored = 0
+    if analyze and to_embed:
+        entity_registry = build_entity_registry(to_embed, source_file_id, company_id)[0]
+        entities_stored = store_entity_registry(entity_registry, company_id, debug)
+
+    summary = {
+        'source_file_id': source_file_id,
+        'statements': len(new_statements),
+        'unchanged': len(moved),
+        'position_updates': position_updates,
+        'changed': len(changed),
+        'inserted': len(inserted),
+        'deleted': len(deleted),
+        'embedded': len(to_embed),
+        'entities_stored': entities_stored,
+        'entities_removed': entities_removed,
+        'elapsed_seconds': round(time.time() - start_time, 1)
+    }
+
+    print(f"✅ RE-INGEST {filename}: {summary['unchanged']} unchanged, {summary['changed']} changed, "
+          f"{summary['inserted']} inserted, {summary['deleted']} deleted "
+          f"({summary['embedded']} of {summary['statements']} statements embedded)")
+    return summary
+
+# ========================================
+# BATCH INGEST (DIRECTORY / MANIFEST OF TRANSCRIPTS)
+# CPU work (parse + NLP) on a process pool, network work on a thread pool,
+# OpenAI calls throttled by the shared token buckets (see EMBEDDING SERVICE)
+# ========================================
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+BATCH_PARSE_PROCESSES = int(os.getenv('BATCH_PARSE_PROCESSES', str(os.cpu_count() or 2)))
+BATCH_IO_THREADS = int(os.getenv('BATCH_IO_THREADS', '8'))
+TRANSCRIPT_EXTENSIONS = ('.docx', '.txt', '.pdf')
+
+def resolve_transcript_sources(source) -> List[Dict]:
+    """
+    Turn a directory, a manifest file or a list of paths into ingest entries.
+    Manifests are JSON (list of paths or {"path", "filename", "company_id"}
+    objects) or plain text with one path per line.
+    """
+    if isinstance(source, (list, tuple)):
+        entries = list(source)
+    elif os.path.isdir(source):
+        entries = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                   if name.lower().endswith(TRANSCRIPT_EXTENSIONS)]
+    elif source.lower().endswith('.json'):
+        with open(source, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    resolved = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        entry = dict(entry)
+        entry.setdefault('filename', os.path.basename(entry['path']))
+        resolved.append(entry)
+    return resolved
+
+def parse_transcript_for_ingest(file_path: str, filename: str, analyze: bool = True):
+    """Process-pool worker: parse one transcript and run the NLP entity pass on it"""
+    statements = list(iter_speaker_statements(iter_transcript_lines(file_path), filename))
+    entity_registry = build_entity_registry(statements)[0] if analyze and statements else {}
+    return statements, entity_registry
+
+def ingest_one_transcript(entry: Dict, company_id: str, parse_pool, analyze: bool = True, debug=False) -> Dict:
+    """Thread-pool worker: dedup check, hand parsing to the process pool (if any), then embed + store"""
+    file_path, filename = entry['path'], entry['filename']
+    company_id = entry.get('company_id') or company_id
+    usage = {}
+    result = {'filename': filename, 'status': 'failed', 'statements': 0, 'tokens': 0, 'reused_embeddings': 0}
+    source_file_id = None
+
+    try:
+        source_file_id, ingest_state, committed = begin_source_file(file_path, filename, company_id, debug,
+                                                                    file_hash=entry.get('content_hash'))
+        result['source_file_id'] = source_file_id
+        if ingest_state in ('duplicate', 'busy'):
+            result['status'] = 'skipped'
+            return result
+
+        if parse_pool is not None:
+            statements, entity_registry = parse_pool.submit(parse_transcript_for_ingest, file_path, filename, analyze).result()
+        else:
+            statements, entity_registry = parse_transcript_for_ingest(file_path, filename, analyze)
+        if not statements:
+            raise ValueError("No statements found")
+
+        pending = [stmt for stmt in statements if statement_key(stmt) not in committed]
+        embed_fn = reuse_stored_embeddings(lambda texts: embed_texts_batched(texts, usage=usage, company_id=company_id),
+                                           company_id, usage)
+        ingest_statements_batched(pending, source_file_id, company_id=company_id, embed_fn=embed_fn, debug=debug)
+
+        supabase.table('source_files').update({
+            'processing_status': 'completed',
+            'total_chunks': len(statements)
+        }).eq('id', source_file_id).execute()
+        ann_refresh_source(company_id, source_file_id)
+
+        if entity_registry:
+            result['entities'] = store_entity_registry(entity_registry, company_id, debug)
+
+        result.update(status='completed', statements=len(pending),
+                      tokens=usage.get('tokens', 0), reused_embeddings=usage.get('reused', 0))
+
+    except Exception as e:
+        result['error'] = str(e)
+        release_source_file(source_file_id)
+
+    return result
+
+def batch_ingest_transcripts(source, company_id: str = None, analyze: bool = True,
+                             processes: int = BATCH_PARSE_PROCESSES, threads: int = BATCH_IO_THREADS, debug=False) -> Dict:
+    """
+    Ingest many transcripts at once from a directory, manifest file or list of paths.
+    Prints a throughput report (files/min, statements/sec, tokens) and returns it.
+    """
+    entries = resolve_transcript_sources(source)
+    if not company_id and not all(e.get('company_id') for e in entries):
+        raise ValueError("company_id is REQUIRED")
+
+    print(f"📦 BATCH INGEST: {len(entries)} transcripts ({processes} parse processes, {threads} I/O threads)")
+    start_time = time.time()
+    results = []
+
+    # Identical files in one batch would race each other into the same source_files row
+    seen = set()
+    unique_entries = []
+    for entry in entries:
+        entry['content_hash'] = hash_file(entry['path'])
+        key = (entry.get('company_id') or company_id, entry['content_hash'])
+        if key in seen:
+            results.append({'filename': entry['filename'], 'status': 'skipped', 'statements': 0,
+                            'tokens': 0, 'reused_embeddings': 0})
+            continue
+        seen.add(key)
+        unique_entries.append(entry)
+
+    # forkserver/spawn workers (see PROCESS POOLS) load the spaCy model themselves; PDFs are read in-process there
+    parse_pool = worker_pool(processes, state=('nlp',)) if not in_worker_process() else None
+    if parse_pool is None:
+        print("⚠️ No parse worker pool - parsing on the I/O threads")
+    try:
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='batch-ingest') as io_pool:
+            futures = [io_pool.submit(ingest_one_transcript, entry, company_id, parse_pool, analyze, debug)
+                       for entry in unique_entries]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                icon = {'completed': '✅', 'skipped': '♻️'}.get(result['status'], '❌')
+                print(f"  {icon} [{len(results)}/{len(entries)}] {result['filename']}: {result['status']}"
+                      f"{' - ' + result['error'] if result.get('error') else ''}")
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.time() - start_time
+    total_statements = sum(r['statements'] for r in results)
+    report = {
+        'files': len(results),
+        'completed': sum(r['status'] == 'completed' for r in results),
+        'skipped': sum(r['status'] == 'skipped' for r in results),
+        'failed': sum(r['status'] == 'failed' for r in results),
+        'statements': total_statements,
+        'tokens': sum(r['tokens'] for r in results),
+        'reused_embeddings': sum(r['reused_embeddings'] for r in results),
+        'elapsed_seconds': round(elapsed, 1),
+        'files_per_min': round(len(results) / elapsed * 60, 1) if elapsed else 0.0,
+        'statements_per_sec': round(total_statements / elapsed, 1) if elapsed else 0.0,
+        'results': results
+    }
+
+    print("\n" + "="*60)
+    print("📊 BATCH INGEST REPORT")
+    print("="*60)
+    print(f"📄 Files: {report['completed']} completed, {report['skipped']} already ingested, {report['failed']} failed")
+    print(f"⏱️ Total time: {report['elapsed_seconds']}s")
+    print(f"🚀 Throughput: {report['files_per_min']} files/min, {report['statements_per_sec']} statements/sec")
+    print(f"🧮 Embedding tokens used: {report['tokens']:,} ({report['reused_embeddings']:,} embeddings reused)")
+
+    return report
+
+# Example:
+# batch_ingest_transcripts('/content/transcripts', company_id='smartco1')
+# batch_ingest_transcripts('/content/manifest.json')
+
+# ========================================
+# INVESTIGATION ENHANCEMENT (FIXED)
+# ========================================
+def build_entity_registry(statements: List[Dict], transcript_id: str = None, company_id: str = None, debug=False):
+    """NLP pass over statements -> deduplicated entity registry (CPU only, no database calls)"""
+    # NEW: Track entities with better deduplication
+    entity_registry = {}  # normalized_name -> entity_data
+    total_processed = 0
+
+    for stmt in statements:
+        try:
+            if debug: print(f"Processing statement {str(stmt.get('id', stmt.get('line_number')))[:8]}...")
+
+            crime_data = extract_crime_entities_and_topics(
+                stmt['exact_quote'],
+                stmt.get('id'),
+                stmt.get('speaker_id'),
+                transcript_id
+            )
+
+            # Process each entity with intelligence
+            for entity in crime_data['entities']:
+                try:
+                    # FILTER OUT LOW-QUALITY ENTITIES
+                    if len(entity['text']) < 3:
+                        continue
+
+                    # Skip generic/vague terms
+                    vague_terms = ['guy', 'man', 'woman', 'person', 'someone', 'thing',
+                                   'stuff', 'place', 'area', 'your family', 'his family']
+                    if any(vague in entity['text'].lower() for vague in vague_terms):
+                        continue
+
+                    # Skip if confidence too low
+                    if entity.get('confidence', 0) < 0.65:
+                        continue
+
+                    normalized_name = entity['text'].upper().strip()
+
+                    # DEDUPLICATION: Check if entity exists
+                    if normalized_name in entity_registry:
+                        # Update existing entity
+                        existing = entity_registry[normalized_name]
+
+                        # Increase confidence if seen multiple times
+                        existing['mention_count'] += 1
+                        existing['confidence'] = min(1.0, existing['confidence'] + 0.05)
+
+                        # Add context if new
+                        if entity.get('context') not in existing['all_contexts']:
+                            existing['all_contexts'].append(entity.get('context', ''))
+
+                        # Upgrade entity type if more specific
+                        type_priority = {
+                            'SUSPECT': 10, 'VICTIM': 9, 'WEAPON_USED': 8,
+                            'LAW_ENFORCEMENT': 7, 'CRIME_LOCATION': 6,
+                            'PERSON_OF_INTEREST': 5, 'LOCATION': 4,
+                            'WEAPON_MENTIONED': 3, 'TIMELINE_MARKER': 2
+                        }
+
+                        current_priority = type_priority.get(existing['entity_type'], 0)
+                        new_priority = type_priority.get(entity['type'], 0)
+
+                        if new_priority > current_priority:
+                            existing['entity_type'] = entity['type']
+
+                    else:
+                        # NEW ENTITY: Add to registry
+                        entity_registry[normalized_name] = {
+                            'name': entity['text'],
+                            'entity_type': entity['type'],
+                            'normalized_name': normalized_name,
+                            'confidence': entity.get('confidence', 0.8),
+                            'mention_count': 1,
+                            'all_contexts': [entity.get('context', '')[:500]],
+                            'first_seen': stmt.get('time_code', '00:00:00'),
+                            'company_id': company_id
+                        }
+
+                except Exception as entity_error:
+                    if debug: print(f"⚠️ Error processing entity: {str(entity_error)}")
+                    continue
+
+            total_processed += 1
+
+        except Exception as stmt_error:
+            if debug: print(f"❌ Error processing statement: {str(stmt_error)}")
+            continue
+
+    return entity_registry, total_processed
+
+def store_entity_registry(entity_registry: Dict, company_id: str = None, debug=False) -> int:
+    """Upsert the high-quality entities of a registry into topics"""
+    # STORE ONLY HIGH-QUALITY DEDUPLICATED ENTITIES
+    total_stored = 0
+    for entity_data in entity_registry.values():
+        try:
+            # Only store if mentioned multiple times OR high confidence
+            if entity_data['mention_count'] >= 2 or entity_data['confidence'] >= 0.8:
 
                 # Combine contexts intelligently
                 best_context = max(entity_data['all_contexts'], key=len)
@@ -899,6 +5111,31 @@ def enhance_transcript_with_investigation_ai(transcript_id: str, company_id: str
             if debug: print(f"⚠️ Error storing entity: {str(store_error)}")
             continue
 
+    return total_stored
+
+def enhance_transcript_with_investigation_ai(transcript_id: str, company_id: str = None, debug=False):
+    """FIXED: Enhanced knowledge graph with proper entity management"""
+
+    if debug:
+        print("🔍 ENHANCING TRANSCRIPT WITH INVESTIGATION AI")
+        print("=" * 60)
+
+    # Get statements - source_file_id is enough, no need for company_id filter
+    statements = supabase.table('statements')\
+        .select('*, speakers(name)')\
+        .eq('source_file_id', transcript_id)\
+        .order('time_seconds')\
+        .execute().data
+
+    if not statements:
+        print(f"❌ No statements found for transcript ID: {transcript_id}")
+        return 0
+
+    if debug: print(f"📊 Found {len(statements)} statements to process")
+
+    entity_registry, total_processed = build_entity_registry(statements, transcript_id, company_id, debug)
+    total_stored = store_entity_registry(entity_registry, company_id, debug)
+
     if debug:
         print(f"\n✅ INVESTIGATION ENHANCEMENT COMPLETE!")
         print(f"📊 Processed {total_processed}/{len(statements)} statements")
@@ -922,33 +5159,35 @@ def semantic_search_statements(query: str, limit: int = 10, transcript_id: str =
     if debug: print(f"🔍 SEMANTIC SEARCH: '{query}'")
 
     try:
-        query_embedding = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=query
-        ).data[0].embedding
+        query_embedding = get_query_embedding(query, company_id=company_id, debug=debug)
 
-        search_query = supabase.table('statements')\
-        .eq('company_id', company_id)\
-            .select('*, speakers(name), source_files(filename)')\
-            .order('embedding', desc=False)\
-            .limit(limit)
+        if ANN_INDEX_ENABLED:
+            # Top-k from the in-process index, then one fetch for just those rows
+            matches = ann_vector_matches(query_embedding, company_id, k=limit, transcript_id=transcript_id)
+            results_data = fetch_ranked_statements(matches, company_id)
+        else:
+            search_query = supabase.table('statements')\
+            .eq('company_id', company_id)\
+                .select('*, speakers(name), source_files(filename)')\
+                .order('embedding', desc=False)\
+                .limit(limit)
 
-        if transcript_id:
-            search_query = search_query.eq('source_file_id', transcript_id)
+            if transcript_id:
+                search_query = search_query.eq('source_file_id', transcript_id)
 
-        results = search_query.execute()
+            results_data = search_query.execute().data
 
         if debug:
-            print(f"✅ Found {len(results.data)} semantically similar statements")
-            for i, stmt in enumerate(results.data[:5], 1):
+            print(f"✅ Found {len(results_data)} semantically similar statements")
+            for i, stmt in enumerate(results_data[:5], 1):
                 speaker = stmt['speakers']['name'] if stmt['speakers'] else 'Unknown'
                 print(f"{i}. {speaker}: \"{stmt['exact_quote'][:100]}...\"")
 
-        return results.data
+        return results_data
 
     except Exception as e:
         print(f"❌ Semantic search error: {e}")
-        return keyword_search_fallback(query, limit, transcript_id)
+        return keyword_search_fallback(query, limit, company_id, transcript_id)
 
 def keyword_search_statements(query: str, limit: int = 10, transcript_id: str = None, company_id: str = None, debug=False):
     """EXACT keyword search for precise soundbite finding"""
@@ -957,25 +5196,28 @@ def keyword_search_statements(query: str, limit: int = 10, transcript_id: str =
     if debug: print(f"🔍 KEYWORD SEARCH: '{query}' (exact matching)")
 
     try:
-        search_query = supabase.table('statements')\
-            .select('*, speakers(name), source_files(filename)')\
-            .ilike('exact_quote', f'%{query}%')\
-            .eq('company_id', company_id)\
-            .order('time_seconds')\
-            .limit(limit)
+        # Already in .order('time_seconds') order (nulls last), at most limit rows
+        results_data = keyword_index_search([query], company_id, transcript_id, limit=limit, debug=debug)
+        if results_data is None:
+            search_query = supabase.table('statements')\
+                .select('*, speakers(name), source_files(filename)')\
+                .ilike('exact_quote', f'%{query}%')\
+                .eq('company_id', company_id)\
+                .order('time_seconds')\
+                .limit(limit)
 
-        if transcript_id:
-            search_query = search_query.eq('source_file_id', transcript_id)
+            if transcript_id:
+                search_query = search_query.eq('source_file_id', transcript_id)
 
-        results = search_query.execute()
+            results_data = search_query.execute().data
 
         if debug:
-            print(f"✅ Found {len(results.data)} exact keyword matches")
-            for i, stmt in enumerate(results.data[:5], 1):
+            print(f"✅ Found {len(results_data)} exact keyword matches")
+            for i, stmt in enumerate(results_data[:5], 1):
                 speaker = stmt['speakers']['name'] if stmt['speakers'] else 'Unknown'
                 print(f"{i}. {speaker}: \"{stmt['exact_quote'][:100]}...\"")
 
-        return format_search_results(results.data, search_type="KEYWORD")
+        return format_search_results(results_data, search_type="KEYWORD")
 
     except Exception as e:
         print(f"❌ Keyword search error: {e}")
@@ -987,6 +5229,10 @@ def keyword_search_fallback(query: str, limit: int = 10, company_id: str = None,
     if not company_id:
         raise ValueError("company_id required for data isolation")
     try:
+        results_data = keyword_index_search([query], company_id, transcript_id, limit=limit)
+        if results_data is not None:
+            return results_data
+
         search_query = supabase.table('statements')\
             .select('*, speakers(name), source_files(filename)')\
             .ilike('exact_quote', f'%{query}%')\
@@ -1031,6 +5277,25 @@ def format_search_results(results: list, search_type: str = "SEMANTIC"):
 # ========================================
 # SMART SEARCH FUNCTIONS (FROM CURRENT - KEEP ALL)
 # ========================================
+# Word lists shared by the per-quote scorers and BatchReranker
+SEMANTIC_RELATIONSHIPS = {
+    'weapon': ['gun', 'knife', 'pistol', 'rifle', 'firearm'],
+    'violence': ['attack', 'hit', 'beat', 'fight', 'assault'],
+    'death': ['murder', 'kill', 'dead', 'died', 'killed'],
+    'police': ['officer', 'detective', 'cop', 'law enforcement'],
+    'crime': ['murder', 'theft', 'robbery', 'assault', 'criminal']
+}
+CONTEXTUAL_INDICATORS = [
+    'about', 'regarding', 'concerning', 'related to', 'involving',
+    'said', 'told', 'explained', 'described', 'mentioned'
+]
+INFORMATIONAL_WORDS = ['because', 'when', 'where', 'how', 'why', 'what', 'then']
+DIRECT_SPEECH_PHRASES = ['he said', 'she said', 'i said', 'they said']
+TEMPORAL_MARKERS = ['then', 'after', 'before', 'when', 'while', 'during']
+EMOTIONAL_IMPACT_WORDS = ['shocking', 'surprising', 'devastating', 'incredible', 'unbelievable']
+DRAMATIC_WORDS = ['suddenly', 'immediately', 'then', 'screamed', 'yelled', 'cried']
+KEYWORD_CONTEXT_INDICATORS = ['about', 'said', 'told', 'described']
+
 def calculate_semantic_relevance_smart(quote: str, query: str) -> float:
     """Smart semantic relevance calculation using content analysis"""
     quote_lower = quote.lower()
@@ -1050,15 +5315,7 @@ def calculate_semantic_relevance_smart(quote: str, query: str) -> float:
     score += overlap_ratio * 3  # Up to +3 for complete word overlap
 
     # Semantic word relationships (crime-specific)
-    semantic_relationships = {
-        'weapon': ['gun', 'knife', 'pistol', 'rifle', 'firearm'],
-        'violence': ['attack', 'hit', 'beat', 'fight', 'assault'],
-        'death': ['murder', 'kill', 'dead', 'died', 'killed'],
-        'police': ['officer', 'detective', 'cop', 'law enforcement'],
-        'crime': ['murder', 'theft', 'robbery', 'assault', 'criminal']
-    }
-
-    for main_concept, related_words in semantic_relationships.items():
+    for main_concept, related_words in SEMANTIC_RELATIONSHIPS.items():
         if main_concept in query_lower:
             related_count = sum(1 for word in related_words if word in quote_lower)
             score += related_count * 0.5  # Boost for related concepts
@@ -1082,26 +5339,19 @@ def calculate_contextual_relevance_smart(quote: str, query: str) -> float:
     score = 5.0
 
     # Query appears in meaningful context
-    contextual_indicators = [
-        'about', 'regarding', 'concerning', 'related to', 'involving',
-        'said', 'told', 'explained', 'described', 'mentioned'
-    ]
-
-    for indicator in contextual_indicators:
+    for indicator in CONTEXTUAL_INDICATORS:
         if f"{indicator} {query_lower}" in quote_lower or f"{query_lower} {indicator}" in quote_lower:
             score += 1.5
 
     # Statement provides new information about the query topic
-    informational_words = ['because', 'when', 'where', 'how', 'why', 'what', 'then']
-    score += sum(0.5 for word in informational_words if word in quote_lower)
+    score += sum(0.5 for word in INFORMATIONAL_WORDS if word in quote_lower)
 
     # Direct speech (quotes often more valuable)
-    if any(phrase in quote_lower for phrase in ['he said', 'she said', 'i said', 'they said']):
+    if any(phrase in quote_lower for phrase in DIRECT_SPEECH_PHRASES):
         score += 1.0
 
     # Temporal markers (timeline relevance)
-    temporal_markers = ['then', 'after', 'before', 'when', 'while', 'during']
-    score += sum(0.3 for marker in temporal_markers if marker in quote_lower)
+    score += sum(0.3 for marker in TEMPORAL_MARKERS if marker in quote_lower)
 
     return max(1.0, min(10.0, score))
 
@@ -1111,12 +5361,10 @@ def calculate_media_value_smart(quote: str, query: str) -> float:
     score = 5.0
 
     # Emotional impact (great for TV)
-    emotional_impact = ['shocking', 'surprising', 'devastating', 'incredible', 'unbelievable']
-    score += sum(1.5 for word in emotional_impact if word in quote_lower)
+    score += sum(1.5 for word in EMOTIONAL_IMPACT_WORDS if word in quote_lower)
 
     # Dramatic content
-    dramatic_words = ['suddenly', 'immediately', 'then', 'screamed', 'yelled', 'cried']
-    score += sum(1.0 for word in dramatic_words if word in quote_lower)
+    score += sum(1.0 for word in DRAMATIC_WORDS if word in quote_lower)
 
     # Clear, quotable statements
     if len(quote.split()) >= 8 and len(quote.split()) <= 25:  # Good length for TV
@@ -1153,7 +5401,7 @@ def calculate_keyword_relevance_smart(quote: str, keyword: str) -> float:
         surrounding = ' '.join(context_words[start_context:end_context])
 
         # High-value context indicators
-        if any(indicator in surrounding for indicator in ['about', 'said', 'told', 'described']):
+        if any(indicator in surrounding for indicator in KEYWORD_CONTEXT_INDICATORS):
             score += 1.0
 
     # Quote detail level
@@ -1167,82 +5415,522 @@ def calculate_keyword_relevance_smart(quote: str, keyword: str) -> float:
 
     return max(1.0, min(10.0, score))
 
+def _sum_repeated(value: float, count: int) -> float:
+    """sum(value for ...) over `count` hits, with the same rounding as the generator sums above"""
+    return sum(value for _ in range(count))
+
+class BatchReranker:
+    """
+    Scores a whole candidate set at once with exactly the results of the
+    calculate_*_smart functions. Quotes are lowercased and tokenized once;
+    a marker without whitespace is in a quote iff it is in one of its words,
+    so each marker is tested against the distinct words only and mapped back
+    to candidates as arrays. Additions happen in the same order as the
+    per-quote functions so the floats match bit for bit.
+    """
+
+    def __init__(self, quotes: List[str]):
+        self.quotes = quotes
+        self.n = len(quotes)
+        self.lowered = [quote.lower() for quote in quotes]
+
+        tokens, lengths = [], []
+        for q in self.lowered:
+            words = q.split()
+            lengths.append(len(words))
+            tokens.extend(words)
+        self.vocab_words = list(dict.fromkeys(tokens))
+        self.vocab = {word: i for i, word in enumerate(self.vocab_words)}
+        self.token_ids = np.fromiter(map(self.vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+        self.word_counts = np.asarray(lengths, dtype=np.int64)   # == len(quote.split())
+        self.token_cands = np.repeat(np.arange(self.n), self.word_counts)
+        self.token_starts = np.concatenate([[0], np.cumsum(self.word_counts)]).astype(np.int64)
+        self._presence = {}
+        self._word_flags = {}
+
+    def word_flags(self, pattern: str) -> np.ndarray:
+        """Per distinct word: pattern in word"""
+        flags = self._word_flags.get(pattern)
+        if flags is None:
+            flags = np.fromiter((pattern in word for word in self.vocab_words), dtype=bool, count=len(self.vocab_words))
+            self._word_flags[pattern] = flags
+        return flags
+
+    def present(self, pattern: str) -> np.ndarray:
+        """Per candidate: pattern in quote.lower()"""
+        found = self._presence.get(pattern)
+        if found is not None:
+            return found
+
+        pieces = pattern.split()
+        if pieces == [pattern]:
+            found = np.zeros(self.n, dtype=bool)
+            found[self.token_cands[self.word_flags(pattern)[self.token_ids]]] = True
+        elif pieces:
+            # Every piece must occur somewhere; confirm the exact phrase on those only
+            possible = np.ones(self.n, dtype=bool)
+            for piece in pieces:
+                possible &= self.present(piece)
+            found = np.zeros(self.n, dtype=bool)
+            for i in np.flatnonzero(possible).tolist():
+                found[i] = pattern in self.lowered[i]
+        else:
+            found = np.fromiter((pattern in q for q in self.lowered), dtype=bool, count=self.n)
+
+        self._presence[pattern] = found
+        return found
+
+    def count(self, pattern: str) -> np.ndarray:
+        """Per candidate: quote.lower().count(pattern)"""
+        if not pattern:
+            return np.fromiter((q.count(pattern) for q in self.lowered), dtype=np.int64, count=self.n)
+        counts = np.zeros(self.n, dtype=np.int64)
+        for i in np.flatnonzero(self.present(pattern)).tolist():
+            counts[i] = self.lowered[i].count(pattern)
+        return counts
+
+    def _present_count(self, patterns: List[str]) -> np.ndarray:
+        total = np.zeros(self.n, dtype=np.int64)
+        for pattern in patterns:
+            total += self.present(pattern)
+        return total
+
+    def _add_repeated(self, score: np.ndarray, value: float, counts: np.ndarray):
+        table = np.asarray([_sum_repeated(value, k) for k in range(int(counts.max(initial=0)) + 1)])
+        score += table[counts]
+
+    def semantic(self, query: str) -> np.ndarray:
+        """calculate_semantic_relevance_smart for every candidate"""
+        query_lower = query.lower()
+        score = np.full(self.n, 5.0)
+
+        query_word_set = set(query_lower.split())
+        overlap = np.zeros(self.n, dtype=np.int64)
+        for word in query_word_set:
+            token_id = self.vocab.get(word)
+            if token_id is not None:
+                hit = np.zeros(self.n, dtype=bool)
+                hit[self.token_cands[self.token_ids == token_id]] = True
+                overlap += hit
+        overlap_ratio = overlap / len(query_word_set) if query_word_set else np.zeros(self.n)
+        score += overlap_ratio * 3
+
+        for main_concept, related_words in SEMANTIC_RELATIONSHIPS.items():
+            if main_concept in query_lower:
+                score += self._present_count(related_words) * 0.5
+
+        score += np.where(self.word_counts >= 15, 1.0, 0.0)
+        score += np.where(self.word_counts >= 30, 1.0, 0.0)
+        score -= np.where(self.word_counts < 5, 2.0, 0.0)
+        return np.clip(score, 1.0, 10.0)
+
+    def contextual(self, query: str) -> np.ndarray:
+        """calculate_contextual_relevance_smart for every candidate"""
+        query_lower = query.lower()
+        score = np.full(self.n, 5.0)
+
+        for indicator in CONTEXTUAL_INDICATORS:
+            hit = self.present(f"{indicator} {query_lower}") | self.present(f"{query_lower} {indicator}")
+            score += np.where(hit, 1.5, 0.0)
+
+        self._add_repeated(score, 0.5, self._present_count(INFORMATIONAL_WORDS))
+
+        direct_speech = np.zeros(self.n, dtype=bool)
+        for phrase in DIRECT_SPEECH_PHRASES:
+            direct_speech |= self.present(phrase)
+        score += np.where(direct_speech, 1.0, 0.0)
+
+        self._add_repeated(score, 0.3, self._present_count(TEMPORAL_MARKERS))
+        return np.clip(score, 1.0, 10.0)
+
+    def media(self, query: str = None) -> np.ndarray:
+        """calculate_media_value_smart for every candidate"""
+        score = np.full(self.n, 5.0)
+        self._add_repeated(score, 1.5, self._present_count(EMOTIONAL_IMPACT_WORDS))
+        self._add_repeated(score, 1.0, self._present_count(DRAMATIC_WORDS))
+        score += np.where((self.word_counts >= 8) & (self.word_counts <= 25), 1.5, 0.0)
+        complete = np.fromiter((quote.strip().endswith(('.', '!', '?')) for quote in self.quotes), dtype=bool, count=self.n)
+        score += np.where(complete, 1.0, 0.0)
+        return np.clip(score, 1.0, 10.0)
+
+    def keyword(self, keyword: str) -> np.ndarray:
+        """calculate_keyword_relevance_smart for every candidate"""
+        keyword_lower = keyword.lower()
+        score = np.full(self.n, 5.0)
+
+        score += np.minimum(3.0, self.count(keyword_lower) * 1.0)
+
+        edge = np.fromiter((q.startswith(keyword_lower) or q.endswith(keyword_lower) for q in self.lowered),
+                           dtype=bool, count=self.n)
+        score += np.where(edge, 1.5, 0.0)
+
+        # Words containing the keyword with an indicator word within +-2 positions
+        if len(self.token_ids):
+            keyword_words = self.word_flags(keyword_lower)[self.token_ids]
+            indicator_words = self._indicator_words()[self.token_ids]
+            index = np.arange(len(self.token_ids))
+            first = self.token_starts[self.token_cands]
+            last = self.token_starts[self.token_cands + 1]
+            cumulative = np.concatenate([[0], np.cumsum(indicator_words)])
+            in_context = cumulative[np.minimum(last, index + 3)] - cumulative[np.maximum(first, index - 2)] > 0
+            score += np.bincount(self.token_cands[keyword_words & in_context], minlength=self.n) * 1.0
+
+        score += np.where(self.word_counts >= 15, 1.0, 0.0)
+        score += np.where(self.word_counts >= 30, 1.0, np.where(self.word_counts < 5, -1.5, 0.0))
+        return np.clip(score, 1.0, 10.0)
+
+    def _indicator_words(self) -> np.ndarray:
+        flags = np.zeros(len(self.vocab_words), dtype=bool)
+        for indicator in KEYWORD_CONTEXT_INDICATORS:
+            flags |= self.word_flags(indicator)
+        return flags
+
+def benchmark_reranker(sizes=(100, 1000, 10000), query: str = "weapon violence then", repeats: int = 3) -> List[Dict]:
+    """Per-query re-rank cost: per-quote scorer loop vs BatchReranker (and a check that scores match)"""
+    rng = random.Random(0)
+    vocabulary = ("he said she told about the gun knife officer then when suddenly shocking murder because "
+                  "after before during money truck weapon violence attack described incredible what why how "
+                  "drugs dealer victim night car house police detective i they we you it was is").split()
+
+    def make_quote():
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(2, 40))]
+        return ' '.join(words).capitalize() + rng.choice(['.', '!', '?', '', '...'])
+
+    report = []
+    for size in sizes:
+        quotes = [make_quote() for _ in range(size)]
+
+        loop_times, batch_times = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            expected = [(calculate_semantic_relevance_smart(q, query), calculate_contextual_relevance_smart(q, query),
+                         calculate_keyword_relevance_smart(q, query), calculate_media_value_smart(q, query)) for q in quotes]
+            loop_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ranker = BatchReranker(quotes)
+            got = list(zip(ranker.semantic(query).tolist(), ranker.contextual(query).tolist(),
+                           ranker.keyword(query).tolist(), ranker.media(query).tolist()))
+            batch_times.append(time.perf_counter() - start)
+
+        row = {
+            'candidates': size,
+            'loop_ms': round(min(loop_times) * 1000, 2),
+            'batch_ms': round(min(batch_times) * 1000, 2),
+            'speedup': round(min(loop_times) / min(batch_times), 1),
+            'scores_match': got == expected
+        }
+        report.append(row)
+        print(f"⚡ {size:>6} candidates: loop {row['loop_ms']:>8} ms   batch {row['batch_ms']:>7} ms   "
+              f"{row['speedup']}x   scores match: {row['scores_match']}")
+    return report
+
+def _fuzzy_match_row(row: Dict, match: Dict) -> Dict:
+    """Metadata row + a fuzzy_keyword_matches entry (matched_text only for typo matches)"""
+    row = {**row, 'edit_distance': match['edit_distance'], 'match_spans': match['match_spans']}
+    if match['edit_distance']:
+        start, end = match['best_span']
+        row['matched_text'] = (row.get('exact_quote') or '')[start:end]
+    return row
+
+def rank_keyword_rows(rows: List[Dict], query: str) -> List[Dict]:
+    """
+    Score keyword matches in one pass and keep the relevant ones (combined
+    score >= 6.0), best first. Relevance is scored on the words each row
+    actually matched: matched_text (typo matches), else search_term, else
+    the query. Ranked by fuzzy_score - combined score less a penalty per edit.
+    """
+    media_values = BatchReranker([row['exact_quote'] for row in rows]).media().tolist()
+    relevance_scores = [0.0] * len(rows)
+    by_keyword = defaultdict(list)
+    for i, row in enumerate(rows):
+        by_keyword[row.get('matched_text') or row.get('search_term') or query].append(i)
+    for keyword, positions in by_keyword.items():
+        scores = BatchReranker([rows[i]['exact_quote'] for i in positions]).keyword(keyword).tolist()
+        for i, score in zip(positions, scores):
+            relevance_scores[i] = score
+
+    # SMART FILTER: Only include truly relevant keyword matches
+    relevant_results = []
+    for row, relevance_score, media_value in zip(rows, relevance_scores, media_values):
+        combined_score = (relevance_score + media_value) / 2
+        if combined_score >= 6.0:
+            relevant_results.append({
+                **row,
+                'relevance_score': relevance_score,
+                'media_value': media_value,
+                'combined_score': combined_score,
+                'fuzzy_score': combined_score - KEYWORD_FUZZY_PENALTY * row.get('edit_distance', 0)
+            })
+    relevant_results.sort(key=lambda x: x['fuzzy_score'], reverse=True)
+    return relevant_results
+
+def keyword_search_smart(query: str, company_id: str = None, transcript_id: str = None, debug=False,
+                         syntax: bool = None):
+    """SMART KEYWORD SEARCH with fuzzy matching (syntax: see is_keyword_query)"""
+    if not company_id:
+        raise ValueError("company_id required for data isolation")
+
+    if debug: print(f"🔍 SMART KEYWORD SEARCH: '{query}'")
+
+    # Phrases / NEAR / speaker: / after: before: (or syntax=True) go to the query evaluator
+    if is_keyword_query(query, syntax):
+        results = keyword_query_search(query, company_id, transcript_id, debug=debug)
+        if results is not None:
+            return results
+
+    try:
+        # One postings pass: substring matches plus typo-tolerant expansions (trigram index)
+        fuzzy_matches = fuzzy_keyword_matches(query, company_id, transcript_id, debug=debug)
+        if fuzzy_matches is not None:
+            metadata = fetch_statement_metadata(list(fuzzy_matches), company_id)
+            unique_results = [_fuzzy_match_row(metadata[statement_id], match)
+                              for statement_id, match in fuzzy_matches.items() if statement_id in metadata]
+        else:
+            # Generate fuzzy variations
+            query_variations = [query]
+            query_variations.append(query.replace("'", ""))
+            query_variations.append(query.replace("’", ""))
+            if "'" not in query and "’" not in query:
+                words = query.split()
+                for i, word in enumerate(words):
+                    if word.endswith('s') and len(word) > 1:
+                        modified = words.copy()
+                        modified[i] = word[:-1] + "'s"
+                        query_variations.append(" ".join(modified))
+            query_variations = list(set(query_variations))
+            if debug: print(f"   Searching variations: {query_variations}")
+
+            # Search all variations and combine
+            all_results = []
+            for variation in query_variations:
+                search_query = supabase.table('statements')\
+                    .select('*, speakers(name), source_files(filename)')\
+                    .ilike('exact_quote', f'%{variation}%')\
+                    .eq('company_id', company_id)
+
+                if transcript_id:
+                    search_query = search_query.eq('source_file_id', transcript_id)
+
+                all_results.extend(search_query.execute().data)
+
+            # Deduplicate by statement id
+            seen_ids = set()
+            unique_results = []
+            for result in all_results:
+                if result['id'] not in seen_ids:
+                    seen_ids.add(result['id'])
+                    unique_results.append(result)
+
+        relevant_results = rank_keyword_rows(unique_results, query)
+
+        if debug:
+            print(f"✅ Found {len(relevant_results)} relevant keyword matches (filtered from {len(unique_results)} total)")
+            for i, stmt in enumerate(relevant_results[:5], 1):
+                speaker = stmt['speakers']['name'] if stmt.get('speakers') else 'Unknown'
+                score = stmt['combined_score']
+                print(f"{i}. {speaker} [SCORE: {score:.1f}]: \"{stmt['exact_quote'][:100]}...\"")
+
+        return relevant_results
 
+    except Exception as e:
+        print(f"❌ Smart keyword search failed: {e}")
+        return []
 
 # ========================================
 # AI-ENHANCED SEARCH FUNCTIONS (ADDITIONS - DON'T MODIFY EXISTING)
 # ========================================
 
-def keyword_search_ai_enhanced(query: str, transcript_id: str = None, debug=False):
-    """AI-Enhanced Keyword Search - Expands query with synonyms and variations"""
-    if debug: print(f"🤖 AI-ENHANCED KEYWORD SEARCH: '{query}'")
+# ========================================
+# QUERY EXPANSION CACHE
+# In-process LRU -> shared cached_query_expansions table -> GPT-4
+# Run once in the Supabase SQL editor:
+#   CREATE TABLE IF NOT EXISTS cached_query_expansions (
+#     query text NOT NULL, model text NOT NULL, expansion jsonb NOT NULL,
+#     created_at timestamptz DEFAULT now(), PRIMARY KEY (query, model));
+# ========================================
+QUERY_EXPANSION_TABLE = 'cached_query_expansions'
+QUERY_EXPANSION_MODEL = os.getenv('QUERY_EXPANSION_MODEL', 'gpt-4-turbo')
+QUERY_EXPANSION_CACHE_SIZE = int(os.getenv('QUERY_EXPANSION_CACHE_SIZE', '10000'))
+QUERY_EXPANSION_MAX_TERMS = 5     # Expanded terms searched alongside the original
+AI_ORIGINAL_TERM_BOOST = 2.0      # Score bonus for rows the original query found
+
+query_expansion_cache = OrderedDict()     # (normalized query, model) -> expansion, oldest first
+query_expansion_lock = threading.Lock()
+
+def _remember_query_expansion(key: tuple, expansion: Dict):
+    with query_expansion_lock:
+        query_expansion_cache[key] = expansion
+        query_expansion_cache.move_to_end(key)
+        while len(query_expansion_cache) > QUERY_EXPANSION_CACHE_SIZE:
+            query_expansion_cache.popitem(last=False)
+
+def _store_query_expansion(normalized: str, model: str, expansion: Dict):
+    try:
+        supabase.table(QUERY_EXPANSION_TABLE).upsert({
+            'query': normalized,
+            'model': model,
+            'expansion': expansion
+        }, on_conflict='query,model').execute()
+    except Exception as e:
+        print(f"⚠️ Could not share query expansion: {e}")
+
+def expand_query(query: str, model: str = QUERY_EXPANSION_MODEL, debug=False) -> Dict:
+    """
+    GPT-4 synonyms/variations for a search query:
+    {'original', 'expanded_terms', 'concepts'}. Cached per normalized
+    query and model - in process, then in cached_query_expansions shared
+    by every worker - so only the first search for a topic waits on the
+    model. The normalized query is only the cache key - the model sees,
+    and 'original' returns, the query as typed. Failures return no
+    expansions and are not cached.
+    """
+    normalized = normalize_query(query) or query.lower().strip()
+    key = (normalized, model)
+
+    with query_expansion_lock:
+        expansion = query_expansion_cache.get(key)
+        if expansion is not None:
+            query_expansion_cache.move_to_end(key)
+    if expansion is not None:
+        if debug: print(f"💰 Query expansion from memory: '{normalized}'")
+        return {**expansion, 'original': query}
 
     try:
-        # Step 1: Get query expansion from GPT-4
-        expansion_prompt = f"""Given the search query '{query}' in a crime investigation context,
-        provide related terms, synonyms, and variations.
+        rows = supabase.table(QUERY_EXPANSION_TABLE).select('expansion')\
+            .eq('query', normalized)\
+            .eq('model', model)\
+            .limit(1)\
+            .execute().data
+    except Exception as e:
+        if debug: print(f"⚠️ {QUERY_EXPANSION_TABLE} lookup failed: {e}")
+        rows = []
+
+    if rows and rows[0].get('expansion') is not None:
+        expansion = rows[0]['expansion']
+        expansion = json.loads(expansion) if isinstance(expansion, str) else expansion
+        _remember_query_expansion(key, expansion)
+        if debug: print(f"💰 Query expansion from {QUERY_EXPANSION_TABLE}: '{normalized}'")
+        return {**expansion, 'original': query}
 
-        Return a JSON object with:
-        - original: the original query
-        - expanded_terms: array of related terms
-        - concepts: array of related concepts
+    if debug: print(f"📡 Query expansion from {model}: '{normalized}'")
+    expansion_prompt = f"""Given the search query '{query}' in a crime investigation context,
+    provide related terms, synonyms, and variations.
 
-        Example: for "shot", include: fired, gunshot, shooting, discharged, etc."""
+    Return a JSON object with:
+    - original: the original query
+    - expanded_terms: array of related terms
+    - concepts: array of related concepts
 
+    Example: for "shot", include: fired, gunshot, shooting, discharged, etc."""
+
+    try:
+        openai_request_limiter.acquire()
+        openai_token_limiter.acquire(estimate_tokens([expansion_prompt]))
         response = client.chat.completions.create(
-            model="gpt-4-turbo",
+            model=model,
             messages=[
-                {"role": "system", "content": "You are a true crime investigation expert. Extract entities with extreme precision."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": "You are a true crime investigation expert. Return only valid JSON."},
+                {"role": "user", "content": expansion_prompt}
             ],
-            temperature=0.1
+            temperature=0.1,
+            response_format={"type": "json_object"}
         )
-
         result = json.loads(response.choices[0].message.content)
-        print(f"DEBUG - Raw OpenAI response: {response.choices[0].message.content[:500]}")
-        entities = result.get('entities', [])
+    except Exception as e:
+        print(f"⚠️ Query expansion failed: {e}")
+        return {'original': query, 'expanded_terms': [], 'concepts': []}
 
-        import json
-        expansion = json.loads(response.choices[0].message.content)
+    expansion = {
+        'original': query,
+        'expanded_terms': [t.strip() for t in result.get('expanded_terms', []) if isinstance(t, str) and t.strip()],
+        'concepts': [c for c in result.get('concepts', []) if isinstance(c, str)]
+    }
+    _remember_query_expansion(key, expansion)
 
-        if debug:
-            print(f"✅ Expanded terms: {expansion['expanded_terms']}")
+    # Share with other workers without holding up this search
+    threading.Thread(target=_store_query_expansion, args=(normalized, model, expansion), daemon=True).start()
+    return expansion
 
-        # Step 2: Search for original + expanded terms
-        all_results = []
-        search_terms = [query] + expansion.get('expanded_terms', [])[:5]  # Limit to avoid too many searches
+def keyword_search_ai_enhanced(query: str, company_id: str = None, transcript_id: str = None, debug=False,
+                               syntax: bool = None):
+    """
+    AI-Enhanced Keyword Search - Expands query with synonyms and variations.
+    All terms are looked up in one pass over the keyword index, with a single
+    metadata fetch for the union of matches, then deduplicated and scored in
+    one merge pass. Without the index, the per-term searches run concurrently.
+    """
+    if not company_id:
+        raise ValueError("company_id required for data isolation")
 
-        for term in search_terms:
-            # Use existing smart search
-            results = keyword_search_smart(term, transcript_id, debug=False)
-            for r in results:
-                r['search_term'] = term  # Track which term found it
-                r['is_expanded'] = (term != query)
-            all_results.extend(results)
+    if debug: print(f"🤖 AI-ENHANCED KEYWORD SEARCH: '{query}'")
 
-        # Step 3: Deduplicate and re-score
+    # Phrase/boolean/filter queries are already precise - and BM25-scored, so not mixed with expansions
+    if is_keyword_query(query, syntax):
+        return [{**r, 'search_term': query, 'is_expanded': False}
+                for r in keyword_search_smart(query, company_id, transcript_id, debug=debug, syntax=syntax)]
+
+    # Step 1: Expansion (cached - a repeat search skips GPT-4)
+    expansion = expand_query(query, debug=debug)
+    if debug: print(f"✅ Expanded terms: {expansion['expanded_terms']}")
+
+    search_terms = [query]
+    seen_terms = {query.lower()}
+    for term in expansion.get('expanded_terms', []):
+        if len(search_terms) > QUERY_EXPANSION_MAX_TERMS:
+            break
+        if term.lower() not in seen_terms and not is_keyword_query(term):
+            seen_terms.add(term.lower())
+            search_terms.append(term)
+
+    # Step 2: One index lookup per term (in memory), one metadata round trip for all of them
+    term_matches = []
+    for term in search_terms:
+        matches = fuzzy_keyword_matches(term, company_id, transcript_id, debug=debug)
+        if matches is None:
+            term_matches = None
+            break
+        term_matches.append((term, matches))
+
+    if term_matches is not None:
+        # Each statement keeps the term that found it best: the original query, then fewest edits
+        best = {}
+        for term, matches in term_matches:
+            for statement_id, match in matches.items():
+                rank = (term != query, match['edit_distance'])
+                if statement_id not in best or rank < best[statement_id][0]:
+                    best[statement_id] = (rank, term, match)
+        metadata = fetch_statement_metadata(list(best), company_id)
+        rows = []
+        for statement_id, (_, term, match) in best.items():
+            if statement_id in metadata:
+                row = _fuzzy_match_row(metadata[statement_id], match)
+                row['search_term'] = term
+                rows.append(row)
+        results = rank_keyword_rows(rows, query)
+    else:
+        futures = [_hybrid_executor.submit(keyword_search_smart, term, company_id, transcript_id)
+                   for term in search_terms]
         seen_ids = set()
-        unique_results = []
-        for r in all_results:
-            if r['id'] not in seen_ids:
-                seen_ids.add(r['id'])
-                # Boost score if found by original term
-                if not r['is_expanded']:
-                    r['combined_score'] = r.get('combined_score', 5) + 2
-                unique_results.append(r)
-
-        # Sort by score
-        unique_results.sort(key=lambda x: x.get('combined_score', 0), reverse=True)
-
-        if debug:
-            print(f"✅ Found {len(unique_results)} unique results across all terms")
+        results = []
+        for term, future in zip(search_terms, futures):
+            for r in future.result():
+                if r['id'] not in seen_ids:
+                    seen_ids.add(r['id'])
+                    results.append({**r, 'search_term': term})
+
+    # Step 3: Boost rows found by the original term, then sort
+    for r in results:
+        r['is_expanded'] = r['search_term'] != query
+        if not r['is_expanded']:
+            r['combined_score'] += AI_ORIGINAL_TERM_BOOST
+            r['fuzzy_score'] += AI_ORIGINAL_TERM_BOOST
+    results.sort(key=lambda x: x['fuzzy_score'], reverse=True)
 
-        return unique_results
+    if debug:
+        print(f"✅ Found {len(results)} unique results across {len(search_terms)} terms")
 
-    except Exception as e:
-        print(f"❌ AI enhancement failed: {e}, falling back to standard search")
-        # FALLBACK to existing search
-        return keyword_search_smart(query, transcript_id, debug)
+    return results
 
 
 
@@ -1768,8 +6456,8 @@ def search_speaker_statements(speaker: str, topic: str = None, transcript_id: st
     # If topic specified, filter semantically
     if topic and results:
         relevant_results = []
-        for stmt in results:
-            relevance = calculate_semantic_relevance_smart(stmt['exact_quote'], topic)
+        relevance_scores = BatchReranker([stmt['exact_quote'] for stmt in results]).semantic(topic).tolist()
+        for stmt, relevance in zip(results, relevance_scores):
             if relevance >= 6.0:
                 relevant_results.append({
                     **stmt,
@@ -2590,6 +7278,7 @@ def delete_transcript(transcript_id):
             .eq('source_file_id', transcript_id)\
             .eq('company_id', company_id)\
             .execute()
+        ann_remove_source(company_id, transcript_id)
         print(f"  ✅ Deleted statements")
 
         # 2. Delete speakers
@@ -2643,18 +7332,15 @@ def api_semantic_search():
 
         print(f"📊 Got {len(results)} results from semantic_search_smart")
 
+        full_quote, snippet_chars = search_projection(data)
         formatted = []
-        for r in results[:20]:
+        for r in attach_snippets(results[:20], data['query'], company_id, snippet_chars):
             # Don't use combined_score if it's broken
             # Just take the first 20 results as they're already sorted by relevance
-            formatted.append({
-                'id': r.get('id'),
-                'exact_quote': r.get('exact_quote'),
-                'speaker': r['speakers']['name'] if r.get('speakers') else 'Unknown',
-                'time_code': r.get('time_code', '00:00:00'),
-                'source_file': r['source_files']['filename'] if r.get('source_files') else 'Unknown',
-                'score': 8.0  # Fixed score instead of broken combined_score
-            })
+            formatted.append(project_search_result(
+                r, full_quote,
+                score=8.0  # Fixed score instead of broken combined_score
+            ))
 
         print(f"✅ Returning {len(formatted)} formatted results")
         return jsonify(formatted)
@@ -2687,21 +7373,60 @@ def api_keyword_search():
             data['query'],
             company_id=company_id,  # PASS COMPANY_ID
             transcript_id=data.get('transcript_id'),
+            debug=True,
+            syntax=keyword_syntax_option(data)
+        )
+        full_quote, snippet_chars = search_projection(data)
+        formatted = [project_search_result(r, full_quote)
+                     for r in attach_snippets(results[:20], data['query'], company_id, snippet_chars)]
+
+        return jsonify(formatted)
+    except KeywordQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Keyword Search Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/v2/hybrid-search', methods=['POST'])
+def api_hybrid_search():
+    """BM25 + vector search fused with reciprocal rank fusion"""
+    try:
+        data = request.json
+
+        # Get API key from header
+        api_key = request.headers.get('X-API-Key')
+        if not api_key:
+            return jsonify({"error": "API key required"}), 401
+
+        # Get company_id from API key
+        company_id = get_company_from_api_key(api_key)
+
+        results = hybrid_search(
+            data['query'],
+            company_id=company_id,
+            transcript_id=data.get('transcript_id'),
+            k=int(data.get('limit', 20)),
+            weights=data.get('weights'),
             debug=True
         )
+
+        full_quote, snippet_chars = search_projection(data)
         formatted = []
-        for r in results[:20]:
-            formatted.append({
-                'id': r.get('id'),
-                'exact_quote': r.get('exact_quote'),
-                'speaker': r['speakers']['name'] if r.get('speakers') else 'Unknown',
-                'time_code': r.get('time_code', '00:00:00'),
-                'source_file': r['source_files']['filename'] if r.get('source_files') else 'Unknown'
-            })
+        for r in attach_snippets(results, data['query'], company_id, snippet_chars):
+            formatted.append(project_search_result(
+                r, full_quote,
+                rrf_score=r['rrf_score'],
+                bm25_score=r['bm25_score'],
+                bm25_rank=r['bm25_rank'],
+                similarity=r['similarity'],
+                vector_rank=r['vector_rank']
+            ))
 
         return jsonify(formatted)
     except Exception as e:
-        print(f"❌ Keyword Search Error: {e}")
+        print(f"❌ Hybrid Search Error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -2724,22 +7449,22 @@ def api_keyword_search_ai():
             data['query'],
             company_id=company_id,  # PASS COMPANY_ID
             transcript_id=data.get('transcript_id'),
-            debug=False
+            debug=False,
+            syntax=keyword_syntax_option(data)
         )
 
         # Format same as regular keyword search
+        full_quote, snippet_chars = search_projection(data)
         formatted = []
-        for r in results[:20]:
-            formatted.append({
-                'id': r.get('id'),
-                'exact_quote': r.get('exact_quote'),
-                'speaker': r['speakers']['name'] if r.get('speakers') else 'Unknown',
-                'time_code': r.get('time_code', '00:00:00'),
-                'source_file': r['source_files']['filename'] if r.get('source_files') else 'Unknown',
-                'search_term': r.get('search_term', data['query']),
-                'score': r.get('combined_score', 0)
-            })
+        for r in attach_snippets(results[:20], data['query'], company_id, snippet_chars):
+            formatted.append(project_search_result(
+                r, full_quote,
+                search_term=r.get('search_term', data['query']),
+                score=r.get('combined_score', 0)
+            ))
         return jsonify(formatted)
+    except KeywordQueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"❌ AI Keyword Search Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -3005,43 +7730,33 @@ def upload_transcript_endpoint():
         # Get company_id from API key
         company_id = get_company_from_api_key(api_key)
 
-        # Save file temporarily
-        temp_path = f"/content/{file.filename}"
-        file.save(temp_path)
-
-        print(f"📤 Received upload: {file.filename}")
+        # Keep the upload in memory - no temp file, nothing to collide on
+        data = file.read()
+        if not data:
+            return jsonify({'error': 'Empty file'}), 400
 
-        # === ADD THESE 4 LINES FOR DIAGNOSTICS ===
-        import docx
-        doc = docx.Document(temp_path)
-        text = '\n'.join([p.text for p in doc.paragraphs])
-        print(f"📊 DIAGNOSTIC: Extracted {len(text)} chars, First 500: {text[:500]}")
+        print(f"📤 Received upload: {file.filename} ({len(data):,} bytes)")
 
-        # Process the transcript
-        success = process_transcript_file(
-            file_path=temp_path,
-            filename=file.filename,
-            company_id=company_id,
-            debug=True
-        )
+        # Re-ingest mode: a corrected version of a transcript this company already has
+        replaces = request.form.get('transcript_id')
+        if replaces:
+            owned = supabase.table('source_files').select('id')\
+                .eq('id', replaces)\
+                .eq('company_id', company_id)\
+                .execute()
+            if not owned.data:
+                return jsonify({'error': 'Transcript not found or unauthorized'}), 404
 
-        # Clean up temp file
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+        # Queue for background processing
+        job = ingest_jobs.submit(company_id, file.filename, data, replaces=replaces)
 
-        if success:
-            return jsonify({
-                'status': 'success',
-                'message': f'Transcript {file.filename} processed successfully',
-                'filename': file.filename
-            }), 200
-        else:
-            return jsonify({
-                'status': 'error',
-                'message': 'Processing failed'
-            }), 500
+        return jsonify({
+            'status': 'queued',
+            'message': f'Transcript {file.filename} queued for processing',
+            'filename': file.filename,
+            'job_id': job['job_id'],
+            'status_url': f"/ingest-jobs/{job['job_id']}"
+        }), 202
 
     except Exception as e:
         print(f"❌ Upload error: {e}")
@@ -3049,6 +7764,68 @@ def upload_transcript_endpoint():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ingest-jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """Status, per-stage progress and throughput of an upload"""
+    try:
+        api_key = request.headers.get('X-API-Key')
+        if not api_key:
+            return jsonify({"error": "API key required"}), 401
+
+        company_id = get_company_from_api_key(api_key)
+
+        job = ingest_jobs.snapshot(job_id, company_id=company_id)
+        if not job:
+            return jsonify({"error": "Job not found or unauthorized"}), 404
+
+        return jsonify(job)
+    except Exception as e:
+        print(f"Error getting ingest job: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/ingest-jobs', methods=['GET'])
+def list_ingest_jobs():
+    """All recent uploads for this company"""
+    try:
+        api_key = request.headers.get('X-API-Key')
+        if not api_key:
+            return jsonify({"error": "API key required"}), 401
+
+        company_id = get_company_from_api_key(api_key)
+
+        return jsonify(ingest_jobs.list_jobs(company_id))
+    except Exception as e:
+        print(f"Error listing ingest jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/embedding-cache/stats', methods=['GET'])
+def embedding_cache_stats():
+    """Live embedding cache metrics (hit rate, evictions, resident bytes, miss latency) + backend dims/throughput"""
+    try:
+        api_key = request.headers.get('X-API-Key')
+        if not api_key:
+            return jsonify({"error": "API key required"}), 401
+
+        try:
+            company_id = get_company_from_api_key(api_key)
+        except ValueError:
+            return jsonify({"error": "Invalid API key"}), 401
+
+        # Only the caller's own embedding backend - not every tenant's
+        service = embedding_service_for(company_id)
+        backend_name = TENANT_EMBEDDING_BACKENDS.get(company_id, EMBEDDING_BACKEND)
+        with service.lock:
+            service_stats = dict(service.stats)
+
+        return jsonify({
+            'cache': service.cache.metrics(),
+            'service': service_stats,
+            'backends': {backend_name: service.backend.info()}
+        })
+    except Exception as e:
+        print(f"Error getting cache stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # STEP 5: START FLASK
 def run_flask():
     app.run(port=PORT, debug=False, use_reloader=False)
@@ -3116,10 +7893,15 @@ print(f"   GET  {ngrok_url}/test")
 print(f"   POST {ngrok_url}/clash-finder")
 print(f"   POST {ngrok_url}/semantic-search")
 print(f"   POST {ngrok_url}/keyword-search")
+print(f"   POST {ngrok_url}/api/v2/hybrid-search")
 print(f"   POST {ngrok_url}/entity-extraction")
 print(f"   POST {ngrok_url}/keyword-search-ai")
 print(f"   POST {ngrok_url}/drama-detection-ai")
 print(f"   DELETE {ngrok_url}/delete-transcript/<id>")
+print(f"   POST {ngrok_url}/upload-transcript")
+print(f"   GET  {ngrok_url}/ingest-jobs/<job_id>")
+print(f"   GET  {ngrok_url}/ingest-jobs")
+print(f"   GET  {ngrok_url}/embedding-cache/stats")
 
 def process_transcript_file_SECURE(file_path, filename, company_id, debug=False):
     """SECURE version that handles both .txt and .docx files"""
@@ -3128,10 +7910,8 @@ def process_transcript_file_SECURE(file_path, filename, company_id, debug=False)
 
     # Check file type
     if filename.endswith('.docx'):
-        # Use python-docx to read Word files
-        import docx
-        doc = docx.Document(file_path)
-        content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+        # Stream paragraph text straight from the Word XML
+        content = '\n'.join(iter_docx_text(file_path))
     else:
         # Regular text files
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -3273,63 +8053,20 @@ else:
     uploaded = files.upload()
     print(f"\n✅ Uploaded {len(uploaded)} files")
 
-    # Process each file
+    # Save every file, then ingest them all in parallel (statements + entities)
+    saved_paths = []
     for filename, content in uploaded.items():
-        print(f"\n📄 Processing: {filename}")
-
-        # Save temporarily
         with open(filename, 'wb') as f:
             f.write(content)
+        saved_paths.append(filename)
 
-        try:
-            # Step 1: Upload to database
-            source_file_result = supabase.table('source_files').insert({
-                'filename': filename,
-                'original_filename': filename,
-                'file_path': filename,
-                'bucket_path': filename,
-                'processing_status': 'processing',
-                'company_id': company_id
-            }).execute()
-
-            source_file_id = source_file_result.data[0]['id']
-            print(f"✅ Uploaded to database with ID: {source_file_id}")
-
-            # Step 2: AUTOMATICALLY PROCESS INTO STATEMENTS
-            print(f"🔄 Auto-processing transcript...")
-            success = process_transcript_file(
-                file_path=filename,
-                filename=filename,
-                company_id=company_id,
-                debug=True
-            )
-
-            if success:
-                print(f"✅ Transcript processed into statements!")
-
-                # Step 3: AUTOMATICALLY EXTRACT ENTITIES
-                print(f"🧠 Auto-extracting entities...")
-                enhance_transcript_with_investigation_ai(
-                    transcript_id=source_file_id,
-                    company_id=company_id,
-                    debug=False
-                )
-                print(f"✅ Entities extracted!")
-
-                # Update status to completed
-                supabase.table('source_files').update({
-                    'processing_status': 'completed'
-                }).eq('id', source_file_id).execute()
-
-            else:
-                print(f"❌ Processing failed for {filename}")
-
-        except Exception as e:
-            print(f"❌ Error: {str(e)}")
-        finally:
-            # Clean up temp file
-            if os.path.exists(filename):
-                os.remove(filename)
+    try:
+        batch_ingest_transcripts(saved_paths, company_id=company_id, debug=False)
+    finally:
+        # Clean up temp files
+        for path in saved_paths:
+            if os.path.exists(path):
+                os.remove(path)
 
     print("\n🎯 UPLOAD + PROCESSING COMPLETE!")
 
@@ -3477,8 +8214,8 @@ unique_companies = set([s['company_id'] for s in all_companies.data if s['compan
 print(f"\nAll companies with statements: {unique_companies}")
 
 # FIX THE PROCESSING FUNCTION
-def process_transcript_file_FIXED(file_path: str, filename: str, company_id: str, debug=False):
-    """FIXED version that properly sets company_id for ALL records"""
+def process_transcript_file_FIXED(file_path: str, filename: str, company_id: str, debug=False, batched=False):
+    """FIXED version that properly sets company_id for ALL records (batched=True uses bulk ingest)"""
 
     if not company_id:
         raise ValueError("company_id is REQUIRED!")
@@ -3501,9 +8238,7 @@ def process_transcript_file_FIXED(file_path: str, filename: str, company_id: str
 
         # Extract text based on file type
         if filename.endswith('.docx'):
-            from docx import Document
-            doc = Document(file_path)
-            txt = '\n'.join([p.text for p in doc.paragraphs if p.text.strip()])
+            txt = '\n'.join(text for text in iter_docx_text(file_path) if text.strip())
         elif filename.endswith('.txt'):
             with open(file_path, 'r', encoding='utf-8') as f:
                 txt = f.read()
@@ -3517,55 +8252,58 @@ def process_transcript_file_FIXED(file_path: str, filename: str, company_id: str
         # Process speakers and statements WITH company_id
         speakers_cache = {}
 
-        for stmt in statements:
-            speaker_name = stmt['speaker']
-            normalized_name = speaker_name.upper().strip()
-
-            # Create/get speaker WITH company_id
-            if speaker_name not in speakers_cache:
-                speaker_result = supabase.table('speakers').select('*')\
-                    .eq('normalized_name', normalized_name)\
-                    .eq('source_file_id', source_file_id)\
-                    .eq('company_id', company_id)\
-                    .execute()
-
-                if speaker_result.data:
-                    speakers_cache[speaker_name] = speaker_result.data[0]['id']
-                else:
-                    new_speaker = supabase.table('speakers').insert({
-                        'name': speaker_name,
-                        'normalized_name': normalized_name,
-                        'source_file_id': source_file_id,
-                        'first_appearance_time': stmt['time_code'],
-                        'company_id': company_id  # CRITICAL
-                    }).execute()
-                    speakers_cache[speaker_name] = new_speaker.data[0]['id']
-
-            # Generate embedding
-            emb = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=stmt['exact_quote']
-            ).data[0].embedding
-
-            # Insert statement WITH company_id
-            supabase.table('statements').insert({
-                'speaker_id': speakers_cache[speaker_name],
-                'exact_quote': stmt['exact_quote'],
-                'time_code': stmt['time_code'],
-                'time_seconds': stmt['time_seconds'],
-                'source_file_id': source_file_id,
-                'context_before': stmt.get('context_before', ''),
-                'context_after': stmt.get('context_after', ''),
-                'embedding': emb,
-                'chunk_index': stmt['line_number'],
-                'company_id': company_id  # CRITICAL - THIS WAS MISSING!
-            }).execute()
+        if batched:
+            ingest_statements_batched(statements, source_file_id, company_id=company_id,
+                                      speakers_cache=speakers_cache, debug=debug)
+        else:
+            for stmt in statements:
+                speaker_name = stmt['speaker']
+                normalized_name = speaker_name.upper().strip()
+
+                # Create/get speaker WITH company_id
+                if speaker_name not in speakers_cache:
+                    speaker_result = supabase.table('speakers').select('*')\
+                        .eq('normalized_name', normalized_name)\
+                        .eq('source_file_id', source_file_id)\
+                        .eq('company_id', company_id)\
+                        .execute()
+
+                    if speaker_result.data:
+                        speakers_cache[speaker_name] = speaker_result.data[0]['id']
+                    else:
+                        new_speaker = supabase.table('speakers').insert({
+                            'name': speaker_name,
+                            'normalized_name': normalized_name,
+                            'source_file_id': source_file_id,
+                            'first_appearance_time': stmt['time_code'],
+                            'company_id': company_id  # CRITICAL
+                        }).execute()
+                        speakers_cache[speaker_name] = new_speaker.data[0]['id']
+
+                # Generate embedding
+                emb = embedding_service_for(company_id).embed_one(stmt['exact_quote'])
+
+                # Insert statement WITH company_id
+                supabase.table('statements').insert({
+                    'speaker_id': speakers_cache[speaker_name],
+                    'exact_quote': stmt['exact_quote'],
+                    'time_code': stmt['time_code'],
+                    'time_seconds': stmt['time_seconds'],
+                    'source_file_id': source_file_id,
+                    'context_before': stmt.get('context_before', ''),
+                    'context_after': stmt.get('context_after', ''),
+                    'embedding': emb,
+                    'chunk_index': stmt['line_number'],
+                    'company_id': company_id,  # CRITICAL - THIS WAS MISSING!
+                    **compact_embedding_columns(emb)
+                }).execute()
 
         # Update status
         supabase.table('source_files').update({
             'processing_status': 'completed',
             'total_chunks': len(statements)
         }).eq('id', source_file_id).execute()
+        ann_refresh_source(company_id, source_file_id)
 
         print(f"✅ SUCCESS! Processed {len(statements)} statements for {company_id}")
 
@@ -3879,7 +8617,6 @@ print("=" * 60)
 
 import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 import threading
 
@@ -3956,6 +8693,8 @@ TRANSCRIPT:
 Return ONLY a valid JSON object with an 'entities' array.""".format(context=context[:6000])  # Increased to 6000 chars
 
     try:
+        openai_request_limiter.acquire()
+        openai_token_limiter.acquire(estimate_tokens([prompt]))
         response = client.chat.completions.create(
             model="gpt-4-turbo",  # KEEPING GPT-4 FOR QUALITY!
             messages=[
@@ -4033,9 +8772,11 @@ def process_transcript_optimized(transcript, transcript_num, total_transcripts,
             normalized_name = entity['name'].upper().strip()
             cache_key = f"{normalized_name}|{entity['entity_type']}"
 
-            # Check cache instead of database
-            if cache_key not in entity_cache:
+            # Check cache instead of database (shared across transcript threads)
+            with progress_lock:
+                is_new = cache_key not in entity_cache
                 entity_cache.add(cache_key)
+            if is_new:
                 entities_to_insert.append({
                     'name': entity['name'],
                     'entity_type': entity['entity_type'],
@@ -4099,10 +8840,12 @@ start_time = time.time()
 total_new_entities = 0
 entity_type_counts = defaultdict(int)
 
-# Process transcripts (can be parallelized in future)
-for idx, transcript in enumerate(transcripts_to_process, 1):
-    new_count = process_transcript_optimized(transcript, idx, len(transcripts_to_process))
-    total_new_entities += new_count
+# Process transcripts in parallel - GPT calls are network bound
+with ThreadPoolExecutor(max_workers=BATCH_IO_THREADS) as executor:
+    futures = [executor.submit(process_transcript_optimized, transcript, idx, len(transcripts_to_process))
+               for idx, transcript in enumerate(transcripts_to_process, 1)]
+    for future in as_completed(futures):
+        total_new_entities += future.result()
 
 # Calculate processing time
 end_time = time.time()
@@ -6530,16 +11273,125 @@ print("  - Preserves all original functionality")
 # Reduces OpenAI API costs by 50-95%!
 # ========================================
 
-import hashlib
 import json
+import os
+import threading
 import time
+import numpy as np
 from datetime import datetime
 
 print("💰 EMBEDDING CACHE SYSTEM - COST SAVER")
 print("="*60)
 
-# Create in-memory cache (for this session)
-embedding_cache = {}
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', '/content/embedding_cache')
+
+class MmapEmbeddingStore:
+    """
+    Persistent embedding cache that behaves like a dict keyed by MD5 hex.
+    Vectors live in one append-only float32 file that is memory-mapped for
+    reads; a second append-only file holds the 16-byte MD5 of each row.
+    Startup only reads the digests (16 bytes per embedding).
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.index_path = os.path.join(path, 'index.md5')
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.lock = threading.RLock()
+        self.rows = {}
+        self.dim = None
+        self._mmap = None
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self.dim = json.load(f)['dim']
+            self._load_index()
+
+    def _load_index(self):
+        with open(self.index_path, 'rb') as f:
+            digests = f.read()
+        row_bytes = self.dim * 4
+        count = min(len(digests) // 16, os.path.getsize(self.vectors_path) // row_bytes)
+
+        # A crash between the two appends leaves a partial tail - drop it
+        for file_path, size in ((self.index_path, count * 16), (self.vectors_path, count * row_bytes)):
+            if os.path.getsize(file_path) != size:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(size)
+
+        self.rows = {digests[i:i + 16].hex(): n for n, i in enumerate(range(0, count * 16, 16))}
+
+    def _matrix(self) -> np.ndarray:
+        """Memory map covering every row written so far (re-mapped after appends)"""
+        if self._mmap is None or len(self._mmap) < len(self.rows):
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self.rows), self.dim))
+        return self._mmap
+
+    def get_vector(self, text_hash: str) -> np.ndarray:
+        """float32 view of one cached embedding (no copy)"""
+        with self.lock:
+            return self._matrix()[self.rows[text_hash]]
+
+    def __getitem__(self, text_hash: str) -> List[float]:
+        return self.get_vector(text_hash).tolist()
+
+    def get(self, text_hash: str, default=None):
+        return self[text_hash] if text_hash in self.rows else default
+
+    def __contains__(self, text_hash) -> bool:
+        return text_hash in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def keys(self):
+        return self.rows.keys()
+
+    def items(self):
+        for text_hash in list(self.rows):
+            yield text_hash, self[text_hash]
+
+    def __setitem__(self, text_hash: str, embedding):
+        self.update([(text_hash, embedding)])
+
+    def update(self, items):
+        """Append new embeddings - hashes already stored are left untouched"""
+        if hasattr(items, 'items'):
+            items = items.items()
+
+        with self.lock:
+            new = {}
+            for text_hash, embedding in items:
+                if text_hash not in self.rows and text_hash not in new:
+                    new[text_hash] = embedding
+            if not new:
+                return
+
+            matrix = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.meta_path, 'w') as f:
+                    json.dump({'dim': self.dim, 'dtype': 'float32'}, f)
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {matrix.shape[1]} dims, cache holds {self.dim}")
+
+            # Vectors first, digests second - the index never points past the data
+            with open(self.vectors_path, 'ab') as f:
+                f.write(matrix.tobytes())
+            with open(self.index_path, 'ab') as f:
+                f.write(b''.join(bytes.fromhex(text_hash) for text_hash in new))
+
+            for text_hash in new:
+                self.rows[text_hash] = len(self.rows)
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.vectors_path, self.index_path) if os.path.exists(p))
+
+# Persistent cache (survives restarts when EMBEDDING_CACHE_DIR is on Drive)
+embedding_cache = MmapEmbeddingStore(EMBEDDING_CACHE_DIR)
+embedding_service.cache.backing = embedding_cache   # Bounded memory tier in front of the persistent cache
 cache_stats = {
     'hits': 0,
     'misses': 0,
@@ -6582,21 +11434,40 @@ def get_cached_embedding(text, debug=False):
 
         # Call OpenAI
         start_time = time.time()
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        embedding = response.data[0].embedding
+        embedding = embedding_service.embed_one(text)
         api_time = time.time() - start_time
 
-        # Store in cache
-        embedding_cache[text_hash] = embedding
-
         if debug:
             print(f"✅ Cached! API took {api_time:.2f}s")
 
+        # The service stores misses in embedding_cache and returns the stored (float32)
+        # copy, so hits and misses give identical vectors
         return embedding
 
+def get_cached_embeddings_batched(texts, debug=False):
+    """
+    Batch version of get_cached_embedding - cache hits are free,
+    all misses go to OpenAI in multi-input requests
+    """
+    # Each distinct text counts once - the service embeds a quote repeated in
+    # the batch a single time, so the repeats are neither hits nor API calls
+    unique_hashes = set(get_text_hash(text) for text in texts)
+    misses = sum(1 for text_hash in unique_hashes if text_hash not in embedding_cache)
+    hits = len(unique_hashes) - misses
+
+    cache_stats['hits'] += hits
+    cache_stats['misses'] += misses
+    cache_stats['money_saved'] += hits * 0.00002
+    cache_stats['time_saved'] += hits * 0.5
+
+    if misses and debug:
+        print(f"📡 {misses} cache misses - calling OpenAI in batches...")
+
+    # The service serves hits from its own cache tiers and dedupes misses; use the
+    # vectors it returns rather than re-reading embedding_cache, which isn't the
+    # backing store for every backend (and may not hold a memory-tier hit)
+    return embed_texts_batched(texts)
+
 def print_cache_stats():
     """Show how much money and time we've saved"""
     total_calls = cache_stats['hits'] + cache_stats['misses']
@@ -6610,12 +11481,22 @@ def print_cache_stats():
     print(f"Money saved: ${cache_stats['money_saved']:.4f}")
     print(f"Time saved: {cache_stats['time_saved']:.1f} seconds")
     print(f"Cache size: {len(embedding_cache)} embeddings")
+    if isinstance(embedding_cache, MmapEmbeddingStore):
+        print(f"Cache on disk: {embedding_cache.disk_bytes() / 1e6:.1f} MB ({embedding_cache.path})")
+
+    live = embedding_service.cache.metrics()
+    latency = live['miss_latency_ms']
+    print(f"\n🧠 In-memory tier ({live['policy'].upper()}): {live['entries']} embeddings, "
+          f"{live['resident_bytes'] / 1e6:.1f} / {live['max_bytes'] / 1e6:.0f} MB")
+    print(f"Live hit rate: {live['hit_rate'] * 100:.1f}% ({live['hits']} memory, {live['backing_hits']} disk, {live['misses']} miss)")
+    print(f"Evictions: {live['evictions']}")
+    print(f"Miss latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
 
 # ========================================
 # ENHANCED PROCESS FUNCTION WITH CACHING
 # ========================================
 
-def process_transcript_file_with_cache(file_path: str, filename: str = None, debug=False):
+def process_transcript_file_with_cache(file_path: str, filename: str = None, debug=False, batched=False):
     """
     ENHANCED version of process_transcript_file that uses caching
     This is 50-95% cheaper on re-runs!
@@ -6658,45 +11539,52 @@ def process_transcript_file_with_cache(file_path: str, filename: str = None, deb
         speakers_cache = {}
         cache_hits_this_run = 0
 
-        for stmt in statements:
-            speaker_name = stmt['speaker']
-            normalized_name = speaker_name.upper().strip()
+        if batched:
+            cache_hits_before = cache_stats['hits']
+            ingest_statements_batched(statements, source_file_id, speakers_cache=speakers_cache,
+                                      embed_fn=get_cached_embeddings_batched, debug=debug)
+            cache_hits_this_run = cache_stats['hits'] - cache_hits_before
+        else:
+            for stmt in statements:
+                speaker_name = stmt['speaker']
+                normalized_name = speaker_name.upper().strip()
 
-            if speaker_name not in speakers_cache:
-                speaker_result = supabase.table('speakers').select('*')\
-                    .eq('normalized_name', normalized_name)\
-                    .eq('source_file_id', source_file_id).execute()
+                if speaker_name not in speakers_cache:
+                    speaker_result = supabase.table('speakers').select('*')\
+                        .eq('normalized_name', normalized_name)\
+                        .eq('source_file_id', source_file_id).execute()
 
-                if speaker_result.data:
-                    speakers_cache[speaker_name] = speaker_result.data[0]['id']
-                else:
-                    new_speaker = supabase.table('speakers').insert({
-                        'name': speaker_name,
-                        'normalized_name': normalized_name,
-                        'source_file_id': source_file_id,
-                        'first_appearance_time': stmt['time_code']
-                    }).execute()
-                    speakers_cache[speaker_name] = new_speaker.data[0]['id']
-
-            # 🎯 USE CACHED EMBEDDING FUNCTION!
-            emb = get_cached_embedding(stmt['exact_quote'])
-
-            # Track cache performance
-            if get_text_hash(stmt['exact_quote']) in embedding_cache:
-                cache_hits_this_run += 1
-
-            # Insert statement
-            supabase.table('statements').insert({
-                'speaker_id': speakers_cache[speaker_name],
-                'exact_quote': stmt['exact_quote'],
-                'time_code': stmt['time_code'],
-                'time_seconds': stmt['time_seconds'],
-                'source_file_id': source_file_id,
-                'context_before': stmt.get('context_before', ''),
-                'context_after': stmt.get('context_after', ''),
-                'embedding': emb,
-                'chunk_index': stmt['line_number']
-            }).execute()
+                    if speaker_result.data:
+                        speakers_cache[speaker_name] = speaker_result.data[0]['id']
+                    else:
+                        new_speaker = supabase.table('speakers').insert({
+                            'name': speaker_name,
+                            'normalized_name': normalized_name,
+                            'source_file_id': source_file_id,
+                            'first_appearance_time': stmt['time_code']
+                        }).execute()
+                        speakers_cache[speaker_name] = new_speaker.data[0]['id']
+
+                # 🎯 USE CACHED EMBEDDING FUNCTION!
+                emb = get_cached_embedding(stmt['exact_quote'])
+
+                # Track cache performance
+                if get_text_hash(stmt['exact_quote']) in embedding_cache:
+                    cache_hits_this_run += 1
+
+                # Insert statement
+                supabase.table('statements').insert({
+                    'speaker_id': speakers_cache[speaker_name],
+                    'exact_quote': stmt['exact_quote'],
+                    'time_code': stmt['time_code'],
+                    'time_seconds': stmt['time_seconds'],
+                    'source_file_id': source_file_id,
+                    'context_before': stmt.get('context_before', ''),
+                    'context_after': stmt.get('context_after', ''),
+                    'embedding': emb,
+                    'chunk_index': stmt['line_number'],
+                    **compact_embedding_columns(emb)
+                }).execute()
 
         # Update status
         supabase.table('source_files').update({
@@ -6721,95 +11609,36 @@ def semantic_search_smart(query: str, company_id: str = None, transcript_id: str
         raise ValueError("company_id required for data isolation")
 
     # Extract topic from questions
-    original_query = query
-    query_lower = query.lower().replace("'", "").replace("'", "").replace("'", "")
-
-    if any(pattern in query_lower for pattern in [
-        'what is said about', 'what does', 'what did', 'who said',
-        'tell me about', 'find mentions of', 'find me all', 'search for'
-    ]):
-        import re
-        match = re.search(r'(?:what is said about|tell me about|mentions of|find me all|search for)\s+(.+?)(?:\?|$)', query_lower)
-        if match:
-            query = match.group(1).strip()
-        else:
-            query = re.sub(r'\b(?:what|who|where|when|why|how|is|are|was|were|said|says|about|regarding|concerning|did|does|do|tell|me|find|search|looking|for|all|mentions|of)\b', '', query_lower, flags=re.IGNORECASE)
-            query = query.strip('?., ').strip()
-
-        if not query or len(query) < 2:
-            query = original_query
-
-        if debug:
-            print(f"📝 Extracted: '{query}' from: '{original_query}'")
+    query = extract_query_topic(query, debug=debug)
 
     if debug: print(f"🧠 SMART SEMANTIC SEARCH: '{query}'")
 
     try:
-        # Create embedding
-        query_embedding = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=query
-        ).data[0].embedding
-
-        # Get vector similarity results from RPC
-        vector_results = supabase.rpc('match_statements', {
-            'query_embedding': query_embedding,
-            'match_threshold': 0.2,
-            'match_count': 100,
-            'company_id_filter': company_id,
-            'transcript_id_filter': transcript_id if transcript_id else None
-        }).execute()
+        # Memory -> cached_embeddings -> OpenAI
+        query_embedding = get_query_embedding(query, company_id=company_id, debug=debug)
 
-        if debug:
-            print(f"📊 RPC returned {len(vector_results.data)} vector matches")
+        # Matches + display fields in one step (ANN + metadata cache, or one projected RPC)
+        matched_statements = match_statements_with_metadata(query_embedding, company_id, transcript_id,
+                                                            k=100, threshold=0.2, debug=debug)
 
-        if not vector_results.data:
+        if not matched_statements:
             if debug: print("⚠️ No vector matches found")
             return []
 
-        # ✅ Fetch full statement details WITH speaker and source joins
-        statement_ids = [r['id'] for r in vector_results.data]
-
-        if debug:
-            print(f"🔍 Fetching full details for {len(statement_ids)} statements...")
-
-        # Fetch statements with proper joins
-        full_statements = supabase.table('statements')\
-            .select('*, speakers(id, name, normalized_name), source_files(id, filename)')\
-            .in_('id', statement_ids)\
-            .eq('company_id', company_id)\
-            .execute()
-
-        if debug:
-            print(f"✅ Fetched {len(full_statements.data)} statements with joins")
-            if full_statements.data:
-                first = full_statements.data[0]
-                print(f"   Sample - Speaker: {first.get('speakers', {}).get('name', 'N/A')}, Source: {first.get('source_files', {}).get('filename', 'N/A')}")
-
-        # Create lookup map
-        statement_map = {stmt['id']: stmt for stmt in full_statements.data}
+        # Filter with scoring logic (all matches scored in one pass)
+        ranker = BatchReranker([stmt['exact_quote'] for stmt in matched_statements])
+        semantic_scores = ranker.semantic(query).tolist()
+        contextual_scores = ranker.contextual(query).tolist()
 
-        # Filter with scoring logic
         relevant_results = []
-        for vector_result in vector_results.data:
-            stmt_id = vector_result['id']
-
-            # Get full statement with joins
-            full_stmt = statement_map.get(stmt_id)
-            if not full_stmt:
-                if debug: print(f"⚠️ Warning: Statement {stmt_id} not found")
-                continue
-
-            # Scoring
-            semantic_score = calculate_semantic_relevance_smart(full_stmt['exact_quote'], query)
-            contextual_score = calculate_contextual_relevance_smart(full_stmt['exact_quote'], query)
+        for full_stmt, semantic_score, contextual_score in zip(matched_statements, semantic_scores, contextual_scores):
             combined_score = (semantic_score + contextual_score) / 2
 
             # Normalize quote
             normalized_quote = full_stmt['exact_quote'].lower().replace("'", "").replace("'", "").replace("'", "")
 
             # Filter
-            similarity = vector_result.get('similarity', 0)
+            similarity = full_stmt.get('similarity', 0)
             if similarity > 0.2 or combined_score >= 5.0 or any(word in normalized_quote for word in query.split()):
                 relevant_results.append({
                     **full_stmt,
@@ -6857,22 +11686,28 @@ def semantic_search_smart_cached(query: str, company_id: str = None, transcript_
         # USE CACHED EMBEDDING!
         query_embedding = get_cached_embedding(query)
 
-        search_query = supabase.table('statements')\
-            .select('*, speakers(name), source_files(filename)')\
-            .eq('company_id', company_id)\
-            .order('embedding', desc=False)
+        if ANN_INDEX_ENABLED:
+            # Score the nearest 200 instead of pulling the whole statements table
+            matches = ann_vector_matches(query_embedding, company_id, k=200, transcript_id=transcript_id)
+            candidates = fetch_ranked_statements(matches, company_id)
+        else:
+            search_query = supabase.table('statements')\
+                .select('*, speakers(name), source_files(filename)')\
+                .eq('company_id', company_id)\
+                .order('embedding', desc=False)
 
-        if transcript_id:
-            search_query = search_query.eq('source_file_id', transcript_id)
+            if transcript_id:
+                search_query = search_query.eq('source_file_id', transcript_id)
 
-        results = search_query.execute()
+            candidates = search_query.execute().data
 
         # Apply smart filtering with keyword check
-        relevant_results = []
-        for stmt in results.data:
-            semantic_score = calculate_semantic_relevance_smart(stmt['exact_quote'], query)
-            contextual_score = calculate_contextual_relevance_smart(stmt['exact_quote'], query)
+        ranker = BatchReranker([stmt['exact_quote'] for stmt in candidates])
+        semantic_scores = ranker.semantic(query).tolist()
+        contextual_scores = ranker.contextual(query).tolist()
 
+        relevant_results = []
+        for stmt, semantic_score, contextual_score in zip(candidates, semantic_scores, contextual_scores):
             combined_score = (semantic_score + contextual_score) / 2
 
             if combined_score >= 7.5:
@@ -6901,30 +11736,36 @@ def semantic_search_smart_cached(query: str, company_id: str = None, transcript_
 # ========================================
 
 def save_cache_to_file():
-    """Save cache to disk for reuse in next session"""
-    cache_data = {
-        'embeddings': embedding_cache,
-        'stats': cache_stats,
-        'saved_date': datetime.now().isoformat()
-    }
-
-    filename = f'embedding_cache_{datetime.now().strftime("%Y%m%d")}.json'
+    """Save cache stats for reuse in next session (embeddings are written as they are cached)"""
+    filename = os.path.join(embedding_cache.path, 'stats.json')
     with open(filename, 'w') as f:
-        json.dump(cache_data, f)
+        json.dump({'stats': cache_stats, 'saved_date': datetime.now().isoformat()}, f)
 
-    print(f"💾 Cache saved to: {filename}")
-    return filename
+    print(f"💾 Cache saved to: {embedding_cache.path}")
+    return embedding_cache.path
 
 def load_cache_from_file(filename):
-    """Load cache from previous session"""
+    """
+    Load cache from previous session: a cache directory, or an old
+    embedding_cache_*.json file (migrated into the binary cache)
+    """
     global embedding_cache, cache_stats
 
     try:
-        with open(filename, 'r') as f:
-            cache_data = json.load(f)
+        if os.path.isdir(filename):
+            embedding_cache = MmapEmbeddingStore(filename)
+            embedding_service.cache.backing = embedding_cache
+            stats_path = os.path.join(filename, 'stats.json')
+            if os.path.exists(stats_path):
+                with open(stats_path, 'r') as f:
+                    cache_stats = json.load(f)['stats']
+        else:
+            with open(filename, 'r') as f:
+                cache_data = json.load(f)
 
-        embedding_cache = cache_data['embeddings']
-        cache_stats = cache_data['stats']
+            embedding_cache.update(cache_data['embeddings'])
+            cache_stats = cache_data['stats']
+            print(f"📦 Migrated {len(cache_data['embeddings'])} JSON embeddings into {embedding_cache.path}")
 
         print(f"✅ Loaded cache with {len(embedding_cache)} embeddings")
         print(f"💰 Previous savings: ${cache_stats['money_saved']:.4f}")